@@ -0,0 +1,83 @@
+from gpiozero.pins.mock import MockFactory, MockPWMPin
+from robotArmControl import RobotArmControl, Pins, motorTypesList
+from controlServer import ControlServer
+from controlClient import ControlClient
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+async def runClient(client, commands, window, latencies):
+    """Send drive / stop commands, keeping up to window requests in flight, and record each acknowledgement latency"""
+    inFlight = asyncio.Semaphore(window)
+
+    def done(future, startTime):
+        latencies.append(time.perf_counter() - startTime)
+        inFlight.release()
+
+    for commandNumber in range(commands):
+        await inFlight.acquire()
+        joint = motorTypesList[commandNumber % len(motorTypesList)]
+        future = client.drive(joint, "extend") if commandNumber % 2 == 0 else client.stop(joint)
+        future.add_done_callback(lambda future, startTime=time.perf_counter(): done(future, startTime))
+        if commandNumber % window == 0:
+            await client.drain()
+    await client.drain()
+    for _ in range(window):
+        await inFlight.acquire()
+
+async def runBenchmark(clients, commands, window, useUnix):
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.WARNING)
+
+    arm = RobotArmControl(Pins.allEnabled(), 1, 1, logger, pinFactory=MockFactory(pin_class=MockPWMPin))
+    arm.createGPIODevices()
+
+    unixPath = os.path.join(tempfile.mkdtemp(), "robotArm.sock") if useUnix else None
+    server = await ControlServer(arm, logger).start("127.0.0.1", None if useUnix else 0, unixPath)
+    address = server.addresses()[0]
+
+    connected = []
+    for _ in range(clients):
+        client = ControlClient()
+        connected.append(await (client.connectUnix(unixPath) if useUnix else client.connect(*address)))
+
+    latencies = []
+    startTime = time.perf_counter()
+    await asyncio.gather(*(runClient(client, commands, window, latencies) for client in connected))
+    elapsed = time.perf_counter() - startTime
+
+    for client in connected:
+        await client.close()
+    await server.close()
+    arm.stopExecutor()
+
+    latencies.sort()
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1e6
+    return {
+        "transport": "unix" if useUnix else "tcp",
+        "clients": clients,
+        "window": window,
+        "commands": len(latencies),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "unit": "microseconds",
+        "p50": percentile(0.5),
+        "p90": percentile(0.9),
+        "p99": percentile(0.99),
+        "max": latencies[-1] * 1e6,
+        "queueLatency": arm.commandLatencyStats(),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and latency of the control server on localhost, using gpiozero's mock pins")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--commands", type=int, default=5000, help="commands sent by each client")
+    parser.add_argument("--window", type=int, default=32, help="requests each client keeps in flight; 1 disables pipelining")
+    parser.add_argument("--unix", action="store_true", help="connect over a Unix socket rather than TCP")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(runBenchmark(args.clients, args.commands, args.window, args.unix)), indent=2))
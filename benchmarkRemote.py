@@ -0,0 +1,106 @@
+from benchmarkRobotArmControl import summarise, timeCalls
+from pigpioStandIn import PigpioStandIn
+from robotArmControl import RobotArmControl, Pins
+import argparse
+import json
+import logging
+import os
+import platform
+import time
+
+def createRemoteArm(logger, port):
+    """Create a RobotArmControl object in remote mode with all five motors and the LED enabled, connected to a stand-in
+    pigpio daemon on this machine"""
+    # gpiozero's pigpio factory reads the daemon's port from the environment
+    os.environ["PIGPIO_PORT"] = str(port)
+    return RobotArmControl(Pins.allEnabled(), 1, 1, logger, remote=True, remoteIP="127.0.0.1")
+
+def timeRemoteCalls(standIn, function, iterations, setup=None):
+    """Time calls with timeCalls(), adding the pigpio commands each call sent, which is its number of network round trips"""
+    commandCounts = []
+    def countedCall(i):
+        commands = standIn.stats["commands"]
+        function(i)
+        commandCounts.append(standIn.stats["commands"] - commands)
+    result = timeCalls(countedCall, iterations, setup)
+    result["roundTrips"] = sum(commandCounts) / len(commandCounts)
+    return result
+
+def timeReconnect(arm, standIn, attempts, timeout=10.0):
+    """Restart the stand-in daemon while a motor is running and time how long the arm takes to drive it again
+
+    Commands go through the executor, as they do from the GUI, so they wait behind the resync after each reconnect."""
+    samples = []
+    # Probe often and retry quickly, so this measures recovery rather than the default two second probe interval and
+    # half second backoff. The probe thread only picks up the new interval after its current wait, so the first restart
+    # is not timed
+    arm.connectionManager.probeInterval = 0.005
+    arm.connectionManager.minBackoff = 0.005
+    arm.startExecutor()
+    for attempt in range(attempts + 1):
+        arm.submit("driveMotor", "rotate", "extend").result()
+        startTime = time.perf_counter()
+        standIn.restart()
+        # The restart switches the motor's pins off, so they only come back on once resyncOutputs() has run
+        while time.perf_counter() - startTime < timeout:
+            if standIn.pinValue(2) == 1.0:
+                if attempt > 0:
+                    samples.append(time.perf_counter() - startTime)
+                break
+            time.sleep(0.0005)
+        arm.submit("stopMotor", "rotate").result()
+    arm.stopExecutor()
+    return summarise(samples, sum(samples)) if samples else {"calls": 0}
+
+def runBenchmarks(iterations, deviceIterations, reconnects, latency, jitter, stallProbability, stallTime):
+    """Run every benchmark against a stand-in daemon with the given network faults, returning the results keyed by name"""
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.ERROR)
+    standIn = PigpioStandIn(logger, latency=latency, jitter=jitter, stallProbability=stallProbability, stallTime=stallTime, seed=1).start()
+    arm = createRemoteArm(logger, standIn.port)
+    motorTypes = ["rotate", "shoulder", "elbow", "wrist", "claw"]
+    directions = ["extend", "retract"]
+
+    results = {}
+    try:
+        results["createGPIODevices"] = timeRemoteCalls(standIn, lambda i: arm.createGPIODevices(force=True), deviceIterations)
+        results["driveMotor"] = timeRemoteCalls(standIn, lambda i: arm.driveMotor(motorTypes[i % 5], directions[i % 2]), iterations)
+        results["stopMotor"] = timeRemoteCalls(standIn, lambda i: arm.stopMotor(motorTypes[i % 5]), iterations, setup=lambda i: arm.driveMotor(motorTypes[i % 5], "extend"))
+        results["driveMotorRepeated"] = timeRemoteCalls(standIn, lambda i: arm.driveMotor(motorTypes[i % 5], "extend"), iterations)
+        results["driveMotors"] = timeRemoteCalls(standIn, lambda i: arm.driveMotors({motorType: directions[i % 2] for motorType in motorTypes}), iterations // 5)
+        results["stopMotors"] = timeRemoteCalls(standIn, lambda i: arm.stopMotors(), iterations // 5, setup=lambda i: arm.driveMotors({motorType: "extend" for motorType in motorTypes}))
+
+        def setBrightness(i):
+            arm.ledBrightness = (i % 256) / 255
+            arm.controlLedBrightness()
+        results["controlLedBrightness"] = timeRemoteCalls(standIn, setBrightness, iterations)
+
+        if reconnects:
+            results["reconnect"] = timeReconnect(arm, standIn, reconnects)
+    finally:
+        arm.closeAllGPIO()
+        standIn.stop()
+    results["standIn"] = dict(standIn.stats)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for RobotArmControl in remote mode, against a stand-in pigpio daemon with injected network faults")
+    parser.add_argument("--iterations", type=int, default=1000, help="calls timed for each drive / stop / LED benchmark")
+    parser.add_argument("--device-iterations", type=int, default=20, help="calls timed for the device creation benchmark")
+    parser.add_argument("--reconnects", type=int, default=5, help="number of dropped connections to time recovery from")
+    parser.add_argument("--latency", type=float, default=0.0, help="milliseconds the stand-in adds to every reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra milliseconds added to each reply")
+    parser.add_argument("--stall-probability", type=float, default=0.0, help="fraction of replies that stall")
+    parser.add_argument("--stall-time", type=float, default=50.0, help="milliseconds a stalled reply is held for")
+    parser.add_argument("--output", help="write the JSON results to this file as well as stdout")
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.iterations, args.device_iterations, args.reconnects, args.latency / 1000, args.jitter / 1000, args.stall_probability, args.stall_time / 1000)
+    network = {"latency": args.latency, "jitter": args.jitter, "stallProbability": args.stall_probability, "stallTime": args.stall_time}
+    report = {"python": platform.python_version(), "machine": platform.machine(), "unit": "microseconds", "network": network, "results": results}
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            outputFile.write(output)
+    print(output)
@@ -0,0 +1,136 @@
+from gpiozero.pins.mock import MockFactory, MockPWMPin
+from robotArmControl import RobotArmControl, Pins
+from jointRegistry import FORWARD, BACKWARD
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+
+def createArm(logger):
+    """Create a RobotArmControl object with all five motors and the LED enabled on mock pins"""
+    arm = RobotArmControl(Pins.allEnabled(), 1, 1, logger, pinFactory=MockFactory(pin_class=MockPWMPin))
+    arm.createGPIODevices()
+    return arm
+
+class NullMotor():
+    """Motor that does nothing, used to time the control library's own per-call overhead without gpiozero's"""
+    def forward(self, speed=1):
+        pass
+
+    def backward(self, speed=1):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+def summarise(samples, totalTime):
+    """Turn a list of per-call times, in seconds, into percentiles in microseconds plus throughput"""
+    ordered = sorted(samples)
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1e6
+    return {
+        "calls": len(ordered),
+        "mean": sum(ordered) / len(ordered) * 1e6,
+        "p50": percentile(0.5),
+        "p90": percentile(0.9),
+        "p99": percentile(0.99),
+        "max": ordered[-1] * 1e6,
+        "throughput": len(ordered) / totalTime,
+    }
+
+def timeCalls(function, iterations, setup=None):
+    """Call a function repeatedly, timing each call. The optional setup function is run untimed before each call"""
+    samples = []
+    totalTime = 0.0
+    for i in range(iterations):
+        if setup != None:
+            setup(i)
+        start = time.perf_counter()
+        function(i)
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed)
+        totalTime += elapsed
+    return summarise(samples, totalTime)
+
+def runBenchmarks(iterations, deviceIterations):
+    """Run every benchmark and return the results keyed by benchmark name"""
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.WARNING)
+    arm = createArm(logger)
+    motorTypes = ["rotate", "shoulder", "elbow", "wrist", "claw"]
+    directions = ["extend", "retract"]
+
+    results = {}
+    results["driveMotor"] = timeCalls(lambda i: arm.driveMotor(motorTypes[i % 5], directions[i % 2]), iterations)
+    results["stopMotor"] = timeCalls(lambda i: arm.stopMotor(motorTypes[i % 5]), iterations, setup=lambda i: arm.driveMotor(motorTypes[i % 5], "extend"))
+
+    def setBrightness(i):
+        arm.ledBrightness = (i % 256) / 255
+        arm.controlLedBrightness()
+    results["controlLedBrightness"] = timeCalls(setBrightness, iterations)
+
+    # The same commands with devices that do nothing, by name and by joint ID, to show the per-call overhead of dispatch
+    for motorType in motorTypes:
+        arm.closeGPIO(motorType)
+        arm.bindDevice(motorType, NullMotor())
+    jointIds = [arm.jointId(motorType) for motorType in motorTypes]
+    jointDirections = [FORWARD, BACKWARD]
+    results["driveMotorDispatch"] = timeCalls(lambda i: arm.driveMotor(motorTypes[i % 5], directions[i % 2]), iterations)
+    results["driveJointDispatch"] = timeCalls(lambda i: arm.driveJoint(jointIds[i % 5], jointDirections[i % 2]), iterations)
+    results["stopMotorDispatch"] = timeCalls(lambda i: arm.stopMotor(motorTypes[i % 5]), iterations, setup=lambda i: arm.driveMotor(motorTypes[i % 5], "extend"))
+    results["stopJointDispatch"] = timeCalls(lambda i: arm.stopJoint(jointIds[i % 5]), iterations, setup=lambda i: arm.driveJoint(jointIds[i % 5], FORWARD))
+
+    # Repeats of a command the motor is already following, as sent by keyboard auto-repeat, which the shadow state skips
+    results["driveMotorRepeated"] = timeCalls(lambda i: arm.driveMotor(motorTypes[i % 5], "extend"), iterations)
+
+    results["createGPIODevices"] = timeCalls(lambda i: arm.createGPIODevices(force=True), deviceIterations)
+    results["createGPIODevicesUnchanged"] = timeCalls(lambda i: arm.createGPIODevices(), deviceIterations)
+    results["closeAllGPIO"] = timeCalls(lambda i: arm.closeAllGPIO(), deviceIterations, setup=lambda i: arm.createGPIODevices())
+    return results
+
+def compareResults(results, baseline, threshold):
+    """Compare each benchmark's p50 and p99 against a baseline, returning a list of regressions beyond the threshold"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for statistic in ["p50", "p99"]:
+            change = result[statistic] / baseline[name][statistic] - 1
+            result[f"{statistic}Change"] = change
+            if change > threshold:
+                regressions.append(f"{name} {statistic} {baseline[name][statistic]:.2f} us -> {result[statistic]:.2f} us ({change:+.1%})")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the RobotArmControl hot paths, using gpiozero's mock pins")
+    parser.add_argument("--iterations", type=int, default=5000, help="calls timed for each drive / stop / LED benchmark")
+    parser.add_argument("--device-iterations", type=int, default=200, help="calls timed for the device creation / close benchmarks")
+    parser.add_argument("--output", help="write the JSON results to this file as well as stdout")
+    parser.add_argument("--baseline", help="JSON results from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="fractional slowdown of p50 / p99 reported as a regression")
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.iterations, args.device_iterations)
+    report = {"python": platform.python_version(), "machine": platform.machine(), "unit": "microseconds", "results": results}
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            regressions = compareResults(results, json.load(baselineFile)["results"], args.threshold)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            outputFile.write(output)
+    print(output)
+
+    # A non-zero exit code lets a regression fail a CI job
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
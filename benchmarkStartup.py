@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Off a Raspberry Pi no devices would be created and gpiozero never imported, so every mode is made to believe it is on a
+# Pi, with gpiozero's default pin factory set to mock PWM pins and a profile with every output enabled. Each mode then
+# pays for importing gpiozero and creating its devices, as it would on the arm
+profileName = "benchmark"
+mockEnvironment = {"GPIOZERO_PIN_FACTORY": "mock", "GPIOZERO_MOCK_PIN_CLASS": "mockpwmpin"}
+onPi = "import robotArmControl\nrobotArmControl.isRaspberryPi = lambda: True\n"
+
+def runScript(path, *args):
+    """Return the arguments that run a script as __main__ after the Raspberry Pi check has been forced"""
+    return [sys.executable, "-c", onPi + f"import runpy, sys\nsys.argv = {[path, *args]!r}\nrunpy.run_path({path!r}, run_name='__main__')"]
+
+def writeProfiles(path):
+    """Write a profiles file holding a profile that enables every output, applied on start, with its own pins"""
+    from pinProfiles import PinProfile, saveProfile
+    from robotArmControl import Pins
+    saveProfile(PinProfile(profileName, Pins.allEnabled(), autoApply=True), path)
+
+# Each mode starts a fresh interpreter and finishes once its first command has completed. {profiles} is replaced with
+# the path of the profiles file
+modes = {
+    # The command line client, quitting straight after its first drive command
+    "cli": {"args": runScript(os.path.join(here, "commandLineClient.py"), "--profile", profileName, "--profiles", "{profiles}"), "input": b"b\nq\n"},
+    # The Qt windows, created offscreen, with the first command sent through the executor as a button press would
+    "gui": {"args": [sys.executable, "-c", onPi + """
+import logging
+import pyQtControl
+from robotArmControl import RobotArmControl, Pins
+from pinProfiles import loadProfile
+from PyQt6.QtWidgets import QApplication
+app = QApplication([])
+logger = logging.getLogger()
+pins = Pins()
+robotArmControl = RobotArmControl(pins, 1, 1, logger)
+loadProfile("benchmark", "{profiles}").applyTo(pins, robotArmControl)
+robotArmControl.startExecutor()
+configWindow = pyQtControl.ConfigWindow(pins, logger, robotArmControl)
+mainWindow = pyQtControl.MainWindow(configWindow, pins, logger, robotArmControl)
+robotArmControl.submit("createGPIODevices").result()
+robotArmControl.submit("driveMotor", "claw", "extend").result()
+"""], "env": {"QT_QPA_PLATFORM": "offscreen"}},
+    # The Qt application as launched with a profile applied on start, exiting as soon as the main window has first painted
+    "paint": {"args": [sys.executable, "-c", onPi + """
+import pyQtControl
+from PyQt6.QtCore import QObject, QEvent, QTimer
+from PyQt6.QtWidgets import QApplication
+
+class FirstPaint(QObject):
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Type.Paint and isinstance(watched, pyQtControl.MainWindow):
+            QTimer.singleShot(0, QApplication.quit)
+        return False
+
+# CustomQApplication builds its windows and runs the event loop from its constructor, so watch paints from before it exists
+def exec(self):
+    self.installEventFilter(firstPaint)
+    return QApplication.exec()
+
+firstPaint = FirstPaint()
+pyQtControl.CustomQApplication.exec = exec
+pyQtControl.CustomQApplication([], "benchmark", "{profiles}")
+"""], "env": {"QT_QPA_PLATFORM": "offscreen"}},
+    # The headless entry point, which never imports Qt
+    "headless": {"args": runScript(os.path.join(here, "headlessControl.py"), "--profile", profileName, "--profiles", "{profiles}", "--move", "claw=extend")},
+}
+
+def timeMode(mode, profilesPath):
+    """Return the wall-clock time, in milliseconds, from starting the process until it exits after its first command"""
+    settings = modes[mode]
+    environment = dict(os.environ, **mockEnvironment, **settings.get("env", {}))
+    processArgs = [arg.replace("{profiles}", profilesPath) for arg in settings["args"]]
+    startTime = time.perf_counter()
+    subprocess.run(processArgs, input=settings.get("input", b""), cwd=here, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - startTime) * 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time to first command for each entry point, each run in a fresh process")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--modes", nargs="+", default=list(modes), choices=list(modes))
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        profilesPath = os.path.join(directory, "profiles.ini")
+        writeProfiles(profilesPath)
+        for mode in args.modes:
+            samples = sorted(timeMode(mode, profilesPath) for _ in range(args.runs))
+            results[mode] = {"runs": len(samples), "min": samples[0], "p50": samples[len(samples) // 2], "max": samples[-1]}
+    print(json.dumps({"unit": "milliseconds", "results": results}, indent=2))
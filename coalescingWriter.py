@@ -0,0 +1,77 @@
+import threading
+import time
+
+class CoalescingWriter():
+    """Class used to turn a fast stream of values into rate-limited writes, keeping only the newest value per output"""
+    def __init__(self, writeFunction, logger, maxRate=20, name="CoalescingWriter"):
+        self.writeFunction = writeFunction
+        self.logger = logger
+        self.minInterval = 1 / maxRate
+
+        # Newest value waiting to be written for each output, and the time of the last flush
+        self.pending = {}
+        self.lastFlush = 0.0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+
+        # Held by a flush from taking the pending values until they are written, so when flush() is called while the
+        # writer thread is flushing, an older value can never be written after a newer one. set() only takes self.lock,
+        # so callers never wait on a write
+        self.writeLock = threading.Lock()
+
+        # Counters used to see how much traffic has been saved
+        self.valuesReceived = 0
+        self.writesIssued = 0
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def set(self, output, value):
+        """Record a new value for an output. Older values that have not been written yet are dropped"""
+        with self.lock:
+            self.pending[output] = value
+            self.valuesReceived += 1
+        self.wake.set()
+
+    def discard(self, output):
+        """Drop any value waiting to be written for an output"""
+        with self.lock:
+            self.pending.pop(output, None)
+
+    def run(self):
+        """Writer loop. The first value after a quiet period is written straight away, later ones at most maxRate times a second"""
+        while self.running:
+            self.wake.wait()
+            with self.lock:
+                lastFlush = self.lastFlush
+            delay = lastFlush + self.minInterval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.flush()
+
+    def flush(self):
+        """Write every pending value now"""
+        with self.writeLock:
+            with self.lock:
+                pending = self.pending
+                self.pending = {}
+                self.wake.clear()
+                self.lastFlush = time.monotonic()
+            for output, value in pending.items():
+                try:
+                    self.writeFunction(output, value)
+                    self.writesIssued += 1
+                except Exception:
+                    self.logger.exception("Coalesced write to %s failed", output)
+
+    def stop(self, flush=True):
+        """Stop the writer thread, by default writing anything still pending first"""
+        self.running = False
+        if not flush:
+            with self.lock:
+                self.pending = {}
+        self.wake.set()
+        if flush:
+            self.thread.join()
+            self.flush()
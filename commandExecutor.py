@@ -0,0 +1,82 @@
+from concurrent.futures import Future
+from collections import deque
+from metrics import latencySummary
+import queue
+import threading
+import time
+
+class CommandExecutor():
+    """Class used to run hardware commands on a dedicated worker thread so callers never wait on GPIO"""
+    def __init__(self, logger, name="RobotArmExecutor", latencySamples=1000):
+        self.logger = logger
+        self.name = name
+
+        # Queue of pending commands and the worker thread that services it
+        self.commandQueue = queue.SimpleQueue()
+        self.thread = None
+        self.running = False
+
+        # Recent queueing latencies (time between enqueue and the worker starting the command), in seconds
+        self.queueLatencies = deque(maxlen=latencySamples)
+        self.commandsRun = 0
+
+    def start(self):
+        """Start the worker thread if it is not already running"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self, wait=True):
+        """Stop the worker thread once the commands already queued have been run"""
+        if not self.running:
+            return
+        self.running = False
+        self.commandQueue.put(None)
+        if wait and threading.current_thread() is not self.thread:
+            self.thread.join()
+
+    def submit(self, function, *args, callback=None, **kwargs):
+        """Queue a command and return a concurrent.futures.Future for its result
+
+        If a callback is given it is called with the Future once the command completes.
+        Callbacks run on the worker thread, so GUI code must hand the result back to its own thread."""
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        if not self.running:
+            future.set_exception(RuntimeError("Command executor is not running"))
+            return future
+        self.commandQueue.put((future, function, args, kwargs, time.perf_counter()))
+        return future
+
+    def submitAsync(self, function, *args, **kwargs):
+        """Queue a command and return an awaitable for use from an asyncio event loop"""
+        import asyncio
+        return asyncio.wrap_future(self.submit(function, *args, **kwargs))
+
+    def run(self):
+        """Worker loop, which runs each queued command in order"""
+        while True:
+            item = self.commandQueue.get()
+            if item is None:
+                break
+            future, function, args, kwargs, enqueueTime = item
+            self.queueLatencies.append(time.perf_counter() - enqueueTime)
+            self.commandsRun += 1
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args, **kwargs))
+            except BaseException as error:
+                self.logger.exception("Command %s failed", getattr(function, "__name__", function))
+                future.set_exception(error)
+
+    def pendingCommands(self):
+        """Return the approximate number of commands waiting to be run"""
+        return self.commandQueue.qsize()
+
+    def latencyStats(self):
+        """Return a summary of recent queueing latencies, in milliseconds"""
+        return latencySummary(self.queueLatencies)
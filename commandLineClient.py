@@ -1,27 +1,74 @@
-from robotArmControl import RobotArmControl
+from robotArmControl import RobotArmControl, Pins, backwardDirections, forwardDirections, motorTypesList
+from motionMacros import MacroError, defaultMacrosPath, loadMacros
+from pinProfiles import defaultProfilesPath
+from commandParsing import parseBatchCommand, profileFromArgs
+from terminalInput import KeyStreamController, defaultKeyMap, runCommandStream
+import argparse
+import atexit
 import logging
 import sys
 
-class Pins():
-    def __init__(self):
-        self.pins = {}
-        self.pins["rotate"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["shoulder"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["elbow"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["wrist"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["claw"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["led"] = {1:None, "enable":False}
+def keyActions(a):
+    """Return the functions run by keys that do not move a joint in --keys mode"""
+    def toggleLed():
+        if a.ledOn:
+            a.submit("stopLed")
+        else:
+            a.submit("controlLedBrightness")
+
+    def stepBrightness(step):
+        a.ledBrightness = min(1.0, max(0.0, a.ledBrightness + step))
+        if a.ledOn:
+            a.submit("controlLedBrightness")
+
+    def setSpeed(speed):
+        # Joints that are moving carry on at the new speed
+        a.submit("writeContinuousValue", "speed", speed)
+
+    return {
+        "l": toggleLed,
+        "[": lambda: stepBrightness(-0.1),
+        "]": lambda: stepBrightness(0.1),
+        "1": lambda: setSpeed(0.3333),
+        "2": lambda: setSpeed(0.6666),
+        "3": lambda: setSpeed(0.9999),
+        " ": lambda: a.submit("stopMotors"),
+        "q": lambda: False,
+    }
+
+def runMacro(a, macrosPath, name, logger):
+    """Compile the macros file and run one macro by name, logging its timing. Returns False if it could not be run"""
+    try:
+        programs = loadMacros(macrosPath)
+    except MacroError as error:
+        logger.error(error)
+        return False
+    if name not in programs:
+        logger.error(f"No macro named {name!r} in {macrosPath}. Macros: {', '.join(programs) or 'none'}")
+        return False
+    report = a.runMacro(programs[name])
+    for instruction in report["instructions"]:
+        logger.info(f"line {instruction['line']} {instruction['operation']} ({instruction['text']}) x{instruction['count']}: mean error {instruction['mean']:.3f} ms, max {instruction['max']:.3f} ms")
+    summary = report["summary"]
+    logger.info(f"Ran macro {name}: {summary['steps']} steps, mean error {summary['mean']:.3f} ms, p99 {summary['p99']:.3f} ms, max {summary['max']:.3f} ms")
+    return True
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Control the robot arm from the terminal")
+    parser.add_argument("--profile", help="name of a saved pin profile to load")
+    parser.add_argument("--profiles", default=defaultProfilesPath, help="profiles file to use")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every command")
+    parser.add_argument("--keys", action="store_true", help="hold keys to move joints, without pressing Enter")
+    parser.add_argument("--stream", action="store_true", help="run a stream of commands from stdin, such as a pipe, then exit")
+    parser.add_argument("--trace", metavar="PATH", help="trace commands and write them to PATH as a Chrome trace on exit")
+    parser.add_argument("--macro", action="append", metavar="NAME", help="run a macro by name, then exit. Can be given more than once")
+    parser.add_argument("--macros", default=defaultMacrosPath, help="macros file to use")
+    args = parser.parse_args()
+
     logging.basicConfig(format='%(asctime)s %(message)s')    
     
     pins = Pins()
-    pins.pins["led"][1] = "GPIO17"
-    pins.pins["led"]["enable"] = True
-    pins.pins["claw"][1] = "GPIO2"
-    pins.pins["claw"][2] = "GPIO3"
-    pins.pins["claw"][3] = "GPIO4"
-    pins.pins["claw"]["enable"] = True
+    profile = profileFromArgs(args)
 
     # Creating an object for logging
     logger = logging.getLogger()
@@ -30,33 +77,124 @@ if __name__ == "__main__":
     logger.setLevel(logging.INFO)
     
     # Create
-    a = RobotArmControl(pins,1,1, logger = logger, remote=False)
+    # Per-command log messages are only written when -v is passed
+    a = RobotArmControl(pins,1,1, logger = logger, remote=False, verbose=args.verbose)
+    profile.applyTo(pins, a)
     a.createGPIODevices()
+
+    # The trace is written however the client exits
+    if args.trace:
+        tracer = a.enableTracing()
+        def writeTrace():
+            tracer.exportChromeTrace(args.trace)
+            logger.info(f"Trace written to {args.trace}\n{tracer.summaryText()}")
+        atexit.register(writeTrace)
+
+    if args.macro:
+        try:
+            ok = all(runMacro(a, args.macros, name, logger) for name in args.macro)
+        except KeyboardInterrupt:
+            ok = False
+        a.closeAllGPIO()
+        sys.exit(0 if ok else 1)
+
+    if args.stream:
+        stats = runCommandStream(a, sys.stdin, logger)
+        logger.info(f"Ran {stats['commands']} commands from {stats['lines']} lines in {stats['seconds']:.3f} s, {stats['rate']:.0f} per second, {stats['errors']} errors")
+        a.closeAllGPIO()
+        sys.exit(1 if stats["errors"] else 0)
+
+    if args.keys:
+        keys = {}
+        for key, (motorType, direction) in defaultKeyMap.items():
+            keys.setdefault(motorType, []).append(f"{key}={direction}")
+        logger.info("Hold keys to move: " + ", ".join(f"{motorType} {' '.join(names)}" for motorType, names in keys.items()))
+        logger.info("l toggles the light, [ and ] change its brightness, 1-3 set the speed, space stops everything, q quits")
+        a.startExecutor()
+        try:
+            KeyStreamController(a, logger, actions=keyActions(a)).run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            a.stopExecutor()
+            a.closeAllGPIO()
+        sys.exit()
+
     while 1:
         char = input()
 
-        if char == "f":
-            a.driveMotor("claw","retract")
-        elif char == "b":
-            a.driveMotor("claw","extend")
-        elif char == "s":
-            a.stopMotor("claw")
-        elif char == "1":
-            a.motorSpeed = 0.3333
-        elif char == "2":
-            a.motorSpeed = 0.6666
-        elif char == "3":
-            a.motorSpeed = 0.9999
-        elif char == "4":
-            a.ledBrightness = 0.3333
-            a.controlLedBrightness()
-        elif char == "5":
-            a.ledBrightness = 0.6666
-            a.controlLedBrightness()
-        elif char == "6":
-            a.ledBrightness = 0.9999
-            a.controlLedBrightness()
-        elif char == "o":
-            a.stopLed()
-        elif char == "q":
-            sys.exit()
\ No newline at end of file
+        # While tracing, each line starts a new trace, so its GPIO writes can be followed back to it
+        with a.traceSpan(f"line {char}", "input", newTrace=True):
+            if char == "f":
+                a.driveMotor("claw","retract")
+            elif char == "b":
+                a.driveMotor("claw","extend")
+            elif char == "s":
+                a.stopMotor("claw")
+            elif char.startswith("m "):
+                # Coordinated move, e.g. "m shoulder=extend elbow=retract:0.5"
+                try:
+                    report = a.driveMotors(parseBatchCommand(char[2:]))
+                    logger.info(f"Moved {report['joints']} with {report['skew'] * 1000:.3f} ms skew, skipped {report['skipped']}")
+                except ValueError as error:
+                    logger.error(error)
+            elif char == "x":
+                a.stopMotors()
+            elif char.startswith("t "):
+                # Timed move, e.g. "t claw extend 250" drives the claw for 250 ms
+                try:
+                    _, motorType, direction, milliseconds = char.split()
+                    duration = int(milliseconds) / 1000
+                except ValueError:
+                    logger.error("Usage: t <joint> <direction> <milliseconds>")
+                else:
+                    if motorType not in motorTypesList:
+                        logger.error(f"Unknown joint {motorType!r}, expected one of {', '.join(motorTypesList)}")
+                    elif direction not in forwardDirections and direction not in backwardDirections:
+                        logger.error(f"Unknown direction {direction!r}, expected one of {', '.join(forwardDirections + backwardDirections)}")
+                    else:
+                        a.driveMotorFor(motorType, direction, duration)
+            elif char == "metrics":
+                print(a.metricsText())
+            elif char == "conn":
+                print(a.connectionStats())
+            elif char == "writes":
+                print(a.writeStats())
+            elif char == "resync":
+                # Write every output's last known state again, for example after the remote Pi has been restarted
+                logger.info(f"Resynced outputs: {a.resyncOutputs()}")
+            elif char.startswith("rec "):
+                try:
+                    a.startRecording(char[4:])
+                except OSError as error:
+                    logger.error(f"Could not start recording: {error}")
+            elif char == "endrec":
+                a.stopRecording()
+            elif char.startswith("play "):
+                try:
+                    report = a.replayRecording(char[5:])
+                except (OSError, ValueError) as error:
+                    logger.error(f"Could not replay: {error}")
+                else:
+                    logger.info(f"Replayed {report['summary']['events']} events, mean error {report['summary']['mean']:.3f} ms, max {report['summary']['max']:.3f} ms")
+            elif char.startswith("macro "):
+                runMacro(a, args.macros, char[6:].strip(), logger)
+            elif char == "1":
+                a.motorSpeed = 0.3333
+            elif char == "2":
+                a.motorSpeed = 0.6666
+            elif char == "3":
+                a.motorSpeed = 0.9999
+            elif char == "4":
+                a.ledBrightness = 0.3333
+                a.controlLedBrightness()
+            elif char == "5":
+                a.ledBrightness = 0.6666
+                a.controlLedBrightness()
+            elif char == "6":
+                a.ledBrightness = 0.9999
+                a.controlLedBrightness()
+            elif char == "o":
+                a.stopLed()
+            elif char == "q":
+                sys.exit()
\ No newline at end of file
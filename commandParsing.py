@@ -0,0 +1,30 @@
+from pinProfiles import PinProfile, ProfileError, loadProfile
+
+def parseBatchCommand(text):
+    """Turn text such as "shoulder=extend elbow=retract:0.5" into a mapping for RobotArmControl.driveMotors"""
+    commands = {}
+    for item in text.split():
+        motorType, _, command = item.partition("=")
+        direction, _, speed = command.partition(":")
+        commands[motorType] = (direction, float(speed) if speed else None)
+    return commands
+
+def defaultProfile():
+    """Return the profile used when none is named: the claw and LED on local GPIO"""
+    profile = PinProfile("default")
+    profile.pins.pins["led"][1] = "GPIO17"
+    profile.pins.pins["led"]["enable"] = True
+    profile.pins.pins["claw"][1] = "GPIO2"
+    profile.pins.pins["claw"][2] = "GPIO3"
+    profile.pins.pins["claw"][3] = "GPIO4"
+    profile.pins.pins["claw"]["enable"] = True
+    return profile
+
+def profileFromArgs(args):
+    """Return the profile named on the command line, or the default profile. An invalid profile exits before any device is created"""
+    if args.profile == None:
+        return defaultProfile()
+    try:
+        return loadProfile(args.profile, args.profiles)
+    except ProfileError as error:
+        raise SystemExit(str(error))
@@ -0,0 +1,13 @@
+from gpiozero.pins.mock import MockFactory, MockPWMPin
+from robotArmControl import RobotArmControl, Pins
+import logging
+import pytest
+
+@pytest.fixture
+def arm():
+    """A RobotArmControl with every output enabled on gpiozero's mock pins, closed once the test is done"""
+    arm = RobotArmControl(Pins.allEnabled(), 1.0, 1.0, logging.getLogger("test"), pinFactory=MockFactory(pin_class=MockPWMPin))
+    arm.createGPIODevices()
+    yield arm
+    arm.stopExecutor()
+    arm.closeAllGPIO()
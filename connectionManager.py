@@ -0,0 +1,212 @@
+import random
+import threading
+import time
+
+class HostConnection():
+    """Class used to store the factory and health details for a single remote pigpio host"""
+    def __init__(self, host):
+        self.host = host
+        self.factory = None
+        self.connectTime = None
+        self.rtt = None
+        self.rttMean = None
+        self.failures = 0
+        self.reconnects = 0
+        self.nextAttempt = 0.0
+
+    def stats(self):
+        return {"host": self.host, "connected": self.factory != None, "connectTime": self.connectTime, "rtt": self.rtt, "rttMean": self.rttMean, "failures": self.failures, "reconnects": self.reconnects}
+
+class ConnectionManager():
+    """Class used to keep remote pigpio connections alive, with one cached factory per host
+
+    A background thread probes each watched host with a cheap pigpio call to measure the round trip time. When a probe
+    fails the factory is dropped and reconnection is attempted with jittered exponential backoff. onReconnect is called
+    with the host and new factory so devices can be re-created."""
+    def __init__(self, logger, metrics=None, onReconnect=None, probeInterval=2.0, minBackoff=0.5, maxBackoff=30.0, factoryClass=None):
+        self.logger = logger
+        self.metrics = metrics
+        self.onReconnect = onReconnect
+        self.probeInterval = probeInterval
+        self.minBackoff = minBackoff
+        self.maxBackoff = maxBackoff
+        # The pigpio backend is only loaded when the first remote connection is made
+        self.factoryClass = factoryClass
+
+        # Connection details for every host that has been used, the hosts the probe thread watches and the host devices
+        # are currently created on
+        self.hosts = {}
+        self.watched = set()
+        self.currentHost = None
+        self.lock = threading.RLock()
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def connect(self, host):
+        """Return the factory for a host, connecting if there is no live connection. Raises IOError if the connection fails"""
+        with self.lock:
+            connection = self.hosts.setdefault(host, HostConnection(host))
+            factory = connection.factory
+        if factory == None:
+            factory = self.openFactory(connection)
+        with self.lock:
+            self.watched.add(host)
+        self.startProbing()
+        return factory
+
+    def use(self, host):
+        """Return the factory for a host as connect() does, making it the current host. The previous host is no longer
+        probed, but a new factory for the same host, after a reconnect, keeps it watched or a second drop would never be
+        noticed. Raises IOError if the connection fails"""
+        factory = self.connect(host)
+        with self.lock:
+            if self.currentHost != None and self.currentHost != host:
+                self.unwatch(self.currentHost)
+            self.currentHost = host
+        return factory
+
+    def openFactory(self, connection):
+        """Create a new factory for a host, recording how long it took, and return the factory the host now has
+
+        The network connection is made without holding the lock, so stats() and connect() are never held up by a slow or
+        unreachable host. The new factory is swapped in under the lock, unless another thread has connected first."""
+        if self.factoryClass == None:
+            from gpiozero.pins.pigpio import PiGPIOFactory
+            self.factoryClass = PiGPIOFactory
+        startTime = time.perf_counter()
+        try:
+            factory = self.factoryClass(host=connection.host)
+        except IOError:
+            with self.lock:
+                connection.failures += 1
+            if self.metrics != None:
+                self.metrics.counter("robotarm_connection_errors_total", host=connection.host).inc()
+            raise
+        connectTime = time.perf_counter() - startTime
+        with self.lock:
+            spare = None
+            if connection.factory != None:
+                spare, factory = factory, connection.factory
+            else:
+                connection.factory = factory
+                connection.connectTime = connectTime
+        if spare != None:
+            self.closeFactory(spare)
+        elif self.metrics != None:
+            self.metrics.histogram("robotarm_connect_seconds", host=connection.host).observe(connectTime)
+        return factory
+
+    def unwatch(self, host):
+        """Stop probing a host. Its factory stays cached so switching back to it is instant"""
+        with self.lock:
+            self.watched.discard(host)
+
+    def startProbing(self):
+        if self.thread == None or not self.thread.is_alive():
+            self.stopEvent.clear()
+            self.thread = threading.Thread(target=self.run, name="ConnectionManager", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stop the probe thread and close every cached factory"""
+        self.stopEvent.set()
+        if self.thread != None:
+            self.thread.join()
+        with self.lock:
+            self.currentHost = None
+            for connection in self.hosts.values():
+                self.dropFactory(connection)
+
+    def run(self):
+        """Probe loop, which checks each watched host and reconnects to any that have dropped"""
+        while not self.stopEvent.wait(self.probeInterval):
+            with self.lock:
+                hosts = [self.hosts[host] for host in self.watched]
+            for connection in hosts:
+                with self.lock:
+                    connected = connection.factory != None
+                if connected:
+                    self.probe(connection)
+                elif time.monotonic() >= connection.nextAttempt:
+                    self.reconnect(connection)
+
+    def probe(self, connection):
+        """Measure the round trip time to a host, dropping the connection if the daemon does not answer"""
+        with self.lock:
+            factory = connection.factory
+        if factory == None:
+            return
+        startTime = time.perf_counter()
+        try:
+            factory.connection.get_current_tick()
+        except Exception as error:
+            self.logger.warning(f"Lost connection to pigpio on {connection.host}: {error}")
+            # Only the factory that failed is dropped, not one a reconnect has put in place since
+            with self.lock:
+                if connection.factory is not factory:
+                    return
+                connection.factory = None
+                connection.failures = 1
+                connection.nextAttempt = time.monotonic() + self.backoff(connection.failures)
+            self.closeFactory(factory)
+            if self.metrics != None:
+                self.metrics.counter("robotarm_connection_errors_total", host=connection.host).inc()
+            return
+        rtt = time.perf_counter() - startTime
+        with self.lock:
+            connection.rtt = rtt
+            connection.rttMean = rtt if connection.rttMean == None else connection.rttMean * 0.9 + rtt * 0.1
+        if self.metrics != None:
+            self.metrics.histogram("robotarm_remote_probe_seconds", host=connection.host).observe(rtt)
+
+    def reconnect(self, connection):
+        """Try to reconnect to a host, backing off further on each failure"""
+        try:
+            factory = self.openFactory(connection)
+        except IOError:
+            with self.lock:
+                connection.nextAttempt = time.monotonic() + self.backoff(connection.failures)
+            return
+        with self.lock:
+            connection.failures = 0
+            connection.reconnects += 1
+        self.logger.warning(f"Reconnected to pigpio on {connection.host} in {connection.connectTime * 1000:.1f} ms")
+        if self.onReconnect != None:
+            self.onReconnect(connection.host, factory)
+
+    def backoff(self, failures):
+        """Return the delay before the next attempt, doubling with each failure and jittered by +/-50%"""
+        delay = min(self.maxBackoff, self.minBackoff * 2 ** (failures - 1))
+        return delay * random.uniform(0.5, 1.5)
+
+    def dropFactory(self, connection):
+        """Close and forget the factory for a host"""
+        factory = connection.factory
+        connection.factory = None
+        if factory != None:
+            self.closeFactory(factory)
+
+    def closeFactory(self, factory):
+        """Close a factory, shutting its sockets down even if the connection has already died"""
+        try:
+            factory.close()
+        except Exception:
+            # A dead connection fails part way through closing, leaving pigpio's notification thread spinning on its
+            # closed socket and the command socket open. Stopping both here means devices still bound to the factory
+            # see it as disconnected, and skip their writes when they are closed rather than each failing in turn
+            pi = getattr(factory, "_connection", None)
+            if pi != None:
+                try:
+                    pi.stop()
+                except Exception:
+                    pass
+                if pi.sl.s != None:
+                    pi.sl.s.close()
+                    pi.sl.s = None
+
+    def stats(self, host=None):
+        """Return connection details for one host, or for every host used so far"""
+        with self.lock:
+            if host != None:
+                return self.hosts[host].stats() if host in self.hosts else None
+            return {host: connection.stats() for host, connection in self.hosts.items()}
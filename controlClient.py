@@ -0,0 +1,92 @@
+from controlProtocol import encodeRequest, encodeBatch, replyStruct, DRIVE, STOP, SPEED, LED, LED_OFF, STOP_ALL, PING, OK, REJECTED
+import asyncio
+
+class ControlClient():
+    """Class used to send commands to a ControlServer
+
+    Every command method sends its request straight away and returns an asyncio Future for the acknowledgement, so
+    many requests can be in flight at once. Awaiting the Future gives (status, value), where status is OK, ERROR or REJECTED."""
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.sequence = 0
+        self.waiting = {}
+        self.readTask = None
+
+    async def connect(self, host="127.0.0.1", port=8765):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.readTask = asyncio.create_task(self.readReplies())
+        return self
+
+    async def connectUnix(self, path):
+        self.reader, self.writer = await asyncio.open_unix_connection(path)
+        self.readTask = asyncio.create_task(self.readReplies())
+        return self
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.readTask
+
+    async def readReplies(self):
+        """Match each acknowledgement to the request with the same sequence number"""
+        try:
+            while True:
+                sequence, status, opcode, value = replyStruct.unpack(await self.reader.readexactly(replyStruct.size))
+                future = self.waiting.pop(sequence, None)
+                if future != None and not future.done():
+                    future.set_result((status, value))
+        except (asyncio.IncompleteReadError, ConnectionError) as error:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Connection closed: {error}"))
+            self.waiting = {}
+
+    def send(self, frame):
+        """Write a request frame and return the Future for its acknowledgement"""
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[self.sequence] = future
+        self.writer.write(frame)
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        return future
+
+    async def drain(self):
+        """Wait until the written requests have been handed to the operating system"""
+        await self.writer.drain()
+
+    def drive(self, joint, direction, speed=0.0):
+        """Drive a motor. A speed of 0 uses the server's current motor speed"""
+        return self.send(encodeRequest(self.sequence, DRIVE, joint, direction, speed))
+
+    def stop(self, joint):
+        return self.send(encodeRequest(self.sequence, STOP, joint))
+
+    def setSpeed(self, speed):
+        """Set the motor speed, which is also applied to motors that are already moving"""
+        return self.send(encodeRequest(self.sequence, SPEED, value=speed))
+
+    def setLed(self, brightness):
+        return self.send(encodeRequest(self.sequence, LED, "led", value=brightness))
+
+    def ledOff(self):
+        return self.send(encodeRequest(self.sequence, LED_OFF, "led"))
+
+    def batch(self, commands):
+        """Drive several motors together from a mapping of joint to (direction, speed). The reply value is the skew in seconds"""
+        return self.send(encodeBatch(self.sequence, commands))
+
+    def stopAll(self):
+        return self.send(encodeRequest(self.sequence, STOP_ALL))
+
+    def ping(self):
+        return self.send(encodeRequest(self.sequence, PING))
+
+async def checkedReply(future):
+    """Await an acknowledgement and raise if the server reported an error. A request the server rejected as invalid
+    raises ValueError, and a command that failed on the arm raises RuntimeError"""
+    status, value = await future
+    if status == REJECTED:
+        raise ValueError("Request rejected by the server as invalid")
+    if status != OK:
+        raise RuntimeError("Command failed on the server")
+    return value
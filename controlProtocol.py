@@ -0,0 +1,28 @@
+from motionRecorder import jointCodes, directionCodes
+import struct
+
+# Every request starts with a 12-byte frame: sequence number, opcode, joint, direction, padding and a value (speed / brightness).
+# A BATCH request uses the joint field as an entry count and is followed by that many 8-byte entries.
+requestStruct = struct.Struct("<IBBBxf")
+batchEntryStruct = struct.Struct("<BBxxf")
+
+# Every request is acknowledged with a 12-byte frame: sequence number, status, opcode, padding and a value (batch skew in seconds)
+replyStruct = struct.Struct("<IBBxxf")
+
+# Opcodes
+DRIVE, STOP, SPEED, LED, LED_OFF, BATCH, STOP_ALL, PING = 1, 2, 3, 4, 5, 6, 7, 8
+
+# Reply statuses. ERROR means the command failed on the arm, and REJECTED that the request was invalid, such as driving
+# the LED or an unknown joint, so it never reached the arm
+OK, ERROR, REJECTED = 0, 1, 2
+
+def encodeRequest(sequence, opcode, joint="", direction="", value=0.0):
+    """Pack a single request frame"""
+    return requestStruct.pack(sequence, opcode, jointCodes.index(joint), directionCodes.index(direction), value)
+
+def encodeBatch(sequence, commands):
+    """Pack a BATCH request from a mapping of joint to (direction, speed)"""
+    frame = [requestStruct.pack(sequence, BATCH, len(commands), 0, 0.0)]
+    for joint, (direction, speed) in commands.items():
+        frame.append(batchEntryStruct.pack(jointCodes.index(joint), directionCodes.index(direction), speed))
+    return b"".join(frame)
@@ -0,0 +1,188 @@
+from controlProtocol import requestStruct, batchEntryStruct, replyStruct, DRIVE, STOP, SPEED, LED, LED_OFF, BATCH, STOP_ALL, PING, OK, ERROR, REJECTED
+from motionRecorder import jointCodes, directionCodes
+from robotArmControl import checkLevel, motorTypesList
+import asyncio
+
+class ControlServer():
+    """Class used to accept control connections over TCP or a Unix socket and pass their commands to a RobotArmControl object
+
+    Clients may pipeline requests without waiting for replies. Commands run in order on the RobotArmControl executor,
+    and each connection's acknowledgements are written back in the order the requests arrived. There is no
+    authentication, so by default the server only listens on localhost."""
+    def __init__(self, robotArmControl, logger):
+        self.robotArmControl = robotArmControl
+        self.logger = logger
+        self.servers = []
+        self.handlers = set()
+        self.connections = 0
+        self.requestsHandled = 0
+
+    async def start(self, host="127.0.0.1", port=8765, unixPath=None):
+        """Start listening on a TCP port and, if a path is given, a Unix socket. Pass host "0.0.0.0" to accept connections
+        from other machines, which lets anyone who can reach the port drive the arm"""
+        self.robotArmControl.startExecutor()
+        if port != None:
+            self.servers.append(await asyncio.start_server(self.handleConnection, host, port))
+        if unixPath != None:
+            self.servers.append(await asyncio.start_unix_server(self.handleConnection, unixPath))
+        return self
+
+    async def serveForever(self):
+        await asyncio.gather(*(server.serve_forever() for server in self.servers))
+
+    async def close(self):
+        """Stop listening and drop any connections that are still open"""
+        for server in self.servers:
+            server.close()
+        for handler in list(self.handlers):
+            handler.cancel()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        for server in self.servers:
+            await server.wait_closed()
+
+    def addresses(self):
+        """Return the addresses being listened on, useful when port 0 was used to pick a free port"""
+        return [socket.getsockname() for server in self.servers for socket in server.sockets]
+
+    def motorName(self, joint):
+        """Return the name of the motor a joint code refers to, raising ValueError for an unknown joint or the LED"""
+        name = jointCodes[joint] if joint < len(jointCodes) else ""
+        if name not in motorTypesList:
+            raise ValueError(f"Joint code {joint} is not a motor")
+        return name
+
+    def directionName(self, direction):
+        """Return the name of a direction code, raising ValueError for an unknown one"""
+        if not 0 < direction < len(directionCodes):
+            raise ValueError(f"Unknown direction code {direction}")
+        return directionCodes[direction]
+
+    def dispatch(self, opcode, joint, direction, value, batch):
+        """Queue the command for one request, returning a concurrent.futures.Future"""
+        arm = self.robotArmControl
+        # Values and joints are checked here, so a bad request is rejected without reaching the arm
+        if opcode in (DRIVE, SPEED, LED):
+            checkLevel(value, "brightness" if opcode == LED else "speed")
+        if opcode == DRIVE:
+            motorType, directionName = self.motorName(joint), self.directionName(direction)
+            if value > 0:
+                return arm.submit("driveMotors", {motorType: (directionName, value)})
+            return arm.submit("driveMotor", motorType, directionName)
+        if opcode == STOP:
+            return arm.submit("stopMotor", self.motorName(joint))
+        if opcode == SPEED:
+            return arm.submit("writeContinuousValue", "speed", value)
+        if opcode == LED:
+            return arm.submit("setLedBrightness", value)
+        if opcode == LED_OFF:
+            return arm.submit("stopLed")
+        if opcode == BATCH:
+            return arm.submit("driveMotors", batch)
+        if opcode == STOP_ALL:
+            return arm.submit("stopMotors")
+        raise ValueError(f"Unknown opcode: {opcode}")
+
+    async def handleConnection(self, reader, writer):
+        """Read requests from one client until it disconnects, acknowledging each one in order"""
+        self.connections += 1
+        self.handlers.add(asyncio.current_task())
+        pending = asyncio.Queue()
+        ackTask = asyncio.create_task(self.writeAcks(pending, writer))
+        try:
+            while True:
+                sequence, opcode, joint, direction, value = requestStruct.unpack(await reader.readexactly(requestStruct.size))
+                self.requestsHandled += 1
+                future = None
+                try:
+                    batch = None
+                    if opcode == BATCH:
+                        data = await reader.readexactly(batchEntryStruct.size * joint)
+                        # A speed of 0 means the arm's current speed
+                        batch = {self.motorName(entryJoint): (self.directionName(entryDirection), checkLevel(speed, "speed") or None) for entryJoint, entryDirection, speed in batchEntryStruct.iter_unpack(data)}
+                    if opcode != PING:
+                        future = asyncio.wrap_future(self.dispatch(opcode, joint, direction, value, batch))
+                except ValueError as error:
+                    self.logger.warning(f"Request {sequence} rejected: {error}")
+                    pending.put_nowait((sequence, opcode, None, REJECTED))
+                    continue
+                pending.put_nowait((sequence, opcode, future, OK))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            ackTask.cancel()
+        finally:
+            pending.put_nowait(None)
+            try:
+                await ackTask
+            except asyncio.CancelledError:
+                pass
+            writer.close()
+            self.handlers.discard(asyncio.current_task())
+            self.connections -= 1
+
+    async def writeAcks(self, pending, writer):
+        """Write an acknowledgement for each request once its command has run, flushing when no more are ready"""
+        while True:
+            item = await pending.get()
+            if item == None:
+                break
+            sequence, opcode, future, status = item
+            value = 0.0
+            if future != None:
+                try:
+                    result = await future
+                    if isinstance(result, dict) and "skew" in result:
+                        value = result["skew"]
+                except Exception as error:
+                    self.logger.warning(f"Request {sequence} failed: {error}")
+                    status = ERROR
+            writer.write(replyStruct.pack(sequence, status, opcode, value))
+            if pending.empty():
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    break
+
+if __name__ == "__main__":
+    from robotArmControl import RobotArmControl, Pins
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Network control server for the robot arm")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on. 0.0.0.0 accepts connections from other machines, with no authentication")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="also listen on this Unix socket path")
+    parser.add_argument("--remote", help="IP address of a remote pigpio daemon to drive")
+    parser.add_argument("--mock", action="store_true", help="use gpiozero's mock pins instead of real GPIO")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(message)s')
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+
+    pins = Pins()
+    pins.pins["led"][1] = "GPIO17"
+    pins.pins["led"]["enable"] = True
+    pins.pins["claw"][1] = "GPIO2"
+    pins.pins["claw"][2] = "GPIO3"
+    pins.pins["claw"][3] = "GPIO4"
+    pins.pins["claw"]["enable"] = True
+
+    pinFactory = None
+    if args.mock:
+        from gpiozero.pins.mock import MockFactory, MockPWMPin
+        pinFactory = MockFactory(pin_class=MockPWMPin)
+
+    a = RobotArmControl(pins, 1, 1, logger, remote=args.remote != None, remoteIP=args.remote or "", pinFactory=pinFactory)
+    a.createGPIODevices()
+
+    async def main():
+        server = await ControlServer(a, logger).start(args.host, args.port, args.unix)
+        logger.info(f"Listening on {server.addresses()}")
+        await server.serveForever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        a.stopMotors()
+        a.closeAllGPIO()
@@ -0,0 +1,110 @@
+from robotArmControl import RobotArmControl
+from concurrent.futures import wait
+import threading
+import time
+
+class FleetController():
+    """Class used to drive several robot arms at once, each with its own pin factory, Pins table and worker thread"""
+    def __init__(self, logger):
+        self.logger = logger
+        self.arms = {}
+
+    def addArm(self, name, pins, remoteIP=None, pinFactory=None, motorSpeed=1, ledBrightness=1, **kwargs):
+        """Add an arm, connected either to a remote pigpio host or through a pin factory object, and start its worker"""
+        arm = RobotArmControl(pins, motorSpeed, ledBrightness, self.logger, remote=remoteIP != None, remoteIP=remoteIP or "", pinFactory=pinFactory, **kwargs)
+        arm.startExecutor(name=f"RobotArmExecutor-{name}")
+        self.arms[name] = arm
+        return arm
+
+    def removeArm(self, name):
+        """Close an arm's devices, stop its worker and remove it from the fleet"""
+        arm = self.arms.pop(name)
+        arm.submit("closeAllGPIO").result()
+        arm.stopExecutor()
+
+    def send(self, commands, timeout=None):
+        """Send a different command to each arm in parallel and wait for them all
+
+        commands maps an arm name to a (commandName, args) tuple. Returns a report with the result (or exception) and
+        latency of each arm, plus the total time and aggregate throughput in commands per second."""
+        submitTimes = {}
+        doneTimes = {}
+        futures = {}
+
+        # A future's callbacks run just after the threads waiting on it are woken, so each callback sets an event once it
+        # has stored its time, and the latency is only read after that event
+        recorded = {name: threading.Event() for name in commands}
+
+        def finished(future, name):
+            doneTimes[name] = time.perf_counter()
+            recorded[name].set()
+
+        startTime = time.perf_counter()
+        for name, (commandName, args) in commands.items():
+            submitTimes[name] = time.perf_counter()
+            futures[name] = self.arms[name].submit(commandName, *args, callback=lambda future, name=name: finished(future, name))
+        wait(futures.values(), timeout=timeout)
+        elapsed = time.perf_counter() - startTime
+
+        report = {"results": {}, "latency": {}, "elapsed": elapsed, "throughput": len(futures) / elapsed if elapsed > 0 else 0.0}
+        for name, future in futures.items():
+            if not future.done():
+                report["results"][name] = TimeoutError(f"{name} did not finish in time")
+                continue
+            report["results"][name] = future.exception() if future.exception() != None else future.result()
+            recorded[name].wait()
+            report["latency"][name] = doneTimes[name] - submitTimes[name]
+        return report
+
+    def broadcast(self, commandName, *args, arms=None, timeout=None):
+        """Send the same command to every arm, or to the named arms, in parallel"""
+        return self.send({name: (commandName, args) for name in (self.arms if arms == None else arms)}, timeout)
+
+    def createGPIODevices(self):
+        """Set up the devices of every arm in parallel"""
+        return self.broadcast("createGPIODevices")
+
+    def stopAll(self):
+        """Stop every motor on every arm"""
+        return self.broadcast("stopMotors")
+
+    def stats(self):
+        """Return the queueing latency and connection details of each arm"""
+        return {name: {"queueLatency": arm.commandLatencyStats(), "connections": arm.connectionStats()} for name, arm in self.arms.items()}
+
+    def close(self):
+        """Close every arm in the fleet"""
+        for name in list(self.arms):
+            self.removeArm(name)
+
+if __name__ == "__main__":
+    # Drive a fleet of arms on separate mock pin factories, reporting throughput and per-arm latency
+    from gpiozero.pins.mock import MockFactory, MockPWMPin
+    from robotArmControl import Pins
+    import logging
+    import sys
+
+    logging.basicConfig(format='%(asctime)s %(message)s')
+    logger = logging.getLogger()
+
+    armCount = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    fleet = FleetController(logger)
+    for armNumber in range(armCount):
+        fleet.addArm(f"arm{armNumber}", Pins.allEnabled(), pinFactory=MockFactory(pin_class=MockPWMPin))
+    print(fleet.createGPIODevices()["results"])
+
+    latencies = {name: [] for name in fleet.arms}
+    startTime = time.perf_counter()
+    for roundNumber in range(rounds):
+        report = fleet.broadcast("driveMotors", {"shoulder": "extend", "elbow": "retract"}) if roundNumber % 2 == 0 else fleet.stopAll()
+        for name, latency in report["latency"].items():
+            latencies[name].append(latency)
+    elapsed = time.perf_counter() - startTime
+
+    print(f"{rounds * armCount} commands to {armCount} arms in {elapsed:.3f} s, {rounds * armCount / elapsed:.0f} commands/s")
+    for name, samples in latencies.items():
+        samples.sort()
+        print(f"{name}: p50 {samples[len(samples) // 2] * 1e6:.1f} us, p99 {samples[int(len(samples) * 0.99)] * 1e6:.1f} us")
+    fleet.close()
@@ -0,0 +1,74 @@
+from robotArmControl import RobotArmControl, Pins
+from commandParsing import parseBatchCommand, profileFromArgs
+from pinProfiles import defaultProfilesPath
+import argparse
+import logging
+import time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive the robot arm without the Qt interface")
+    parser.add_argument("--profile", help="name of a saved pin profile to load")
+    parser.add_argument("--profiles", default=defaultProfilesPath, help="profiles file to use")
+    parser.add_argument("--remote", help="IP address of a remote pigpio daemon to drive, overriding the profile")
+    parser.add_argument("--mock", action="store_true", help="use gpiozero's mock pins instead of real GPIO")
+    parser.add_argument("--simulate", action="store_true", help="drive a simulated arm, running in real time")
+    parser.add_argument("--move", help='coordinated move to make, e.g. "shoulder=extend elbow=retract:0.5"')
+    parser.add_argument("--duration", type=float, default=0, help="seconds to hold the move before stopping")
+    parser.add_argument("--play", help="timeline file to replay")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="run the network control server on this port")
+    parser.add_argument("--unix", help="run the network control server on this Unix socket path")
+    parser.add_argument("--host", default="127.0.0.1", help="address the network control server listens on. 0.0.0.0 accepts connections from other machines, with no authentication")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every command")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(message)s')
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+
+    pins = Pins()
+    profile = profileFromArgs(args)
+
+    # Only load the mock pin backend when it has been asked for
+    pinFactory = None
+    if args.mock:
+        from gpiozero.pins.mock import MockFactory, MockPWMPin
+        pinFactory = MockFactory(pin_class=MockPWMPin)
+
+    # The simulator is advanced in step with the wall clock, so timed moves, ramps and soft limits behave as on the real arm
+    simulator = None
+    if args.simulate:
+        from simulatedArm import ArmSimulator
+        simulator = ArmSimulator(logger)
+        simulator.startRealTime()
+
+    a = RobotArmControl(pins, 1, 1, logger, pinFactory=pinFactory, verbose=args.verbose, simulator=simulator)
+    profile.applyTo(pins, a)
+    if args.remote != None:
+        a.remote = True
+        a.remoteIP = args.remote
+    if not a.createGPIODevices():
+        raise SystemExit("Error connecting.")
+
+    try:
+        if args.move:
+            a.driveMotors(parseBatchCommand(args.move))
+            time.sleep(args.duration)
+            a.stopMotors()
+        if args.play:
+            logger.info(f"Replay finished: {a.replayRecording(args.play)['summary']}")
+        if args.serve != None or args.unix:
+            from controlServer import ControlServer
+            import asyncio
+
+            async def serve():
+                server = await ControlServer(a, logger).start(args.host, args.serve, args.unix)
+                logger.info(f"Listening on {server.addresses()}")
+                await server.serveForever()
+            asyncio.run(serve())
+    except KeyboardInterrupt:
+        a.stopMotors()
+    finally:
+        a.closeAllGPIO()
+        if simulator != None:
+            simulator.stop()
+            logger.info(f"Simulated joint positions: {simulator.jointPositions()}")
@@ -0,0 +1,514 @@
+from concurrent.futures import Future
+from controlProtocol import batchEntryStruct, DRIVE, STOP, SPEED, LED, LED_OFF, BATCH, STOP_ALL, PING, OK, ERROR
+from metrics import latencySummary
+from motionRecorder import jointCodes, directionCodes
+from robotArmControl import ChangeReport, Pins, RobotArmControl, motorTypesList, nullSpan
+from sharedRing import SharedRing
+from collections import deque
+import json
+import logging
+import math
+import multiprocessing
+import os
+import struct
+import threading
+import time
+
+# Opcodes only used between the GUI and controller processes, numbered after those of the network protocol
+DRIVE_RAMPED, STOP_RAMPED, LED_ON, CONTINUOUS, SETUP, CALL, CANCEL_REPLAY, CLOSE = range(32, 40)
+
+# Every command record starts with a sequence number, opcode, joint, direction, padding, the time.monotonic() it was
+# queued at and a value (speed / brightness). A BATCH command uses the joint field as an entry count and is followed by
+# that many batch entries, and SETUP and CALL commands are followed by JSON
+commandStruct = struct.Struct("<IBBBxdf")
+
+# Every state record starts with the sequence number and opcode of the command it follows, a status, padding, the
+# seconds from queueing to applying the command, and the value last written to each output in Pins.schema order, NaN
+# while unknown. A result or error message follows as JSON, for the commands that return one
+stateStruct = struct.Struct(f"<IBBxxf{len(Pins.schema)}f")
+
+# Continuous outputs, indexed by the joint field of a CONTINUOUS command
+continuousOutputs = ["speed", "led"]
+
+def encodePins(pins):
+    """Return a Pins object as a dictionary that JSON can carry. Pin numbers become strings as JSON keys"""
+    return {outputType: {str(pinNumber): pinName for pinNumber, pinName in outputPins.items()} for outputType, outputPins in pins.pins.items()}
+
+def decodePins(encoded, pins):
+    """Copy pins encoded by encodePins() into an existing Pins object, keeping the dictionaries its joints share"""
+    for outputType, outputPins in encoded.items():
+        pins.pins[outputType].update({pinNumber if pinNumber == "enable" else int(pinNumber): pinName for pinNumber, pinName in outputPins.items()})
+
+class IsolatedController():
+    """Class used in the controller process to apply the commands read from a shared memory ring to a RobotArmControl object
+
+    Commands are applied in order on the RobotArmControl executor, and after each one a state record is written to the
+    state ring. Long commands sent to run in the background, such as replays, run on a worker of their own instead,
+    and their state is written once they are done. Every motor is stopped if the GUI process's heartbeat is older than producerTimeout seconds, and the
+    controller stops every motor and exits if the GUI process goes away."""
+    def __init__(self, robotArmControl, commandRing, stateRing, logger, producerPid, pollInterval=0.0005, idlePollInterval=0.002, producerTimeout=1.0):
+        self.robotArmControl = robotArmControl
+        self.commandRing = commandRing
+        self.stateRing = stateRing
+        self.logger = logger
+        self.producerPid = producerPid
+        self.pollInterval = pollInterval
+        self.idlePollInterval = idlePollInterval
+        self.producerTimeout = producerTimeout
+        self.producerStalled = False
+
+        robotArmControl.metrics.describe("robotarm_isolated_apply_seconds", "Time from the GUI process queueing a command to the controller process applying it")
+        self.applyHistogram = robotArmControl.metrics.histogram("robotarm_isolated_apply_seconds")
+
+    def run(self):
+        """Apply commands until a CLOSE command arrives or the GUI process goes away, then stop every motor"""
+        self.robotArmControl.startExecutor("IsolatedController")
+        nextCheck = 0.0
+        idleSince = None
+        try:
+            while True:
+                payload = self.commandRing.get()
+                if payload != None:
+                    if not self.handle(payload):
+                        break
+                    idleSince = None
+                    continue
+                # There is no way to wait on shared memory, so an empty ring is polled, less often once it has been idle
+                # for a while
+                now = time.monotonic()
+                if idleSince == None:
+                    idleSince = now
+                if now >= nextCheck:
+                    nextCheck = now + 0.05
+                    self.stateRing.beat()
+                    if self.producerGone():
+                        break
+                time.sleep(self.pollInterval if now - idleSince < 0.1 else self.idlePollInterval)
+        finally:
+            self.shutdown()
+
+    def handle(self, payload):
+        """Queue one command record, returning False once the GUI process has asked the controller to close"""
+        sequence, opcode, joint, direction, enqueueTime, value = commandStruct.unpack_from(payload)
+        if opcode == CLOSE:
+            return False
+        # A replay runs on the executor, so cancelling it cannot wait in the queue behind it
+        if opcode == CANCEL_REPLAY:
+            self.robotArmControl.cancelReplay()
+            return True
+        self.robotArmControl.executor.submit(self.apply, sequence, opcode, joint, direction, enqueueTime, value, payload[commandStruct.size:])
+        return True
+
+    def producerGone(self):
+        """Check on the GUI process, stopping every motor once if its heartbeat is late. Returns True if it has gone"""
+        if os.getppid() != self.producerPid or self.commandRing.writerClosed():
+            self.logger.warning("The GUI process has gone. Stopping every motor")
+            return True
+        age = self.commandRing.writerAge()
+        if age > self.producerTimeout:
+            if not self.producerStalled:
+                self.producerStalled = True
+                self.logger.warning(f"No heartbeat from the GUI process for {age:.1f} s. Stopping every motor")
+                self.robotArmControl.cancelReplay()
+                self.robotArmControl.executor.submit(self.stopAllMotors)
+        else:
+            self.producerStalled = False
+        return False
+
+    def apply(self, sequence, opcode, joint, direction, enqueueTime, value, extra):
+        """Run one command on the executor and write the state that follows it"""
+        latency = time.monotonic() - enqueueTime
+        self.applyHistogram.observe(latency)
+        if opcode == CALL:
+            call = json.loads(extra)
+            # A long command, such as a replay, runs on a worker of its own and its state is written once it is done, so
+            # the commands sent while it plays are not queued behind it
+            if call.get("background"):
+                self.robotArmControl.runInBackground(call["name"], *call["args"], callback=lambda future: self.robotArmControl.executor.submit(self.finishBackground, sequence, opcode, latency, future))
+                return
+        status = OK
+        try:
+            result = self.dispatch(opcode, joint, direction, value, extra)
+        except Exception as error:
+            self.logger.exception(f"Command with opcode {opcode} failed")
+            status = ERROR
+            result = {"error": f"{type(error).__name__}: {error}"}
+        self.publish(sequence, opcode, status, latency, result)
+
+    def finishBackground(self, sequence, opcode, latency, future):
+        """Write the state that follows a command run in the background, on the executor, once it is done"""
+        status = OK
+        try:
+            result = future.result()
+        except Exception as error:
+            status = ERROR
+            result = {"error": f"{type(error).__name__}: {error}"}
+        self.publish(sequence, opcode, status, latency, result)
+
+    def dispatch(self, opcode, joint, direction, value, extra):
+        """Call the RobotArmControl method for one command, returning its result"""
+        arm = self.robotArmControl
+        if opcode == DRIVE:
+            return arm.driveMotor(jointCodes[joint], directionCodes[direction], value)
+        if opcode == DRIVE_RAMPED:
+            arm.motorSpeed = value
+            return arm.driveMotorRamped(jointCodes[joint], directionCodes[direction])
+        if opcode == STOP:
+            return arm.stopMotor(jointCodes[joint])
+        if opcode == STOP_RAMPED:
+            return arm.stopMotorRamped(jointCodes[joint])
+        if opcode == BATCH:
+            return arm.driveMotors({jointCodes[entryJoint]: (directionCodes[entryDirection], speed) for entryJoint, entryDirection, speed in batchEntryStruct.iter_unpack(extra)})
+        if opcode == STOP_ALL:
+            return arm.stopMotors()
+        if opcode == SPEED:
+            return arm.writeContinuousValue("speed", value)
+        if opcode == CONTINUOUS:
+            return arm.setContinuousValue(continuousOutputs[joint], value)
+        if opcode == LED:
+            return arm.setLedBrightness(value)
+        if opcode == LED_ON:
+            arm.ledBrightness = value
+            return arm.controlLedBrightness()
+        if opcode == LED_OFF:
+            return arm.stopLed()
+        if opcode == SETUP:
+            settings = json.loads(extra)
+            decodePins(settings["pins"], arm.pins)
+            arm.remote = settings["remote"]
+            arm.remoteIP = settings["remoteIP"]
+            return arm.createGPIODevices().asDict()
+        if opcode == CALL:
+            call = json.loads(extra)
+            return getattr(arm, call["name"])(*call["args"])
+        if opcode == PING:
+            return None
+        raise ValueError(f"Unknown opcode: {opcode}")
+
+    def publish(self, sequence, opcode, status, latency, result):
+        """Write a state record, with the value last written to every output"""
+        written = [math.nan if joint.written == None else joint.written for joint in self.robotArmControl.joints]
+        record = stateStruct.pack(sequence, opcode, status, latency, *written)
+        if result != None:
+            record += json.dumps(result, default=str).encode()
+        if not self.stateRing.put(record):
+            self.logger.warning(f"State ring is full, dropped the state after command {sequence}")
+
+    def stopAllMotors(self):
+        """Stop every motor that has a device, which may not be every enabled one if setup has not been applied"""
+        return self.robotArmControl.stopMotors([motorType for motorType in motorTypesList if motorType in self.robotArmControl.motorObjects])
+
+    def shutdown(self):
+        """Stop every motor, close the devices and tell the GUI process that no more states will be written"""
+        arm = self.robotArmControl
+        arm.cancelReplay()
+        try:
+            arm.executor.submit(self.stopAllMotors).result(timeout=5)
+        except Exception:
+            self.logger.exception("Failed to stop the motors")
+        arm.stopExecutor()
+        arm.closeAllGPIO()
+        self.stateRing.markClosed()
+
+def runController(commandRingName, stateRingName, producerPid, settings, pollInterval, idlePollInterval, producerTimeout):
+    """Entry point of the controller process, which attaches to the rings and runs an IsolatedController"""
+    logging.basicConfig(format='%(asctime)s %(message)s')
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+
+    pins = Pins()
+    decodePins(settings["pins"], pins)
+    simulator = None
+    if settings["simulate"]:
+        from simulatedArm import ArmSimulator
+        simulator = ArmSimulator(logger)
+        simulator.startRealTime()
+    pinFactory = None
+    if settings["mock"]:
+        from gpiozero.pins.mock import MockFactory, MockPWMPin
+        pinFactory = MockFactory(pin_class=MockPWMPin)
+    arm = RobotArmControl(pins, settings["motorSpeed"], settings["ledBrightness"], logger, remote=settings["remote"], remoteIP=settings["remoteIP"], pinFactory=pinFactory, simulator=simulator)
+
+    commandRing = SharedRing(commandRingName)
+    stateRing = SharedRing(stateRingName)
+    try:
+        IsolatedController(arm, commandRing, stateRing, logger, producerPid, pollInterval, idlePollInterval, producerTimeout).run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if simulator != None:
+            simulator.stop()
+        commandRing.close()
+        stateRing.close()
+
+class IsolatedArmControl():
+    """Class used in place of RobotArmControl to run the hardware in a separate process, so the GUI cannot stall it
+
+    It offers the parts of RobotArmControl the windows use. Commands are written to a shared memory ring as fixed size
+    records and applied in order by an IsolatedController in the other process, and submit() returns a Future that is
+    completed from the state record written after each one. Methods without a record of their own are sent by name as
+    JSON. A thread reads the state ring. The heartbeat the controller watches is beaten by every command sent and by
+    heartbeat(), which the GUI calls from its event loop, so if the thread sending commands hangs, or this process
+    dies, the motors are stopped."""
+    def __init__(self, pins, motorSpeed, ledBrightness, logger, remote=False, remoteIP="", simulate=False, mock=False, capacity=65536, pollInterval=0.0005, idlePollInterval=0.002, heartbeatInterval=0.1, producerTimeout=1.0):
+        self.pins = pins
+        self.motorSpeed = motorSpeed
+        self.ledBrightness = ledBrightness
+        self.logger = logger
+        self.remote = remote
+        self.remoteIP = remoteIP
+        self.simulate = simulate
+        self.mock = mock
+        self.capacity = capacity
+        self.pollInterval = pollInterval
+        self.idlePollInterval = idlePollInterval
+        self.heartbeatInterval = heartbeatInterval
+        self.producerTimeout = producerTimeout
+
+        self.commandRing = None
+        self.stateRing = None
+        self.process = None
+        self.thread = None
+        self.running = False
+
+        # Futures waiting for the state record of their command, in sequence order, and the lock that keeps sequence
+        # numbers in the order their records are written. Commands run in the background finish out of order, so their
+        # Futures are kept apart
+        self.pending = {}
+        self.backgroundPending = {}
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+        # Recent time from queueing to applying each command, and the newest state the controller reported
+        self.applyLatencies = deque(maxlen=1000)
+        self.state = None
+
+    def startExecutor(self, name="IsolatedController"):
+        """Start the controller process and the thread that reads its states, if they are not already running"""
+        if self.running:
+            return
+        self.commandRing = SharedRing(capacity=self.capacity)
+        self.stateRing = SharedRing(capacity=self.capacity * 4)
+        # The first heartbeat is written before the process starts, so the controller never sees a stale one
+        self.commandRing.beat()
+        settings = {"pins": encodePins(self.pins), "remote": self.remote, "remoteIP": self.remoteIP, "motorSpeed": self.motorSpeed, "ledBrightness": self.ledBrightness, "simulate": self.simulate, "mock": self.mock}
+        # Spawning rather than forking means the controller does not inherit the GUI's threads or Qt state
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(target=runController, args=(self.commandRing.name, self.stateRing.name, os.getpid(), settings, self.pollInterval, self.idlePollInterval, self.producerTimeout), name=name, daemon=True)
+        self.process.start()
+        self.running = True
+        self.thread = threading.Thread(target=self.readStates, name=f"{name}States", daemon=True)
+        self.thread.start()
+
+    def stopExecutor(self):
+        """Close the controller process, which stops every motor, and fail any commands it did not apply"""
+        if self.process == None:
+            return
+        self.send(CLOSE)
+        self.commandRing.markClosed()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.logger.warning("The controller process did not close, terminating it")
+            self.process.terminate()
+            self.process.join()
+        self.running = False
+        self.thread.join()
+        self.failPending("The controller process has closed")
+        stats = self.commandLatencyStats()
+        if stats["count"]:
+            self.logger.info(f"Queue to apply latency over the last {stats['count']} commands: p50 {stats['p50']:.2f} ms, p99 {stats['p99']:.2f} ms, max {stats['max']:.2f} ms")
+        self.commandRing.close()
+        self.stateRing.close()
+        self.process = None
+
+    def submit(self, commandName, *args, callback=None):
+        """Queue a command in the controller process and return a concurrent.futures.Future for its result
+
+        As with RobotArmControl.submit(), callbacks run on another thread, here the one reading states."""
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        if not self.running:
+            future.set_exception(RuntimeError("The controller process is not running"))
+            return future
+        try:
+            opcode, joint, direction, value, extra = self.encode(commandName, args)
+        except (ValueError, TypeError) as error:
+            future.set_exception(error)
+            return future
+        self.send(opcode, joint, direction, value, extra, future)
+        return future
+
+    def encode(self, commandName, args):
+        """Return the opcode, joint, direction, value and payload of the record for a command"""
+        if commandName == "driveMotor" and len(args) in (2, 3):
+            return DRIVE, jointCodes.index(args[0]), directionCodes.index(args[1]), self.motorSpeed if len(args) == 2 or args[2] == None else args[2], b""
+        if commandName == "driveMotorRamped" and len(args) == 2:
+            return DRIVE_RAMPED, jointCodes.index(args[0]), directionCodes.index(args[1]), self.motorSpeed, b""
+        if commandName in ("stopMotor", "stopMotorRamped") and len(args) == 1:
+            return STOP if commandName == "stopMotor" else STOP_RAMPED, jointCodes.index(args[0]), 0, 0.0, b""
+        if commandName == "driveMotors" and len(args) == 1:
+            entries = []
+            for motorType, command in args[0].items():
+                direction, speed = (command, None) if isinstance(command, str) else command
+                entries.append(batchEntryStruct.pack(jointCodes.index(motorType), directionCodes.index(direction), self.motorSpeed if speed == None else speed))
+            return BATCH, len(entries), 0, 0.0, b"".join(entries)
+        if commandName == "stopMotors" and not args:
+            return STOP_ALL, 0, 0, 0.0, b""
+        if commandName == "controlLedBrightness" and not args:
+            return LED_ON, 0, 0, self.ledBrightness, b""
+        if commandName == "setLedBrightness" and len(args) == 1:
+            return LED, 0, 0, args[0], b""
+        if commandName == "stopLed" and not args:
+            return LED_OFF, 0, 0, 0.0, b""
+        if commandName == "createGPIODevices" and not args:
+            settings = {"pins": encodePins(self.pins), "remote": self.remote, "remoteIP": self.remoteIP}
+            return SETUP, 0, 0, 0.0, json.dumps(settings).encode()
+        return CALL, 0, 0, 0.0, json.dumps({"name": commandName, "args": args}).encode()
+
+    def runInBackground(self, commandName, *args, callback=None):
+        """Run a long command, such as "replayRecording", on a worker of its own in the controller process and return a
+        Future for its result. The commands it sends are applied in between those sent meanwhile"""
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        if not self.running:
+            future.set_exception(RuntimeError("The controller process is not running"))
+            return future
+        self.send(CALL, 0, 0, 0.0, json.dumps({"name": commandName, "args": args, "background": True}).encode(), future, background=True)
+        return future
+
+    def heartbeat(self):
+        """Tell the controller this process is still alive. Call it regularly from the thread that sends commands, such
+        as from a timer on the GUI event loop, so a stall of that thread stops the motors"""
+        if self.running:
+            self.commandRing.beat()
+
+    def send(self, opcode, joint=0, direction=0, value=0.0, extra=b"", future=None, background=False):
+        """Write a command record, failing its Future straight away if the ring is full. Sending a command also beats
+        the heartbeat"""
+        pending = self.backgroundPending if background else self.pending
+        with self.lock:
+            self.commandRing.beat()
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+            if future != None:
+                pending[self.sequence] = future
+            if self.commandRing.put(commandStruct.pack(self.sequence, opcode, joint, direction, time.monotonic(), value) + extra):
+                return True
+            pending.pop(self.sequence, None)
+        self.logger.warning("Command ring is full, dropped a command")
+        if future != None:
+            future.set_exception(RuntimeError("Command ring is full"))
+        return False
+
+    def readStates(self):
+        """Complete Futures from the state records, and check the controller process is alive, until it closes"""
+        nextCheck = 0.0
+        while True:
+            payload = self.stateRing.get()
+            if payload != None:
+                self.handleState(payload)
+                continue
+            if not self.running:
+                return
+            now = time.monotonic()
+            if now >= nextCheck:
+                nextCheck = now + self.heartbeatInterval
+                if not self.process.is_alive():
+                    self.logger.error(f"The controller process exited with code {self.process.exitcode}")
+                    self.running = False
+                    self.failPending("The controller process exited")
+                    return
+            # States only need reading quickly while a command is waiting for one
+            time.sleep(self.pollInterval if self.pending else self.idlePollInterval)
+
+    def handleState(self, payload):
+        """Store the state in a record and complete the Future of its command"""
+        sequence, opcode, status, latency, *written = stateStruct.unpack_from(payload)
+        result = json.loads(payload[stateStruct.size:]) if len(payload) > stateStruct.size else None
+        self.applyLatencies.append(latency)
+        self.state = {"sequence": sequence, "written": {outputType: None if math.isnan(value) else value for (outputType, description, pinLabels), value in zip(Pins.schema, written)}}
+
+        # Records come back in order, so any Future older than this one lost its state to a full ring
+        with self.lock:
+            future = self.pending.pop(sequence, None) or self.backgroundPending.pop(sequence, None)
+            skipped = [self.pending.pop(older) for older in [older for older in self.pending if older < sequence]]
+        for lost in skipped:
+            lost.set_exception(RuntimeError("The state for this command was dropped"))
+        if future == None:
+            return
+        if status == ERROR:
+            future.set_exception(RuntimeError(result["error"]))
+        elif opcode == SETUP:
+            report = ChangeReport(result["success"], result["error"])
+            report.created, report.rebuilt, report.closed, report.unchanged = result["created"], result["rebuilt"], result["closed"], result["unchanged"]
+            future.set_result(report)
+        else:
+            future.set_result(result)
+
+    def failPending(self, reason):
+        with self.lock:
+            futures = list(self.pending.values()) + list(self.backgroundPending.values())
+            self.pending.clear()
+            self.backgroundPending.clear()
+        for future in futures:
+            future.set_exception(RuntimeError(reason))
+
+    def setContinuousValue(self, output, value):
+        """Queue a new value for a continuous output ("led" brightness or motor "speed"), coalesced by the controller"""
+        if output == "speed":
+            self.motorSpeed = value
+        elif output == "led":
+            self.ledBrightness = value
+        else:
+            raise ValueError(f"Unknown continuous output: {output}")
+        if self.running:
+            self.send(CONTINUOUS, continuousOutputs.index(output), 0, value)
+
+    def cancelReplay(self):
+        """Stop a replay that is in progress. The controller acts on this as soon as it reads it, not in command order"""
+        if self.running:
+            self.send(CANCEL_REPLAY)
+
+    def traceSpan(self, name, category, start=None, newTrace=False):
+        # Tracing is not carried across the process boundary
+        return nullSpan
+
+    def commandLatencyStats(self):
+        """Return recent latency from queueing a command to the controller applying it, in milliseconds"""
+        return latencySummary(self.applyLatencies)
+
+    def stateSnapshot(self):
+        """Return the newest state from the controller: the sequence number of the last command applied and the value
+        last written to each output, or None before the first command has been applied"""
+        return self.state
+
+if __name__ == "__main__":
+    # Measure the time from queueing a command to the controller process applying it, with a simulated arm
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure the queue to apply latency of a controller process fed through shared memory")
+    parser.add_argument("--commands", type=int, default=2000, help="number of drive / stop commands to send")
+    parser.add_argument("--interval", type=float, default=1.0, help="milliseconds between commands")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(message)s')
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+
+    arm = IsolatedArmControl(Pins.allEnabled(), 1, 1, logger, simulate=True)
+    arm.startExecutor()
+    try:
+        if not arm.submit("createGPIODevices").result(timeout=30):
+            raise SystemExit("Failed to create the simulated devices")
+        # The first commands include warming up, so only later ones are counted
+        arm.applyLatencies.clear()
+        futures = []
+        for i in range(args.commands):
+            futures.append(arm.submit("driveMotor", "claw", "extend") if i % 2 == 0 else arm.submit("stopMotor", "claw"))
+            time.sleep(args.interval / 1000)
+        for future in futures:
+            future.result(timeout=30)
+        print(json.dumps({"latency": arm.commandLatencyStats(), "state": arm.stateSnapshot()}, indent=2))
+    finally:
+        arm.stopExecutor()
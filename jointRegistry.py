@@ -0,0 +1,77 @@
+from enum import IntEnum
+
+class Direction(IntEnum):
+    """Directions a motor can be driven in"""
+    STOP = 0
+    FORWARD = 1
+    BACKWARD = 2
+
+# The directions as module constants. Looking a member up on the enum class costs more than the rest of a dictionary
+# look-up, so the hot path compares against these instead
+STOP = Direction.STOP
+FORWARD = Direction.FORWARD
+BACKWARD = Direction.BACKWARD
+
+# Direction each name used by the string based API drives a motor in
+directionsByName = {"extend": FORWARD, "left": FORWARD, "retract": BACKWARD, "right": BACKWARD}
+
+# Name recorded for a direction when a joint is driven by ID rather than by name, indexed by direction. A tuple is used
+# rather than a dictionary because enum members are hashed by a Python level method
+directionNames = ("", "extend", "retract")
+
+class Joint():
+    """Class used to store everything a command needs for one output, so the hot path is a single list index away
+
+    pins is the output's entry in the Pins object, shared rather than copied so changes to the pins are seen here.
+    device is the open gpiozero device, or None, and the counters are pre-bound so counting a command is one call.
+    written is the shadow of the device's state: the signed value last written to a motor or the brightness last written
+    to the LED, or None when it is not known, such as for a new device."""
+    __slots__ = ("id", "name", "description", "pinLabels", "pins", "device", "written", "driveCounter", "stopCounter", "issuedCounter", "suppressedCounter")
+
+    def __init__(self, jointId, name, description, pinLabels, pins):
+        self.id = jointId
+        self.name = name
+        self.description = description
+        self.pinLabels = pinLabels
+        self.pins = pins
+        self.device = None
+        self.written = None
+        self.driveCounter = None
+        self.stopCounter = None
+        self.issuedCounter = None
+        self.suppressedCounter = None
+
+class JointRegistry():
+    """Class used to hold the joint table built from the Pins schema, indexed by integer joint ID
+
+    IDs follow the schema order. Names are only looked up once, to turn them into IDs, so code that sends many commands
+    can resolve its joints up front and use the ID based methods of RobotArmControl."""
+    def __init__(self, pins, metrics=None):
+        self.joints = []
+        self.ids = {}
+        for jointId, (name, description, pinLabels) in enumerate(pins.schema):
+            joint = Joint(jointId, name, description, pinLabels, pins.pins[name])
+            if metrics != None:
+                joint.driveCounter = metrics.counter("robotarm_commands_total", joint=name, operation="drive")
+                joint.stopCounter = metrics.counter("robotarm_commands_total", joint=name, operation="stop")
+                joint.issuedCounter = metrics.counter("robotarm_gpio_writes_total", joint=name, result="issued")
+                joint.suppressedCounter = metrics.counter("robotarm_gpio_writes_total", joint=name, result="suppressed")
+            self.joints.append(joint)
+            self.ids[name] = jointId
+
+    def __getitem__(self, jointId):
+        return self.joints[jointId]
+
+    def __iter__(self):
+        return iter(self.joints)
+
+    def __len__(self):
+        return len(self.joints)
+
+    def jointId(self, name):
+        """Return the ID of a joint from its name, raising KeyError for an unknown joint"""
+        return self.ids[name]
+
+    def byName(self, name):
+        """Return the joint record for a name, raising KeyError for an unknown joint"""
+        return self.joints[self.ids[name]]
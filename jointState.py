@@ -0,0 +1,95 @@
+import numpy as np
+import threading
+import time
+
+class JointStateEstimator():
+    """Class used to estimate where each joint is by dead reckoning, from the speeds it has been commanded to run at
+
+    Each joint keeps the position it had at its last event and the velocity it has moved at since, so the state only
+    changes when a drive or stop is written and a position query is a single multiply-add. Positions are in travel units:
+    a joint run at full speed for one second moves by its travel rate, which defaults to 1 and can be calibrated to
+    degrees or millimetres. The state is held in NumPy arrays indexed by joint ID, so batches of joints, or the joints of
+    a whole fleet, can be updated and queried in one vectorized call. Travel rates must be above zero, as the time to
+    reach a limit is divided by them, so ValueError is raised for any other rate. Times default to time.monotonic(),
+    unless another clock, such as a simulator's, is passed in."""
+    def __init__(self, jointCount, travelRates=None, clock=None):
+        self.clock = time.monotonic if clock == None else clock
+        self.positions = np.zeros(jointCount)
+        self.velocities = np.zeros(jointCount)
+        self.since = np.full(jointCount, self.clock())
+        self.travelRates = np.ones(jointCount) if travelRates is None else np.asarray(travelRates, dtype=np.float64)
+        if not (self.travelRates > 0).all():
+            raise ValueError(f"Travel rates must be above zero: {self.travelRates.tolist()}")
+        self.lower = np.full(jointCount, -np.inf)
+        self.upper = np.full(jointCount, np.inf)
+
+        # Drives and ramp steps arrive from different threads
+        self.lock = threading.Lock()
+
+    def setLimits(self, jointId, lower=-np.inf, upper=np.inf):
+        """Set the soft limits of a joint, in travel units"""
+        if lower > upper:
+            raise ValueError(f"Lower limit {lower} is above upper limit {upper}")
+        with self.lock:
+            self.lower[jointId] = lower
+            self.upper[jointId] = upper
+
+    def setPosition(self, jointId, position, now=None):
+        """Set where a joint is, for example after driving it to a known end stop, keeping its current velocity"""
+        now = self.clock() if now == None else now
+        with self.lock:
+            self.positions[jointId] = position
+            self.since[jointId] = now
+
+    def position(self, jointId, now=None):
+        """Return the estimated position of one joint"""
+        now = self.clock() if now == None else now
+        return float(self.positions[jointId] + self.velocities[jointId] * (now - self.since[jointId]))
+
+    def allPositions(self, now=None):
+        """Return the estimated position of every joint as an array indexed by joint ID"""
+        now = self.clock() if now == None else now
+        return self.positions + self.velocities * (now - self.since)
+
+    def atLimit(self, jointId, speed, now=None):
+        """Return True if driving a joint at a signed speed would push it further past one of its soft limits"""
+        position = self.position(jointId, now)
+        return (speed > 0 and position >= self.upper[jointId]) or (speed < 0 and position <= self.lower[jointId])
+
+    def atLimits(self, jointIds, speeds, now=None):
+        """Vectorized atLimit, returning a boolean array for arrays of joint IDs and signed speeds"""
+        jointIds = np.asarray(jointIds, dtype=np.intp)
+        speeds = np.asarray(speeds, dtype=np.float64)
+        positions = self.allPositions(now)[jointIds]
+        return ((speeds > 0) & (positions >= self.upper[jointIds])) | ((speeds < 0) & (positions <= self.lower[jointIds]))
+
+    def setVelocity(self, jointId, speed, now=None):
+        """Record that a joint is now running at a signed speed between -1 and 1, returning the seconds until it reaches
+        the soft limit it is heading for, or infinity if it is stopped or has no limit in that direction"""
+        now = self.clock() if now == None else now
+        with self.lock:
+            position = self.positions[jointId] + self.velocities[jointId] * (now - self.since[jointId])
+            velocity = speed * self.travelRates[jointId]
+            self.positions[jointId] = position
+            self.velocities[jointId] = velocity
+            self.since[jointId] = now
+        if velocity > 0:
+            return max(0.0, float((self.upper[jointId] - position) / velocity))
+        if velocity < 0:
+            return max(0.0, float((self.lower[jointId] - position) / velocity))
+        return float("inf")
+
+    def setVelocities(self, jointIds, speeds, now=None):
+        """Vectorized setVelocity for arrays of unique joint IDs and signed speeds, returning an array of times to limit"""
+        now = self.clock() if now == None else now
+        jointIds = np.asarray(jointIds, dtype=np.intp)
+        with self.lock:
+            positions = self.positions[jointIds] + self.velocities[jointIds] * (now - self.since[jointIds])
+            velocities = np.asarray(speeds, dtype=np.float64) * self.travelRates[jointIds]
+            self.positions[jointIds] = positions
+            self.velocities[jointIds] = velocities
+            self.since[jointIds] = now
+        with np.errstate(divide="ignore", invalid="ignore"):
+            times = np.where(velocities > 0, (self.upper[jointIds] - positions) / velocities,
+                             np.where(velocities < 0, (self.lower[jointIds] - positions) / velocities, np.inf))
+        return np.maximum(times, 0.0)
@@ -0,0 +1,179 @@
+from functools import lru_cache
+import numpy as np
+
+# Link lengths in millimetres: height of the shoulder pivot above the base, shoulder to elbow, elbow to wrist, and wrist
+# to the tip of the claw. Rough figures for the arm in the article, to be measured on the real arm
+defaultLinkLengths = (70.0, 90.0, 110.0, 80.0)
+
+# Joint limits in degrees, matching the end stops of the simulated arm. Zero on every joint is the arm pointing straight
+# up, facing along x, and positive angles lean the arm outwards and turn it anticlockwise seen from above
+defaultJointLimits = {"rotate": (-135.0, 135.0), "shoulder": (-90.0, 90.0), "elbow": (-150.0, 150.0), "wrist": (-60.0, 60.0)}
+
+# Degrees each joint turns in one second at full speed, matching the simulated arm, used to time moves to a target
+defaultTravelRates = {"rotate": 20.0, "shoulder": 15.0, "elbow": 15.0, "wrist": 20.0}
+
+# Order of the joints in every angle array
+kinematicJoints = ("rotate", "shoulder", "elbow", "wrist")
+
+def planarPosition(linkLengths, shoulder, elbow, wrist):
+    """Return the radial distance and height of the claw tip for arrays of shoulder, elbow and wrist angles in radians"""
+    baseHeight, upperArm, forearm, hand = linkLengths
+    a1 = shoulder
+    a2 = a1 + elbow
+    a3 = a2 + wrist
+    radial = upperArm * np.sin(a1) + forearm * np.sin(a2) + hand * np.sin(a3)
+    height = baseHeight + upperArm * np.cos(a1) + forearm * np.cos(a2) + hand * np.cos(a3)
+    return radial, height
+
+@lru_cache(maxsize=8)
+def workspaceIndex(linkLengths, limits, resolution, cellSize):
+    """Return a voxel index of the arm's reach in the vertical plane, built from forward kinematics samples
+
+    Shoulder, elbow and wrist are sampled every resolution degrees and each sample's claw position is placed in a grid
+    of cellSize millimetre cells of radial distance and height. Each cell keeps the sample nearest its centre with the
+    elbow bent each way, as the two poses lead to different solutions near the joint limits, and empty cells are filled
+    from their nearest filled neighbour, so any point has its initial guesses one array look-up away. Indexes are cached,
+    so only the first solve with a set of link lengths pays to build one.
+
+    Returns the (shoulder, elbow, wrist) angles of the kept samples in radians, a table of indexes into them with one
+    layer per elbow pose, and the radial distance and height of the grid's first cell. Raises ValueError if the limits
+    leave nothing to sample."""
+    axes = [np.radians(np.arange(lower, upper + resolution / 2, resolution)) for lower, upper in limits]
+    shoulder, elbow, wrist = (grid.ravel() for grid in np.meshgrid(*axes, indexing="ij"))
+    radial, height = planarPosition(linkLengths, shoulder, elbow, wrist)
+
+    reach = sum(linkLengths[1:])
+    origin = (-reach - cellSize, linkLengths[0] - reach - cellSize)
+    shape = (int(2 * (reach + cellSize) / cellSize) + 1, int(2 * (reach + cellSize) / cellSize) + 1)
+    cellR = ((radial - origin[0]) / cellSize).astype(np.intp)
+    cellZ = ((height - origin[1]) / cellSize).astype(np.intp)
+
+    # Keep the sample nearest each cell's centre: sort by distance, then take the first sample seen in each cell. The
+    # elbow pose is folded into the cell number so each pose keeps its own sample
+    distance = np.hypot(radial - (origin[0] + (cellR + 0.5) * cellSize), height - (origin[1] + (cellZ + 0.5) * cellSize))
+    order = np.argsort(distance, kind="stable")
+    cells = ((elbow[order] < 0) * shape[0] + cellR[order]) * shape[1] + cellZ[order]
+    cells, first = np.unique(cells, return_index=True)
+    kept = order[first]
+    table = np.full(2 * shape[0] * shape[1], -1, dtype=np.intp)
+    table[cells] = np.arange(len(kept))
+    table = table.reshape((2,) + shape)
+
+    # Joint limits that only let the elbow bend one way leave one layer without samples, so it shares the other's guesses
+    seeded = (table >= 0).any(axis=(1, 2))
+    if not seeded.any():
+        raise ValueError(f"The joint limits {limits} leave no positions to sample")
+    for layer in np.flatnonzero(~seeded):
+        table[layer] = table[1 - layer]
+
+    # Fill empty cells from filled neighbours, one ring at a time, so targets out of reach get the nearest reachable guess
+    while (table < 0).any():
+        for source, target in (((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+                               ((slice(None), slice(1, None)), (slice(None), slice(None, -1))),
+                               ((slice(None), slice(None), slice(None, -1)), (slice(None), slice(None), slice(1, None))),
+                               ((slice(None), slice(None), slice(1, None)), (slice(None), slice(None), slice(None, -1)))):
+            shifted = table[source]
+            empty = table[target] < 0
+            table[target][empty] = shifted[empty]
+
+    angles = np.stack([shoulder[kept], elbow[kept], wrist[kept]], axis=1)
+    angles.setflags(write=False)
+    table.setflags(write=False)
+    return angles, table, origin
+
+class ArmKinematics():
+    """Class used to turn claw positions into joint angles for the rotate, shoulder, elbow and wrist joints
+
+    solve() looks each target up in a cached workspace index for an initial guess, then polishes it with a few damped
+    least squares steps. Every step works on arrays of targets, so solving many targets costs little more than one."""
+    def __init__(self, linkLengths=defaultLinkLengths, jointLimits=defaultJointLimits, resolution=5.0, cellSize=5.0, iterations=30, tolerance=0.01, damping=1.0, maxStep=20.0):
+        self.linkLengths = tuple(float(length) for length in linkLengths)
+        self.jointLimits = tuple(tuple(float(limit) for limit in jointLimits[joint]) for joint in kinematicJoints)
+        self.limits = np.radians(self.jointLimits)
+        self.resolution = resolution
+        self.cellSize = cellSize
+        self.iterations = iterations
+        self.tolerance = tolerance
+        self.damping = damping
+        self.maxStep = maxStep
+
+    def index(self):
+        return workspaceIndex(self.linkLengths, self.jointLimits[1:], self.resolution, self.cellSize)
+
+    def forward(self, angles):
+        """Return claw positions, as rows of (x, y, z), for rows of (rotate, shoulder, elbow, wrist) angles in degrees"""
+        angles = np.radians(np.atleast_2d(np.asarray(angles, dtype=np.float64)))
+        radial, height = planarPosition(self.linkLengths, angles[:, 1], angles[:, 2], angles[:, 3])
+        return np.stack([radial * np.cos(angles[:, 0]), radial * np.sin(angles[:, 0]), height], axis=1)
+
+    def solve(self, targets):
+        """Return joint angles in degrees, as rows of (rotate, shoulder, elbow, wrist), for rows of (x, y, z) targets in
+        millimetres, along with the distance left between each target and the claw, which is large if it is out of reach"""
+        targets = np.atleast_2d(np.asarray(targets, dtype=np.float64))
+        x, y, z = targets[:, 0], targets[:, 1], targets[:, 2]
+
+        # Turn the base to face the target. Targets behind the arm are reached by leaning backwards instead, when facing
+        # them directly would turn the base past its limits
+        rotate = np.arctan2(y, x)
+        radial = np.hypot(x, y)
+        behind = (rotate < self.limits[0, 0]) | (rotate > self.limits[0, 1])
+        rotate = np.where(behind, rotate - np.copysign(np.pi, rotate), rotate)
+        radial = np.where(behind, -radial, radial)
+
+        # Initial guesses from the workspace index, one per elbow pose, refined side by side as one array of 2N rows
+        samples, table, origin = self.index()
+        cellR = np.clip(((radial - origin[0]) / self.cellSize).astype(np.intp), 0, table.shape[1] - 1)
+        cellZ = np.clip(((z - origin[1]) / self.cellSize).astype(np.intp), 0, table.shape[2] - 1)
+        joints = samples[table[:, cellR, cellZ].ravel()]
+        count = len(targets)
+        radial = np.tile(radial, 2)
+        z = np.tile(z, 2)
+
+        # Damped least squares refinement of the shoulder, elbow and wrist, clamped to their limits after each step. A
+        # target is dropped from the arrays once either of its poses is within tolerance, usually after two or three
+        # steps, so the few that are slow to settle do not hold up the rest of a batch
+        baseHeight, upperArm, forearm, hand = self.linkLengths
+        lambdaSquared = self.damping * self.damping
+        toleranceSquared = self.tolerance * self.tolerance
+        active = np.arange(2 * count)
+        done = np.zeros(2 * count, dtype=bool)
+        for _ in range(self.iterations):
+            guesses = joints[active]
+            a1 = guesses[:, 0]
+            a2 = a1 + guesses[:, 1]
+            a3 = a2 + guesses[:, 2]
+            errorR = radial[active] - (upperArm * np.sin(a1) + forearm * np.sin(a2) + hand * np.sin(a3))
+            errorZ = z[active] - (baseHeight + upperArm * np.cos(a1) + forearm * np.cos(a2) + hand * np.cos(a3))
+            distanceSquared = errorR * errorR + errorZ * errorZ
+            done[active[distanceSquared < toleranceSquared]] = True
+            keep = ~(done[active] | done[(active + count) % (2 * count)])
+            if not keep.any():
+                break
+            active, guesses, errorR, errorZ = active[keep], guesses[keep], errorR[keep], errorZ[keep]
+            a1, a2, a3, distanceSquared = a1[keep], a2[keep], a3[keep], distanceSquared[keep]
+            # Far from the target the linearisation is poor, so each step aims at most maxStep millimetres along the way
+            scale = np.minimum(1.0, self.maxStep / np.sqrt(distanceSquared))
+            errorR *= scale
+            errorZ *= scale
+            # Jacobian rows: how the radial distance and height change with each joint
+            c3, c2 = hand * np.cos(a3), forearm * np.cos(a2)
+            s3, s2 = hand * np.sin(a3), forearm * np.sin(a2)
+            jacobianR = np.stack([upperArm * np.cos(a1) + c2 + c3, c2 + c3, c3], axis=1)
+            jacobianZ = -np.stack([upperArm * np.sin(a1) + s2 + s3, s2 + s3, s3], axis=1)
+            # Solve (J J^T + lambda^2 I) w = e for each target with the closed form 2x2 inverse, then step by J^T w
+            rr = (jacobianR * jacobianR).sum(axis=1) + lambdaSquared
+            rz = (jacobianR * jacobianZ).sum(axis=1)
+            zz = (jacobianZ * jacobianZ).sum(axis=1) + lambdaSquared
+            determinant = rr * zz - rz * rz
+            weightR = (zz * errorR - rz * errorZ) / determinant
+            weightZ = (rr * errorZ - rz * errorR) / determinant
+            guesses += jacobianR * weightR[:, None] + jacobianZ * weightZ[:, None]
+            joints[active] = np.clip(guesses, self.limits[1:, 0], self.limits[1:, 1])
+
+        # Keep whichever pose ended up nearer each target
+        errorR, errorZ = planarPosition(self.linkLengths, joints[:, 0], joints[:, 1], joints[:, 2])
+        errors = np.hypot(radial - errorR, z - errorZ).reshape(2, count)
+        pose = np.argmin(errors, axis=0)
+        rows = np.arange(count)
+        joints = joints.reshape(2, count, 3)[pose, rows]
+        return np.degrees(np.column_stack([rotate, joints])), errors[pose, rows]
@@ -0,0 +1,128 @@
+from bisect import bisect_left
+import threading
+
+# Default histogram bucket upper bounds in seconds, from 10 microseconds (a local GPIO write) to 1 second (a struggling remote link)
+latencyBuckets = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+class Counter():
+    """Class used to store a single counter value"""
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+class Histogram():
+    """Class used to count observations into fixed buckets, keeping a running sum and count"""
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One count per bucket plus a final count for observations above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+class MetricsRegistry():
+    """Class used to hold counters and histograms keyed by name and labels, with snapshot and Prometheus text output"""
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.descriptions = {}
+        self.lock = threading.Lock()
+
+    def describe(self, name, description):
+        """Set the help text used for a metric in the Prometheus output"""
+        self.descriptions[name] = description
+
+    def counter(self, name, **labels):
+        """Return the counter for a name and set of labels, creating it on first use"""
+        key = (name, tuple(sorted(labels.items())))
+        counter = self.counters.get(key)
+        if counter == None:
+            with self.lock:
+                counter = self.counters.setdefault(key, Counter())
+        return counter
+
+    def histogram(self, name, buckets=latencyBuckets, **labels):
+        """Return the histogram for a name and set of labels, creating it on first use"""
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram == None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def snapshot(self):
+        """Return a copy of every metric as plain dictionaries and lists"""
+        snapshot = {"counters": {}, "histograms": {}}
+        for (name, labels), counter in list(self.counters.items()):
+            snapshot["counters"].setdefault(name, []).append({"labels": dict(labels), "value": counter.value})
+        for (name, labels), histogram in list(self.histograms.items()):
+            with histogram.lock:
+                entry = {"labels": dict(labels), "buckets": list(histogram.buckets), "counts": list(histogram.counts), "sum": histogram.sum, "count": histogram.count}
+            snapshot["histograms"].setdefault(name, []).append(entry)
+        return snapshot
+
+    def prometheusText(self):
+        """Return every metric in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, entries in sorted(snapshot["counters"].items()):
+            if name in self.descriptions:
+                lines.append(f"# HELP {name} {self.descriptions[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for entry in entries:
+                lines.append(f"{name}{formatLabels(entry['labels'])} {entry['value']}")
+        for name, entries in sorted(snapshot["histograms"].items()):
+            if name in self.descriptions:
+                lines.append(f"# HELP {name} {self.descriptions[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for entry in entries:
+                # Prometheus buckets are cumulative
+                cumulative = 0
+                for bound, count in zip(entry["buckets"] + ["+Inf"], entry["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{formatLabels(entry['labels'], le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{formatLabels(entry['labels'])} {entry['sum']}")
+                lines.append(f"{name}_count{formatLabels(entry['labels'])} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+def latencySummary(samples, scale=1000):
+    """Summarise latency samples as their count, mean, median, 99th percentile and maximum
+
+    Every figure except the count is multiplied by scale. The default turns seconds into milliseconds."""
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples) * scale,
+        "p50": samples[len(samples) // 2] * scale,
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * scale,
+        "max": samples[-1] * scale,
+    }
+
+def formatLabels(labels, **extra):
+    """Format labels as {name="value",...}, or an empty string if there are none. Backslashes, double quotes and
+    newlines in values are escaped, as the Prometheus text format requires"""
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escapeLabelValue(value)}"' for key, value in labels.items()) + "}"
+
+def escapeLabelValue(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,417 @@
+from jointRegistry import directionsByName
+from metrics import latencySummary
+from robotArmControl import Pins, motorTypesList
+import os
+import time
+
+# Macros are kept in a single text file, with one "macro <name>" ... "end" block per macro
+defaultMacrosPath = os.path.join(os.path.expanduser("~"), ".robotArmMacros")
+
+# Opcodes of compiled instructions. WAIT moves the schedule on, LOOP and END repeat a block, and the rest act on the arm
+DRIVE, STOP, STOP_ALL, LED, LED_OFF, SPEED, WAIT, LOOP, END = range(9)
+
+# Names of the opcodes that act on the arm, for timing reports
+opcodeNames = ["drive", "stop", "stop all", "led", "led off", "speed"]
+
+# The most steps a macro can take. Its timing arrays are allocated before it runs, so nested repeats that would take
+# more are rejected when it is compiled
+maxStepCount = 1000000
+
+# Joint IDs as RobotArmControl numbers its joints, in Pins.schema order
+jointIds = {name: jointId for jointId, (name, description, pinLabels) in enumerate(Pins.schema)}
+
+class MacroError(ValueError):
+    """Raised when macros cannot be compiled. Every problem found is listed with its line number, not just the first"""
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__("Invalid macros: " + "; ".join(problems))
+
+class MacroProgram():
+    """Class used to hold a macro compiled to a flat list of instructions
+
+    Each instruction is an (opcode, a, b, value, name) tuple, built once when the macro is compiled so running it only
+    indexes and unpacks them. For DRIVE, a is the joint ID, b the Direction, value the speed (None for the arm's speed)
+    and name the direction's name. STOP takes a joint ID, LED and SPEED a value and WAIT a number of nanoseconds. LOOP
+    sets loop counter a to b, and END jumps back to instruction b until loop counter a runs out. Loop counts are fixed,
+    so the number of steps a run takes, and the memory to time them, is known before it starts."""
+    def __init__(self, name, instructions, sources, loopCount, stepCount, jointIds):
+        self.name = name
+        self.instructions = instructions
+        # The line number and text each instruction was compiled from
+        self.sources = sources
+        self.loopCount = loopCount
+        self.stepCount = stepCount
+        # Joints the macro drives, which are stopped if it is cancelled or fails
+        self.jointIds = jointIds
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def duration(self):
+        """Return the seconds a run is scheduled to take"""
+        total = 0
+        counters = [0] * self.loopCount
+        pc = 0
+        while pc < len(self.instructions):
+            opcode, a, b, value, name = self.instructions[pc]
+            pc += 1
+            if opcode == WAIT:
+                total += a
+            elif opcode == LOOP:
+                counters[a] = b
+            elif opcode == END:
+                counters[a] -= 1
+                if counters[a]:
+                    pc = b
+        return total / 1e9
+
+def parseNumber(text, lineNumber, description, low, high=None):
+    """Turn a word into a float, raising MacroError if it is not a number in range"""
+    try:
+        number = float(text)
+    except ValueError:
+        raise MacroError([f"line {lineNumber}: {description} is not a number: {text!r}"])
+    if number < low or (high != None and number > high):
+        limits = f"between {low:g} and {high:g}" if high != None else f"at least {low:g}"
+        raise MacroError([f"line {lineNumber}: {description} must be {limits}: {text}"])
+    return number
+
+def parseStep(words, lineNumber):
+    """Turn the words of one statement into an instruction and the nanoseconds it lasts, or None, raising MacroError
+
+    Statements are "<joint> <direction> [<speed>] [for <milliseconds>]", "<joint> stop", "stop", "led <brightness>",
+    "led off", "speed <value>" and "wait <milliseconds>"."""
+    if words == ["stop"]:
+        return (STOP_ALL, 0, 0, None, ""), None
+    if len(words) < 2:
+        raise MacroError([f"line {lineNumber}: unknown statement: {' '.join(words)!r}"])
+    name, argument = words[0], words[1]
+    if name in ("led", "speed", "wait") and len(words) != 2:
+        raise MacroError([f"line {lineNumber}: expected two words: {' '.join(words)!r}"])
+    if name == "led":
+        if argument == "off":
+            return (LED_OFF, 0, 0, None, ""), None
+        return (LED, 0, 0, parseNumber(argument, lineNumber, "brightness", 0, 1), ""), None
+    if name == "speed":
+        return (SPEED, 0, 0, parseNumber(argument, lineNumber, "speed", 0, 1), ""), None
+    if name == "wait":
+        return (WAIT, int(parseNumber(argument, lineNumber, "wait", 0) * 1e6), 0, None, ""), None
+    if name not in motorTypesList:
+        raise MacroError([f"line {lineNumber}: unknown joint: {name!r}"])
+    if argument == "stop":
+        if len(words) != 2:
+            raise MacroError([f"line {lineNumber}: expected two words: {' '.join(words)!r}"])
+        return (STOP, jointIds[name], 0, None, ""), None
+    if argument not in directionsByName:
+        raise MacroError([f"line {lineNumber}: unknown direction: {argument!r}"])
+    rest = words[2:]
+    speed = None
+    duration = None
+    if rest and rest[0] != "for":
+        speed = parseNumber(rest.pop(0), lineNumber, "speed", 0, 1)
+    if rest:
+        if rest[0] != "for" or len(rest) != 2:
+            raise MacroError([f"line {lineNumber}: expected \"for <milliseconds>\": {' '.join(words)!r}"])
+        duration = int(parseNumber(rest[1], lineNumber, "duration", 0) * 1e6)
+    return (DRIVE, jointIds[name], directionsByName[argument], speed, argument), duration
+
+def parseMacros(text):
+    """Split macro source into the body of each macro, as a tree of statements, raising MacroError if it is invalid
+
+    A body is a list of nodes: ("step", lineNumber, text, instruction, duration), ("repeat", lineNumber, text, count,
+    body), ("parallel", lineNumber, text, body) and ("call", lineNumber, text, name)."""
+    macros = {}
+    problems = []
+    # Blocks still open, innermost last, as (node, body)
+    stack = []
+    for lineNumber, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        words = line.split()
+        if not words:
+            continue
+        try:
+            if words[0] == "macro":
+                if stack:
+                    raise MacroError([f"line {lineNumber}: macro {stack[0][0][2]!r} has no end"])
+                if len(words) != 2:
+                    raise MacroError([f"line {lineNumber}: expected \"macro <name>\": {line!r}"])
+                if words[1] in macros:
+                    raise MacroError([f"line {lineNumber}: macro {words[1]!r} is defined twice"])
+                macros[words[1]] = []
+                stack.append((("macro", lineNumber, words[1]), macros[words[1]]))
+            elif not stack:
+                raise MacroError([f"line {lineNumber}: statement outside a macro: {line!r}"])
+            elif words == ["end"]:
+                stack.pop()
+            elif words[0] == "repeat":
+                # An invalid block is still opened, so its end closes it rather than the block around it
+                count = int(words[1]) if len(words) == 2 and words[1].isdigit() else 0
+                body = []
+                stack[-1][1].append(("repeat", lineNumber, line, count, body))
+                stack.append((stack[-1][1][-1], body))
+                if count < 1:
+                    raise MacroError([f"line {lineNumber}: expected \"repeat <count>\" with a count of at least 1: {line!r}"])
+            elif words == ["parallel"]:
+                nested = stack[-1][0][0] == "parallel"
+                body = []
+                stack[-1][1].append(("parallel", lineNumber, line, body))
+                stack.append((stack[-1][1][-1], body))
+                if nested:
+                    raise MacroError([f"line {lineNumber}: parallel blocks cannot be nested"])
+            elif words[0] == "call":
+                if len(words) != 2:
+                    raise MacroError([f"line {lineNumber}: expected \"call <macro>\": {line!r}"])
+                stack[-1][1].append(("call", lineNumber, line, words[1]))
+            else:
+                instruction, duration = parseStep(words, lineNumber)
+                stack[-1][1].append(("step", lineNumber, line, instruction, duration))
+        except MacroError as error:
+            problems.extend(error.problems)
+    if stack:
+        problems.append(f"macro {stack[0][0][2]!r} has no end")
+    if problems:
+        raise MacroError(problems)
+    return macros
+
+class MacroCompiler():
+    """Class used to flatten parsed macros into MacroPrograms
+
+    Loops become LOOP and END instructions around their body, and a parallel block becomes its steps in start time order
+    with WAITs between them, so the interpreter never needs to look ahead. Called macros are copied in place. A macro
+    that would take more than maxStepCount steps is rejected."""
+    def __init__(self, macros, maxStepCount=maxStepCount):
+        self.macros = macros
+        self.maxStepCount = maxStepCount
+
+    def compile(self, name):
+        """Compile one macro, raising MacroError if it calls a macro that does not exist or calls itself, or takes too
+        many steps"""
+        self.instructions = []
+        self.sources = []
+        self.loopCount = 0
+        self.stepCount = 0
+        self.jointIds = set()
+        self.problems = []
+        self.emitBody(self.macros[name], 1, [name])
+        if self.stepCount > self.maxStepCount:
+            self.problems.append(f"macro {name!r} takes {self.stepCount} steps, more than the limit of {self.maxStepCount}")
+        if self.problems:
+            raise MacroError(self.problems)
+        return MacroProgram(name, self.instructions, self.sources, self.loopCount, self.stepCount, sorted(self.jointIds))
+
+    def emit(self, instruction, lineNumber, text, repeats):
+        self.instructions.append(instruction)
+        self.sources.append((lineNumber, text))
+        if instruction[0] not in (WAIT, LOOP, END):
+            self.stepCount += repeats
+        if instruction[0] == DRIVE:
+            self.jointIds.add(instruction[1])
+
+    def emitBody(self, body, repeats, callStack):
+        """Append the instructions for a body that runs repeats times in total"""
+        for node in body:
+            kind, lineNumber, text = node[:3]
+            if kind == "step":
+                instruction, duration = node[3:]
+                self.emit(instruction, lineNumber, text, repeats)
+                if duration != None:
+                    self.emit((WAIT, duration, 0, None, ""), lineNumber, text, repeats)
+                    self.emit((STOP, instruction[1], 0, None, ""), lineNumber, text, repeats)
+            elif kind == "repeat":
+                count, repeatBody = node[3:]
+                slot = self.loopCount
+                self.loopCount += 1
+                self.emit((LOOP, slot, count, None, ""), lineNumber, text, repeats)
+                start = len(self.instructions)
+                self.emitBody(repeatBody, repeats * count, callStack)
+                self.emit((END, slot, start, None, ""), lineNumber, text, repeats)
+            elif kind == "parallel":
+                self.emitParallel(node[3], lineNumber, repeats)
+            elif kind == "call":
+                name = node[3]
+                if name not in self.macros:
+                    self.problems.append(f"line {lineNumber}: unknown macro: {name!r}")
+                elif name in callStack:
+                    self.problems.append(f"line {lineNumber}: macro {name!r} calls itself")
+                else:
+                    self.emitBody(self.macros[name], repeats, callStack + [name])
+
+    def emitParallel(self, body, lineNumber, repeats):
+        """Append a parallel block: every step starts together, each timed move stops on its own, and the block lasts
+        as long as its longest move"""
+        events = []
+        for node in body:
+            if node[0] != "step" or node[3][0] == WAIT:
+                self.problems.append(f"line {node[1]}: only moves, stops and LED steps can be in a parallel block")
+                continue
+            instruction, duration = node[3:]
+            events.append((0, len(events), instruction, node[1], node[2]))
+            if duration != None:
+                events.append((duration, len(events), (STOP, instruction[1], 0, None, ""), node[1], node[2]))
+        # Sorting on the offset, then the order written, keeps steps that start together in the order given
+        events.sort()
+        offset = 0
+        for eventOffset, order, instruction, eventLine, text in events:
+            if eventOffset > offset:
+                self.emit((WAIT, eventOffset - offset, 0, None, ""), eventLine, text, repeats)
+                offset = eventOffset
+            self.emit(instruction, eventLine, text, repeats)
+
+def compileMacros(text):
+    """Compile every macro in some source text, returning MacroPrograms by name. Raises MacroError listing every problem"""
+    macros = parseMacros(text)
+    compiler = MacroCompiler(macros)
+    programs = {}
+    problems = []
+    for name in macros:
+        try:
+            programs[name] = compiler.compile(name)
+        except MacroError as error:
+            problems.extend(error.problems)
+    if problems:
+        raise MacroError(problems)
+    return programs
+
+def loadMacros(path=defaultMacrosPath):
+    """Compile every macro in a file, raising MacroError if the file cannot be read or is invalid"""
+    try:
+        with open(path) as macrosFile:
+            text = macrosFile.read()
+    except OSError as error:
+        raise MacroError([f"cannot read {path}: {error.strerror}"])
+    return compileMacros(text)
+
+class MacroInterpreter():
+    """Class used to run a MacroProgram against a RobotArmControl object on a time.monotonic_ns() schedule
+
+    Each step is due at the run's start time plus the WAITs before it, so lateness on one step is never carried forward.
+    It sleeps until spinTime before a step is due, then spins on the clock. The timing arrays are allocated before the
+    run starts, so the loop itself does no parsing, look-ups by name or list growth."""
+    def __init__(self, robotArmControl, program, spinTime=0.002):
+        self.robotArmControl = robotArmControl
+        self.program = program
+        self.spinTimeNs = int(spinTime * 1e9)
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop the run before the next step, stopping the joints the macro drives"""
+        self.cancelled = True
+
+    def play(self):
+        """Run the program and return a report of the timing error of each instruction
+
+        Each step is submitted as a command of its own, so commands from elsewhere can run between the steps of a run."""
+        submit = self.robotArmControl.submit
+        instructions = self.program.instructions
+        end = len(instructions)
+        counters = [0] * self.program.loopCount
+        executed = [0] * self.program.stepCount
+        errors = [0] * self.program.stepCount
+        steps = 0
+        spinTimeNs = self.spinTimeNs
+        # Local names for the clock functions, as they are called several times per step
+        clock = time.monotonic_ns
+        sleep = time.sleep
+
+        finished = False
+        pc = 0
+        target = clock()
+        try:
+            while pc < end:
+                opcode, a, b, value, name = instructions[pc]
+                pc += 1
+                if opcode == WAIT:
+                    target += a
+                    continue
+                if opcode == LOOP:
+                    counters[a] = b
+                    continue
+                if opcode == END:
+                    counters[a] -= 1
+                    if counters[a]:
+                        pc = b
+                    continue
+                if self.cancelled:
+                    break
+
+                remaining = target - clock()
+                if remaining > spinTimeNs:
+                    sleep((remaining - spinTimeNs) / 1e9)
+                issued = clock()
+                while issued < target:
+                    issued = clock()
+
+                if opcode == DRIVE:
+                    # A speed given with the move only applies to it
+                    submit("driveJoint", a, b, name, value)
+                elif opcode == STOP:
+                    submit("stopJoint", a)
+                elif opcode == STOP_ALL:
+                    submit("stopMotors")
+                elif opcode == LED:
+                    submit("setLedBrightness", value)
+                elif opcode == LED_OFF:
+                    submit("stopLed")
+                elif opcode == SPEED:
+                    submit("writeContinuousValue", "speed", value)
+                executed[steps] = pc - 1
+                errors[steps] = issued - target
+                steps += 1
+            finished = not self.cancelled
+        finally:
+            if not finished:
+                for jointId in self.program.jointIds:
+                    submit("stopJoint", jointId)
+        return self.report(executed, errors, steps)
+
+    def report(self, executed, errors, steps):
+        """Summarise the timing error, in milliseconds, of the steps run and of each instruction"""
+        counts = {}
+        totals = {}
+        maxima = {}
+        for index, error in zip(executed[:steps], errors[:steps]):
+            counts[index] = counts.get(index, 0) + 1
+            totals[index] = totals.get(index, 0) + error
+            maxima[index] = max(maxima.get(index, 0), error)
+        instructions = []
+        for index in sorted(counts):
+            lineNumber, text = self.program.sources[index]
+            instructions.append({"index": index, "operation": opcodeNames[self.program.instructions[index][0]], "line": lineNumber, "text": text, "count": counts[index], "mean": totals[index] / counts[index] / 1e6, "max": maxima[index] / 1e6})
+        summary = latencySummary(errors[:steps], 1e-6)
+        summary["steps"] = summary.pop("count")
+        summary["cancelled"] = self.cancelled
+        return {"summary": summary, "instructions": instructions}
+
+if __name__ == "__main__":
+    # Compile a macro file and run one of its macros against a simulated arm, printing the timing error of each instruction
+    from robotArmControl import RobotArmControl
+    from simulatedArm import ArmSimulator
+    import logging
+    import sys
+
+    logging.basicConfig(format='%(asctime)s %(message)s')
+    logger = logging.getLogger()
+    logger.setLevel(logging.WARNING)
+
+    if len(sys.argv) < 3:
+        raise SystemExit("Usage: motionMacros.py <macros file> <macro name>")
+    try:
+        programs = loadMacros(sys.argv[1])
+    except MacroError as error:
+        raise SystemExit(str(error))
+    if sys.argv[2] not in programs:
+        raise SystemExit(f"No macro named {sys.argv[2]!r}")
+
+    simulator = ArmSimulator(logger)
+    simulator.startRealTime()
+    a = RobotArmControl(Pins.allEnabled(), 1, 1, logger, simulator=simulator)
+    a.createGPIODevices()
+    program = programs[sys.argv[2]]
+    print(f"{program.name}: {len(program)} instructions, {program.stepCount} steps over {program.duration():.3f} s")
+    report = a.runMacro(program)
+    for instruction in report["instructions"]:
+        print(f"line {instruction['line']:4}  {instruction['operation']:8} {instruction['text']:32} x{instruction['count']:<5} mean {instruction['mean']:.4f} ms  max {instruction['max']:.4f} ms")
+    print(report["summary"])
+    print(simulator.jointPositions())
+    simulator.stop()
+    a.closeAllGPIO()
@@ -0,0 +1,168 @@
+from functools import lru_cache
+import numpy as np
+import threading
+import time
+
+@lru_cache(maxsize=256)
+def rampTable(kind, startSpeed, endSpeed, rampTime, rate):
+    """Return a read-only NumPy table of signed motor values, one per scheduler tick, ramping from startSpeed to endSpeed
+
+    "trapezoid" ramps at constant acceleration. "scurve" uses a smootherstep curve, so acceleration also starts and ends
+    at zero, which avoids the current spike of a sudden change in acceleration. Tables are cached, so repeated moves
+    with the same speeds and ramp time cost nothing to plan."""
+    steps = max(1, int(round(rampTime * rate)))
+    position = np.arange(1, steps + 1, dtype=np.float64) / steps
+    if kind == "trapezoid":
+        shape = position
+    elif kind == "scurve":
+        shape = position * position * position * (position * (position * 6 - 15) + 10)
+    else:
+        raise ValueError(f"Unknown profile: {kind}")
+    table = startSpeed + (endSpeed - startSpeed) * shape
+    table.setflags(write=False)
+    return table
+
+def profileFor(kind, startSpeed, endSpeed, rampTime, rate):
+    """Look up a ramp table, rounding speeds so near-identical moves share a cached table"""
+    return rampTable(kind, round(startSpeed, 3), round(endSpeed, 3), round(rampTime, 3), rate)
+
+class ProfileScheduler():
+    """Class used to play ramp tables out at a fixed rate on a single thread, for every joint at once
+
+    lock can be a threading.RLock shared with the code that owns the motors, so ramp writes are serialized with its own
+    writes. It must be reentrant, as cancel() and start() may be called while it is held.
+
+    A clock, such as a simulator's, can be passed in place of the wall clock. No thread is started then, and ticks run
+    as whatever owns the clock calls advanceTo(), which it can time with nextDeadline()."""
+    def __init__(self, writeFunction, logger, rate=100, lock=None, clock=None):
+        self.writeFunction = writeFunction
+        self.logger = logger
+        self.rate = rate
+        self.period = 1 / rate
+
+        # Ramp being played for each joint: [table, index of the next value, callback when finished]
+        self.ramps = {}
+        self.lock = lock if lock != None else threading.Lock()
+        self.wake = threading.Event()
+
+        # Timing statistics: ticks run, and how late each tick started compared with its schedule
+        self.ticks = 0
+        self.activeTime = 0.0
+        self.lateness = np.zeros(1000)
+        self.running = True
+
+        # With a clock passed in, the time of the next tick, set when a ramp starts while the scheduler is idle
+        self.clock = clock
+        self.nextTickTime = None
+        self.thread = None
+        if clock == None:
+            self.thread = threading.Thread(target=self.run, name="ProfileScheduler", daemon=True)
+            self.thread.start()
+
+    def start(self, joint, table, onDone=None):
+        """Start playing a ramp table for a joint, replacing any ramp already playing for it"""
+        with self.lock:
+            if self.clock != None and not self.ramps:
+                self.nextTickTime = self.clock()
+            self.ramps[joint] = [table, 0, onDone]
+        self.wake.set()
+
+    def ramp(self, joint, kind, startValue, target, rampTime, onDone=None):
+        """Ramp a joint to a target value over rampTime seconds with a "trapezoid" or "scurve" profile. The ramp starts
+        from where the joint's current ramp has reached, if it is part way through one, or else from startValue"""
+        current = self.currentValue(joint)
+        self.start(joint, profileFor(kind, startValue if current == None else current, target, rampTime, self.rate), onDone)
+
+    def cancel(self, joint):
+        """Stop playing the ramp for a joint, leaving the motor at its last value"""
+        with self.lock:
+            self.ramps.pop(joint, None)
+
+    def currentValue(self, joint):
+        """Return the last value written for a joint's ramp, or None if it is not ramping"""
+        with self.lock:
+            ramp = self.ramps.get(joint)
+            if ramp == None:
+                return None
+            return float(ramp[0][max(0, ramp[1] - 1)])
+
+    def run(self):
+        """Scheduler loop. Ticks run against absolute deadlines, so a late tick does not push back the ones after it"""
+        while self.running:
+            self.wake.wait()
+            startTime = time.perf_counter()
+            tick = 0
+            while self.running:
+                deadline = startTime + tick * self.period
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self.lateness[self.ticks % len(self.lateness)] = time.perf_counter() - deadline
+                self.ticks += 1
+                tick += 1
+                if not self.step():
+                    break
+            self.activeTime += time.perf_counter() - startTime
+
+    def nextDeadline(self):
+        """Return the time on the scheduler's clock that the next tick is due, or None if no ramps are playing"""
+        with self.lock:
+            return self.nextTickTime if self.ramps else None
+
+    def advanceTo(self, now):
+        """Run every tick due by a time on the scheduler's clock. Used in place of the thread when a clock is passed in"""
+        while True:
+            with self.lock:
+                if not self.ramps or self.nextTickTime > now + 1e-9:
+                    return
+                deadline = self.nextTickTime
+                self.nextTickTime += self.period
+            self.lateness[self.ticks % len(self.lateness)] = now - deadline
+            self.ticks += 1
+            self.activeTime += self.period
+            self.step()
+
+    def step(self):
+        """Write the next value of every active ramp, returning False once no ramps are left
+
+        Writes happen while holding the lock, so once cancel() returns no stale ramp value can reach the motor."""
+        finished = []
+        with self.lock:
+            for joint, ramp in self.ramps.items():
+                table, index, onDone = ramp
+                try:
+                    self.writeFunction(joint, float(table[index]))
+                except Exception:
+                    self.logger.exception("Profile write to %s failed", joint)
+                ramp[1] = index + 1
+                if ramp[1] >= len(table):
+                    finished.append((joint, onDone))
+            for joint, onDone in finished:
+                del self.ramps[joint]
+            remaining = bool(self.ramps)
+            if not remaining:
+                self.wake.clear()
+        for joint, onDone in finished:
+            if onDone != None:
+                onDone(joint)
+        return remaining
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        if self.thread != None:
+            self.thread.join()
+
+    def stats(self):
+        """Return the achieved update rate while ramps were playing, and tick lateness (jitter) in milliseconds"""
+        samples = self.lateness[:min(self.ticks, len(self.lateness))]
+        if len(samples) == 0:
+            return {"ticks": 0, "targetRate": self.rate, "achievedRate": 0.0, "jitterMean": 0.0, "jitterP99": 0.0, "jitterMax": 0.0}
+        return {
+            "ticks": self.ticks,
+            "targetRate": self.rate,
+            "achievedRate": self.ticks / self.activeTime if self.activeTime > 0 else 0.0,
+            "jitterMean": float(np.mean(samples)) * 1000,
+            "jitterP99": float(np.percentile(samples, 99)) * 1000,
+            "jitterMax": float(np.max(samples)) * 1000,
+        }
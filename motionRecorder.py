@@ -0,0 +1,214 @@
+from metrics import latencySummary
+import struct
+import threading
+import time
+
+# Each record is 16 bytes: timestamp in nanoseconds since the recording started, operation, joint, direction, ramp profile
+# and speed / brightness / ramp time. The profile byte was padding in older files, which read back as no profile
+recordStruct = struct.Struct("<qBBBBf")
+
+# Codes stored in each record. Index 0 of the joint, direction and profile tables is used when a field does not apply.
+# A ramped drive is stored as a SPEED record followed by a DRIVE_RAMPED record holding the ramp time
+DRIVE, STOP, LED, LED_OFF, SPEED, DRIVE_RAMPED, STOP_RAMPED = 1, 2, 3, 4, 5, 6, 7
+jointCodes = ["", "rotate", "shoulder", "elbow", "wrist", "claw", "led"]
+directionCodes = ["", "extend", "retract", "left", "right"]
+profileCodes = ["", "trapezoid", "scurve"]
+
+class MotionRecorder():
+    """Class used to append motor and LED commands to a compact binary timeline file"""
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.startTime = time.monotonic_ns()
+        self.recordCount = 0
+
+        # Look-up tables so recording a command costs two dictionary look-ups and one pack
+        self.jointLookup = {name: code for code, name in enumerate(jointCodes)}
+        self.directionLookup = {name: code for code, name in enumerate(directionCodes)}
+        self.profileLookup = {name: code for code, name in enumerate(profileCodes)}
+
+    def record(self, operation, joint="", direction="", value=0.0, profile=""):
+        """Append a single record, timestamped now. Raises ValueError for a joint, direction or profile that has no code"""
+        try:
+            codes = (self.jointLookup[joint], self.directionLookup[direction], self.profileLookup[profile])
+        except KeyError as error:
+            raise ValueError(f"Cannot record unknown joint, direction or profile: {error.args[0]}")
+        self.file.write(recordStruct.pack(time.monotonic_ns() - self.startTime, operation, *codes, value))
+        self.recordCount += 1
+
+    def recordDrive(self, motorType, direction, speed):
+        self.record(DRIVE, motorType, direction, speed)
+
+    def recordStop(self, motorType):
+        self.record(STOP, motorType)
+
+    def recordSpeed(self, speed):
+        self.record(SPEED, "", "", speed)
+
+    def recordDriveRamped(self, motorType, direction, speed, rampTime, profile):
+        self.recordSpeed(speed)
+        self.record(DRIVE_RAMPED, motorType, direction, rampTime, profile)
+
+    def recordStopRamped(self, motorType, rampTime, profile):
+        self.record(STOP_RAMPED, motorType, "", rampTime, profile)
+
+    def recordLed(self, brightness):
+        self.record(LED, "led", "", brightness)
+
+    def recordLedOff(self):
+        self.record(LED_OFF, "led")
+
+    def close(self):
+        """Finish the recording and close the file"""
+        self.file.close()
+
+def readRecords(path):
+    """Read a timeline file and return a list of (timestamp, operation, joint, direction, value, profile) tuples
+
+    Raises OSError if the file cannot be read and ValueError if it is not a timeline."""
+    with open(path, "rb") as timelineFile:
+        data = timelineFile.read()
+    if len(data) % recordStruct.size:
+        raise ValueError(f"{path} is not a timeline file, its length is not a whole number of records")
+    records = []
+    try:
+        for timestamp, operation, joint, direction, profile, value in recordStruct.iter_unpack(data):
+            records.append((timestamp, operation, jointCodes[joint], directionCodes[direction], value, profileCodes[profile]))
+    except IndexError:
+        raise ValueError(f"{path} is not a timeline file, record {len(records)} has an unknown code")
+    return records
+
+class MotionReplayer():
+    """Class used to play recorded records back against a RobotArmControl object on their original schedule"""
+    def __init__(self, robotArmControl, records, speedFactor=1.0, spinTime=0.002):
+        self.robotArmControl = robotArmControl
+        self.records = records
+        self.speedFactor = speedFactor
+
+        # Sleep until this close to each event, then spin on the clock for the last stretch
+        self.spinTimeNs = int(spinTime * 1e9)
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop the replay before the next event"""
+        self.cancelled = True
+
+    def apply(self, operation, joint, direction, value, profile):
+        """Submit a single record as a command, so commands from elsewhere can run between the events of a replay"""
+        submit = self.robotArmControl.submit
+        if operation == DRIVE:
+            submit("driveMotor", joint, direction, value)
+        elif operation == STOP:
+            submit("stopMotor", joint)
+        elif operation == LED:
+            submit("setLedBrightness", value)
+        elif operation == LED_OFF:
+            submit("stopLed")
+        elif operation == SPEED:
+            submit("setMotorSpeed", value)
+        elif operation == DRIVE_RAMPED:
+            submit("driveMotorRamped", joint, direction, value, profile)
+        elif operation == STOP_RAMPED:
+            submit("stopMotorRamped", joint, value, profile)
+
+    def play(self):
+        """Replay every record and return a timing report
+
+        Each event is scheduled against the replay start time rather than the previous event, so lateness on one event
+        is never carried forward into the next."""
+        errors = []
+        startTime = time.monotonic_ns()
+        for timestamp, operation, joint, direction, value, profile in self.records:
+            if self.cancelled:
+                break
+            target = startTime + int(timestamp / self.speedFactor)
+            remaining = target - time.monotonic_ns()
+            if remaining > self.spinTimeNs:
+                time.sleep((remaining - self.spinTimeNs) / 1e9)
+            issued = time.monotonic_ns()
+            while issued < target:
+                issued = time.monotonic_ns()
+            self.apply(operation, joint, direction, value, profile)
+            errors.append(issued - target)
+        return timingReport(self.records, errors)
+
+class ReplayRunner():
+    """Class used to play one MotionReplayer or macro interpreter at a time, so that it can be cancelled from any thread"""
+    def __init__(self):
+        self.replayer = None
+        self.lock = threading.Lock()
+
+    def play(self, replayer):
+        """Play a replayer and return its report. Raises RuntimeError if another is already playing"""
+        if not self.lock.acquire(blocking=False):
+            raise RuntimeError("A replay or macro is already running")
+        self.replayer = replayer
+        try:
+            return replayer.play()
+        finally:
+            self.replayer = None
+            self.lock.release()
+
+    def cancel(self):
+        """Stop the replayer that is playing, if there is one"""
+        replayer = self.replayer
+        if replayer != None:
+            replayer.cancel()
+
+def timingReport(records, errors):
+    """Summarise the timing error, in milliseconds, of each replayed event"""
+    events = []
+    for (timestamp, operation, joint, direction, value, profile), error in zip(records, errors):
+        events.append({"time": timestamp / 1e6, "operation": operation, "joint": joint, "direction": direction, "error": error / 1e6})
+    summary = latencySummary(errors, 1e-6)
+    summary["events"] = summary.pop("count")
+    return {"summary": summary, "events": events}
+
+if __name__ == "__main__":
+    # Record a short sequence against gpiozero's mock pins and replay it, printing the timing error of each event
+    from gpiozero.pins.mock import MockFactory, MockPWMPin
+    from robotArmControl import RobotArmControl, Pins
+    import logging
+    import sys
+    import tempfile
+
+    logging.basicConfig(format='%(asctime)s %(message)s')
+    logger = logging.getLogger()
+
+    pins = Pins()
+    pins.pins["led"][1] = "GPIO17"
+    pins.pins["led"]["enable"] = True
+    pins.pins["claw"][1] = "GPIO2"
+    pins.pins["claw"][2] = "GPIO3"
+    pins.pins["claw"][3] = "GPIO4"
+    pins.pins["claw"]["enable"] = True
+
+    a = RobotArmControl(pins, 1, 1, logger, pinFactory=MockFactory(pin_class=MockPWMPin))
+    a.createGPIODevices()
+
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        with tempfile.NamedTemporaryFile(suffix=".timeline", delete=False) as timelineFile:
+            path = timelineFile.name
+    a.startRecording(path)
+    for i in range(10):
+        a.driveMotor("claw", "extend" if i % 2 else "retract")
+        time.sleep(0.02)
+        a.stopMotor("claw")
+        a.ledBrightness = i / 10
+        a.controlLedBrightness()
+        time.sleep(0.01)
+    a.driveMotorRamped("claw", "extend", 0.05)
+    time.sleep(0.05)
+    a.writeContinuousValue("led", 0.5)
+    a.stopMotorRamped("claw", 0.05, "trapezoid")
+    time.sleep(0.05)
+    a.stopLed()
+    a.stopRecording()
+
+    report = a.replayRecording(path)
+    for event in report["events"]:
+        print(f"{event['time']:10.3f} ms  {event['joint']:8} {event['direction']:8} error {event['error']:.4f} ms")
+    print(report["summary"])
+    a.closeAllGPIO()
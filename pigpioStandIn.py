@@ -0,0 +1,277 @@
+from collections import deque
+import random
+import socket
+import struct
+import threading
+import time
+
+# pigpio socket commands handled by the stand-in, with the numbers used by the pigpio library. This is the subset sent
+# by gpiozero's PiGPIOFactory when creating and driving Motor and PWMLED devices, plus the notification commands its
+# connection opens with
+commandNames = {
+    0: "MODES", 1: "MODEG", 2: "PUD", 3: "READ", 4: "WRITE", 5: "PWM", 6: "PRS", 7: "PFS", 10: "BR1", 12: "BC1",
+    14: "BS1", 16: "TICK", 17: "HWVER", 19: "NB", 21: "NC", 22: "PRG", 23: "PFG", 24: "PRRG", 26: "PIGPV", 83: "GDC",
+    97: "FG", 99: "NOIB",
+}
+
+# Commands that change a pin, which are recorded
+writeCommands = {"MODES", "PUD", "WRITE", "PWM", "PRS", "PFS", "BC1", "BS1"}
+
+# Error codes returned to the client, as defined by pigpio
+PI_BAD_GPIO = -3
+PI_UNKNOWN_COMMAND = -88
+PI_NOT_PWM_GPIO = -92
+
+# Hardware revision reported to gpiozero, a Raspberry Pi 3 Model B+, and the pigpio version
+hardwareRevision = 0xa020d3
+pigpioVersion = 79
+
+class PinState():
+    """Class used to store the state of one simulated GPIO, starting from pigpio's defaults"""
+    __slots__ = ("mode", "pull", "level", "dutycycle", "range", "frequency", "pwm")
+
+    def __init__(self):
+        self.mode = 0
+        self.pull = 0
+        self.level = 0
+        self.dutycycle = 0
+        self.range = 255
+        self.frequency = 800
+        self.pwm = False
+
+class PigpioStandIn():
+    """Class used to stand in for the pigpio daemon on a Raspberry Pi, so remote GPIO can be tested on any machine
+
+    It listens on a TCP port and answers the pigpio socket commands gpiozero uses for Motor and PWMLED, keeping the
+    state of every pin and recording each write. Faults can be injected to test behaviour on a poor network: latency
+    and jitter, in seconds, are added before every reply, a fraction of replies stall for stallTime seconds, and a
+    fraction of commands drop the connection instead of replying. disconnectAll() drops every connection at once,
+    restart() also resets the pins, and while refusing is set new connections are closed as soon as they are accepted."""
+    def __init__(self, logger, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, stallProbability=0.0, stallTime=0.5, dropProbability=0.0, seed=None, maxWrites=1000000):
+        self.logger = logger
+        self.latency = latency
+        self.jitter = jitter
+        self.stallProbability = stallProbability
+        self.stallTime = stallTime
+        self.dropProbability = dropProbability
+        self.random = random.Random(seed)
+        self.refusing = False
+
+        self.pins = [PinState() for _ in range(54)]
+        # Every pin write, as (time.monotonic(), gpio, command name, value)
+        self.writes = deque(maxlen=maxWrites)
+        self.commandCounts = {}
+        self.stats = {"connections": 0, "refused": 0, "commands": 0, "stalls": 0, "drops": 0}
+        self.lock = threading.Lock()
+        self.startTick = time.monotonic()
+
+        self.listener = socket.create_server((host, port))
+        self.host, self.port = self.listener.getsockname()[:2]
+        self.connections = set()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start accepting connections on a background thread"""
+        self.running = True
+        self.thread = threading.Thread(target=self.acceptLoop, name="PigpioStandIn", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop accepting connections and drop every open one"""
+        self.running = False
+        # Closing a listening socket does not wake a thread blocked in accept(), but shutting it down does
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.listener.close()
+        self.disconnectAll()
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+
+    def disconnectAll(self):
+        """Drop every open connection, as a restarted daemon or broken network would"""
+        with self.lock:
+            connections = list(self.connections)
+            self.connections.clear()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+
+    def restart(self):
+        """Drop every connection and put every pin back to its defaults, as restarting the pigpio daemon would"""
+        self.disconnectAll()
+        with self.lock:
+            self.pins = [PinState() for _ in range(len(self.pins))]
+
+    def acceptLoop(self):
+        while self.running:
+            try:
+                connection, address = self.listener.accept()
+            except OSError:
+                return
+            if self.refusing:
+                self.stats["refused"] += 1
+                connection.close()
+                continue
+            self.logger.debug(f"pigpio stand-in accepted a connection from {address[0]}:{address[1]}")
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.connections.add(connection)
+                self.stats["connections"] += 1
+            threading.Thread(target=self.serve, args=(connection,), name="PigpioStandInConnection", daemon=True).start()
+
+    def receive(self, connection, size):
+        """Read exactly size bytes, returning None if the connection closes first"""
+        data = b""
+        while len(data) < size:
+            chunk = connection.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def serve(self, connection):
+        """Answer commands on one connection until it closes"""
+        try:
+            while True:
+                request = self.receive(connection, 16)
+                if request == None:
+                    return
+                cmd, p1, p2, p3 = struct.unpack("IIII", request)
+                # Extended commands are followed by p3 bytes of data, which no command used here needs
+                if p3 and cmd not in commandNames and self.receive(connection, p3) == None:
+                    return
+                name = commandNames.get(cmd)
+                if name == "NC":
+                    # Sent on the notification connection when it closes, without waiting for an answer
+                    return
+                result = self.execute(name, p1, p2)
+                if not self.injectFaults():
+                    return
+                connection.sendall(request[:12] + struct.pack("i", result))
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                self.connections.discard(connection)
+            connection.close()
+
+    def injectFaults(self):
+        """Wait for the configured latency, jitter and stalls before a reply. Returns False if the connection should drop"""
+        if self.dropProbability and self.random.random() < self.dropProbability:
+            self.stats["drops"] += 1
+            return False
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if self.stallProbability and self.random.random() < self.stallProbability:
+            self.stats["stalls"] += 1
+            delay += self.stallTime
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def execute(self, name, gpio, value):
+        """Apply one command to the pin state and return its result"""
+        with self.lock:
+            self.stats["commands"] += 1
+            self.commandCounts[name] = self.commandCounts.get(name, 0) + 1
+            if name in writeCommands:
+                self.writes.append((time.monotonic(), gpio, name, value))
+            if name == None:
+                return PI_UNKNOWN_COMMAND
+            if name == "TICK":
+                return int((time.monotonic() - self.startTick) * 1e6) & 0x7fffffff
+            if name == "HWVER":
+                return hardwareRevision
+            if name == "PIGPV":
+                return pigpioVersion
+            if name == "BR1":
+                return sum(pin.level << index for index, pin in enumerate(self.pins[:32]))
+            if name in ("NB", "NOIB", "FG"):
+                return 0
+            if name in ("BC1", "BS1"):
+                for index in range(32):
+                    if value & (1 << index) or gpio & (1 << index):
+                        self.pins[index].level = 1 if name == "BS1" else 0
+                return 0
+            if gpio >= len(self.pins):
+                return PI_BAD_GPIO
+            pin = self.pins[gpio]
+            if name == "MODES":
+                pin.mode = value
+            elif name == "MODEG":
+                return pin.mode
+            elif name == "PUD":
+                pin.pull = value
+            elif name == "READ":
+                return pin.level
+            elif name == "WRITE":
+                # Writing a level stops PWM on the pin, and makes it an output
+                pin.level = 1 if value else 0
+                pin.mode = 1
+                pin.pwm = False
+                pin.dutycycle = 0
+            elif name == "PWM":
+                pin.dutycycle = value
+                pin.pwm = True
+                pin.mode = 1
+                pin.level = 1 if value else 0
+            elif name == "PRS":
+                pin.range = value
+                return value
+            elif name == "PFS":
+                pin.frequency = value
+                return value
+            elif name in ("PRG", "PRRG"):
+                return pin.range
+            elif name == "PFG":
+                return pin.frequency
+            elif name == "GDC":
+                return pin.dutycycle if pin.pwm else PI_NOT_PWM_GPIO
+            return 0
+
+    def pinValue(self, gpio):
+        """Return the output of a pin, as a duty cycle between 0 and 1 for PWM or as its level"""
+        with self.lock:
+            pin = self.pins[gpio]
+            return pin.dutycycle / pin.range if pin.pwm else float(pin.level)
+
+    def clearWrites(self):
+        with self.lock:
+            self.writes.clear()
+            self.commandCounts.clear()
+
+if __name__ == "__main__":
+    # Run a stand-in daemon that a GUI or client in remote mode can connect to, e.g. with remote IP 127.0.0.1
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Stand in for the pigpio daemon, for testing remote GPIO without a Raspberry Pi")
+    parser.add_argument("--port", type=int, default=8888, help="TCP port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="milliseconds added to every reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra milliseconds added to each reply")
+    parser.add_argument("--stall-probability", type=float, default=0.0, help="fraction of replies that stall")
+    parser.add_argument("--stall-time", type=float, default=500.0, help="milliseconds a stalled reply is held for")
+    parser.add_argument("--drop-probability", type=float, default=0.0, help="fraction of commands that drop the connection")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(message)s')
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+
+    standIn = PigpioStandIn(logger, "0.0.0.0", args.port, args.latency / 1000, args.jitter / 1000, args.stall_probability, args.stall_time / 1000, args.drop_probability).start()
+    logger.info(f"Standing in for pigpio on port {standIn.port}. Press Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(10)
+            logger.info(f"{standIn.stats}, {len(standIn.writes)} pin writes")
+    except KeyboardInterrupt:
+        standIn.stop()
@@ -0,0 +1,153 @@
+from robotArmControl import Pins
+import configparser
+import os
+
+# Profiles are kept in a single INI file, with one section per profile
+defaultProfilesPath = os.path.join(os.path.expanduser("~"), ".robotArmProfiles.ini")
+
+class ProfileError(ValueError):
+    """Raised when a profile is missing or invalid. Every problem found is listed, not just the first"""
+    def __init__(self, name, problems):
+        self.name = name
+        self.problems = problems
+        super().__init__(f"Profile {name!r} is invalid: " + "; ".join(problems))
+
+class PinProfile():
+    """Class used to store a named set of pins and connection settings
+
+    In the file, each enabled output is a key listing its pins in pin number order, for example "claw = GPIO2 GPIO3 GPIO4".
+    Outputs that are not listed are disabled."""
+    def __init__(self, name, pins=None, remote=False, remoteIP="", autoApply=False):
+        self.name = name
+        self.pins = pins if pins != None else Pins()
+        self.remote = remote
+        self.remoteIP = remoteIP
+        self.autoApply = autoApply
+
+    @classmethod
+    def fromSection(cls, name, section):
+        """Create a profile from a section of the profiles file, raising ProfileError if it is not valid
+
+        Keys are matched without regard to case, so "Claw" and "autoapply" read the same as "claw" and "autoApply"."""
+        values, problems = lowerCaseKeys(section)
+        profile = cls(name)
+        for setting in ("remote", "autoApply"):
+            value = values.pop(setting.lower(), "no")
+            if value.lower() not in configparser.ConfigParser.BOOLEAN_STATES:
+                problems.append(f"{setting} must be yes or no, not {value!r}")
+            else:
+                setattr(profile, setting, configparser.ConfigParser.BOOLEAN_STATES[value.lower()])
+        profile.remoteIP = values.pop("remoteip", "")
+        outputTypes = set(profile.pins.pins)
+        for key, value in values.items():
+            if key not in outputTypes:
+                problems.append(f"unknown output {key!r}")
+                continue
+            outputPins = profile.pins.pins[key]
+            pinNames = value.split()
+            if len(pinNames) != len(outputPins) - 1:
+                problems.append(f"{key} needs {len(outputPins) - 1} pins, got {len(pinNames)}")
+                continue
+            for pinNumber, pinName in enumerate(pinNames, start=1):
+                outputPins[pinNumber] = pinName
+            outputPins["enable"] = True
+        problems += validatePins(profile.pins, profile.remote, profile.remoteIP)
+        if problems:
+            raise ProfileError(name, problems)
+        return profile
+
+    def toSection(self):
+        """Return the profile as a mapping of keys to strings for the profiles file"""
+        section = {"remote": "yes" if self.remote else "no", "remoteIP": self.remoteIP, "autoApply": "yes" if self.autoApply else "no"}
+        for outputType, outputPins in self.pins.pins.items():
+            if outputPins["enable"]:
+                section[outputType] = " ".join(str(outputPins[pinNumber]) for pinNumber in outputPins if pinNumber != "enable")
+        return section
+
+    def applyTo(self, pins, robotArmControl=None):
+        """Copy the profile into an existing Pins object, which is shared with the windows and the hardware library,
+        and set the connection details of a RobotArmControl object if one is given"""
+        for outputType, outputPins in self.pins.pins.items():
+            pins.pins[outputType].update(outputPins)
+        if robotArmControl != None:
+            robotArmControl.remote = self.remote
+            robotArmControl.remoteIP = self.remoteIP
+
+def validatePins(pins, remote=False, remoteIP=""):
+    """Return a list of the problems with a set of pins, which is empty if they can be used to create devices
+
+    Only enabled outputs are checked, as disabled outputs are never created."""
+    problems = []
+    owners = {}
+    for outputType, outputPins in pins.pins.items():
+        if not outputPins["enable"]:
+            continue
+        for pinNumber in outputPins:
+            if pinNumber == "enable":
+                continue
+            pinName = outputPins[pinNumber]
+            if pinName not in Pins.pinChoices:
+                problems.append(f"{outputType} pin {pinNumber} is not a GPIO pin: {pinName!r}")
+            elif pinName in owners:
+                problems.append(f"{pinName} is used by both {owners[pinName]} and {outputType} pin {pinNumber}")
+            else:
+                owners[pinName] = f"{outputType} pin {pinNumber}"
+    if remote and not remoteIP:
+        problems.append("remote GPIO is enabled but no remote IP address is set")
+    return problems
+
+def lowerCaseKeys(section):
+    """Return the keys of a profile section in lower case, with a problem listed for each key given twice in different cases
+
+    This is the one place key case is normalized. The file itself keeps keys as they were written."""
+    values = {}
+    problems = []
+    for key, value in section.items():
+        if key.lower() in values:
+            problems.append(f"{key!r} is given more than once")
+        else:
+            values[key.lower()] = value
+    return values, problems
+
+def findSection(parser, name):
+    """Return the name of the section holding a profile, matching profile names without regard to case, or None"""
+    for section in parser.sections():
+        if section.lower() == name.lower():
+            return section
+    return None
+
+def readProfilesFile(path):
+    parser = configparser.ConfigParser(interpolation=None)
+    # Keep the case of keys, so outputs and settings read back exactly as written
+    parser.optionxform = str
+    parser.read(path)
+    return parser
+
+def profileNames(path=defaultProfilesPath):
+    """Return the names of the profiles in a profiles file"""
+    return readProfilesFile(path).sections()
+
+def loadProfile(name, path=defaultProfilesPath):
+    """Load and validate a single profile, raising ProfileError if it is missing or invalid"""
+    parser = readProfilesFile(path)
+    section = findSection(parser, name)
+    if section == None:
+        raise ProfileError(name, [f"not found in {path}"])
+    return PinProfile.fromSection(section, parser[section])
+
+def saveProfile(profile, path=defaultProfilesPath):
+    """Add or replace a profile in a profiles file, raising ProfileError rather than saving an invalid profile"""
+    problems = validatePins(profile.pins, profile.remote, profile.remoteIP)
+    if problems:
+        raise ProfileError(profile.name, problems)
+    parser = readProfilesFile(path)
+    # A profile saved under a name differing only in case replaces the existing one rather than sitting beside it
+    existing = findSection(parser, profile.name)
+    if existing != None:
+        parser.remove_section(existing)
+    parser[profile.name] = profile.toSection()
+    # Write to a temporary file first, so an interrupted save never leaves a half written profiles file
+    temporaryPath = path + ".tmp"
+    with open(temporaryPath, "w") as file:
+        parser.write(file)
+    os.replace(temporaryPath, path)
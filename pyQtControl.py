@@ -1,24 +1,16 @@
-from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QHBoxLayout, QVBoxLayout, QWidget, QLabel, QMenu, QSlider, QComboBox, QScrollArea, QLineEdit, QCheckBox, QMessageBox
+from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QHBoxLayout, QVBoxLayout, QWidget, QLabel, QMenu, QSlider, QComboBox, QScrollArea, QLineEdit, QCheckBox, QMessageBox, QFileDialog
 from PyQt6.QtGui import QFont
-from PyQt6.QtCore import Qt
-from rich import print
-from robotArmControl import RobotArmControl
+from PyQt6.QtCore import Qt, pyqtSignal, QEvent, QObject, QTimer
+from robotArmControl import RobotArmControl, Pins
+from pinProfiles import PinProfile, ProfileError, defaultProfilesPath, loadProfile, saveProfile, validatePins
+import argparse
 import logging
+import sys
+import time
 
 # Create a font object to pass into each sub-classed QWidget type
 font = QFont("Arial", 14)
 
-class Pins():
-    """Class used to store Pin details for motors / LED"""
-    def __init__(self):
-        self.pins = {}
-        self.pins["rotate"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["shoulder"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["elbow"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["wrist"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["claw"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["led"] = {1:None, "enable":False}
-
 class CustomQMessageBox(QMessageBox):
     """Custom message box with custom font set"""
     def __init__(self, title, text, font=font):
@@ -59,15 +51,44 @@ class CustomQComboBox(QComboBox):
         super().__init__()
         self.setFont(font)
 
+class InputEventTimer(QObject):
+    """Event filter used, while tracing, to note when each mouse or key event reached the application
+
+    A slot's trace span starts from that time, so it covers Qt's dispatch of the event as well as the slot itself."""
+    inputEvents = (QEvent.Type.MouseButtonPress, QEvent.Type.MouseButtonRelease, QEvent.Type.KeyPress, QEvent.Type.KeyRelease)
+
+    def __init__(self):
+        super().__init__()
+        self.lastInputTime = None
+        self.lastTimestamp = None
+
+    def eventFilter(self, watched, event):
+        # The same event is offered to each widget it propagates through, so only its first appearance is timed
+        if event.type() in self.inputEvents and event.timestamp() != self.lastTimestamp:
+            self.lastTimestamp = event.timestamp()
+            self.lastInputTime = time.perf_counter()
+        return False
+
 class ConfigWindow(QScrollArea):
-    """Config Window class, which inherits from a scroll area. The content within can scroll if it is larger than the window size"""
-    def __init__(self, pins, logger, robotArmControl, windowWidth = 450, windowHeight = 600):
+    """Config Window class, which inherits from a scroll area. The content within can scroll if it is larger than the window size
+
+    The widgets are generated from the Pins schema and are only built the first time the window is shown"""
+    # Signal used to hand the result of GPIO setup back from the executor thread to the GUI thread
+    gpioSetupFinished = pyqtSignal(bool)
+
+    # Valid pins for GPIO can be added to the combo box
+    pinChoices = Pins.pinChoices
+
+    def __init__(self, pins, logger, robotArmControl, windowWidth = 450, windowHeight = 600, profileName = "", profilesPath = defaultProfilesPath):
         super().__init__()
 
         # Instance variables to store details passed in when instantiating the class
         self.logger = logger
         self.pins = pins
         self.robotArmControl = robotArmControl
+        self.profileName = profileName
+        self.profilesPath = profilesPath
+        self.built = False
 
         #Set the window sizes
         self.setMinimumHeight(windowHeight)
@@ -76,267 +97,85 @@ class ConfigWindow(QScrollArea):
         # Set the window's title
         self.setWindowTitle("Configure the Robot Arm Controller")
 
-        # Add widgets required for the connection
-        spacerLabel = CustomQLabel("")
+        self.gpioSetupFinished.connect(self.reportGPIOSetup)
 
-        # Valid pins for GPIO can be added to the combo box
-        pinChoices = ["GPIO2","GPIO3","GPIO4","GPIO14","GPIO15","GPIO17","GPIO18","GPIO27","GPIO22","GPIO23","GPIO24","GPIO10","GPIO9","GPIO25","GPIO11","GPIO8","GPIO7","GPIO0","GPIO1","GPIO5","GPIO6","GPIO12","GPIO13","GPIO19","GPIO16","GPIO26","GPIO20","GPIO21"]
-        pinChoicesStr = []
-        for pin in pinChoices:
-            pinChoicesStr.append(str(pin))
-
-        # Objects for defining shoulder motor pins
-        shoulderPinsLabel = CustomQLabel("Define pins used for the shoulder motor")
-        shoulderEnableLabel = CustomQLabel("Enable")
-        shoulderPin1Label = CustomQLabel("Pin 1")
-        shoulderPin2Label = CustomQLabel("Pin 2")
-        shoulderPin3Label = CustomQLabel("Speed")
-        shoulderEnableCheck = CustomQCheckBox("")
-        shoulderPin1Combo = CustomQComboBox()
-        shoulderPin1Combo.addItems(pinChoicesStr)
-        shoulderPin2Combo = CustomQComboBox()
-        shoulderPin2Combo.addItems(pinChoicesStr)
-        shoulderPin3Combo = CustomQComboBox()
-        shoulderPin3Combo.addItems(pinChoicesStr)
-        shoulderHLayout = QHBoxLayout()
-        shVLayout0 = QVBoxLayout()
-        shVLayout1 = QVBoxLayout()
-        shVLayout2 = QVBoxLayout()
-        shVLayout3 = QVBoxLayout()
-        shVLayout0.addWidget(shoulderEnableLabel)
-        shVLayout0.addWidget(shoulderEnableCheck)
-        shVLayout1.addWidget(shoulderPin1Label)
-        shVLayout1.addWidget(shoulderPin1Combo)
-        shVLayout2.addWidget(shoulderPin2Label)
-        shVLayout2.addWidget(shoulderPin2Combo)
-        shVLayout3.addWidget(shoulderPin3Label)
-        shVLayout3.addWidget(shoulderPin3Combo)
-        shoulderHLayout.addLayout(shVLayout0)
-        shoulderHLayout.addLayout(shVLayout1)
-        shoulderHLayout.addLayout(shVLayout2)
-        shoulderHLayout.addLayout(shVLayout3)
-
-        # Objects for defining elbow motor pins
-        elbowPinsLabel = CustomQLabel("Define pins used for the elbow motor")
-        elbowEnableLabel = CustomQLabel("Enable")
-        elbowPin1Label = CustomQLabel("Pin 1")
-        elbowPin2Label = CustomQLabel("Pin 2")
-        elbowPin3Label = CustomQLabel("Speed")
-        elbowEnableCheck = CustomQCheckBox("")
-        elbowPin1Combo = CustomQComboBox()
-        elbowPin1Combo.addItems(pinChoicesStr)
-        elbowPin2Combo = CustomQComboBox()
-        elbowPin2Combo.addItems(pinChoicesStr)
-        elbowPin3Combo = CustomQComboBox()
-        elbowPin3Combo.addItems(pinChoicesStr)
-        elbowHLayout = QHBoxLayout()
-        elVLayout0 = QVBoxLayout()
-        elVLayout1 = QVBoxLayout()
-        elVLayout2 = QVBoxLayout()
-        elVLayout3 = QVBoxLayout()
-        elVLayout0.addWidget(elbowEnableLabel)
-        elVLayout0.addWidget(elbowEnableCheck)
-        elVLayout1.addWidget(elbowPin1Label)
-        elVLayout1.addWidget(elbowPin1Combo)
-        elVLayout2.addWidget(elbowPin2Label)
-        elVLayout2.addWidget(elbowPin2Combo)
-        elVLayout3.addWidget(elbowPin3Label)
-        elVLayout3.addWidget(elbowPin3Combo)
-        elbowHLayout.addLayout(elVLayout0)
-        elbowHLayout.addLayout(elVLayout1)
-        elbowHLayout.addLayout(elVLayout2)
-        elbowHLayout.addLayout(elVLayout3)
-
-        # Objects for defining wrist motor pins
-        wristPinsLabel = CustomQLabel("Define pins used for the wrist motor")
-        wristEnableLabel = CustomQLabel("Enable")
-        wristPin1Label = CustomQLabel("Pin 1")
-        wristPin2Label = CustomQLabel("Pin 2")
-        wristPin3Label = CustomQLabel("Speed")
-        wristEnableCheck = CustomQCheckBox("")
-        wristPin1Combo = CustomQComboBox()
-        wristPin1Combo.addItems(pinChoicesStr)
-        wristPin2Combo = CustomQComboBox()
-        wristPin2Combo.addItems(pinChoicesStr)
-        wristPin3Combo = CustomQComboBox()
-        wristPin3Combo.addItems(pinChoicesStr)
-        wristHLayout = QHBoxLayout()
-        wrVLayout0 = QVBoxLayout()
-        wrVLayout1 = QVBoxLayout()
-        wrVLayout2 = QVBoxLayout()
-        wrVLayout3 = QVBoxLayout()
-        wrVLayout0.addWidget(wristEnableLabel)
-        wrVLayout0.addWidget(wristEnableCheck)
-        wrVLayout1.addWidget(wristPin1Label)
-        wrVLayout1.addWidget(wristPin1Combo)
-        wrVLayout2.addWidget(wristPin2Label)
-        wrVLayout2.addWidget(wristPin2Combo)
-        wrVLayout3.addWidget(wristPin3Label)
-        wrVLayout3.addWidget(wristPin3Combo)
-        wristHLayout.addLayout(wrVLayout0)
-        wristHLayout.addLayout(wrVLayout1)
-        wristHLayout.addLayout(wrVLayout2)
-        wristHLayout.addLayout(wrVLayout3)
-
-        # Objects for defining claw motor pins
-        clawPinsLabel = CustomQLabel("Define pins used for the claw motor")
-        clawEnableLabel = CustomQLabel("Enable")
-        clawPin1Label = CustomQLabel("Pin 1")
-        clawPin2Label = CustomQLabel("Pin 2")
-        clawPin3Label = CustomQLabel("Speed")
-        clawEnableCheck = CustomQCheckBox("")
-        clawPin1Combo = CustomQComboBox()
-        clawPin1Combo.addItems(pinChoicesStr)
-        clawPin2Combo = CustomQComboBox()
-        clawPin2Combo.addItems(pinChoicesStr)
-        clawPin3Combo = CustomQComboBox()
-        clawPin3Combo.addItems(pinChoicesStr)
-        clawHLayout = QHBoxLayout()
-        clawVLayout0 = QVBoxLayout()
-        clawVLayout1 = QVBoxLayout()
-        clawVLayout2 = QVBoxLayout()
-        clawVLayout3 = QVBoxLayout()
-        clawVLayout0.addWidget(clawEnableLabel)
-        clawVLayout0.addWidget(clawEnableCheck)        
-        clawVLayout1.addWidget(clawPin1Label)
-        clawVLayout1.addWidget(clawPin1Combo)
-        clawVLayout2.addWidget(clawPin2Label)
-        clawVLayout2.addWidget(clawPin2Combo)
-        clawVLayout3.addWidget(clawPin3Label)
-        clawVLayout3.addWidget(clawPin3Combo)
-        clawHLayout.addLayout(clawVLayout0)
-        clawHLayout.addLayout(clawVLayout1)
-        clawHLayout.addLayout(clawVLayout2)
-        clawHLayout.addLayout(clawVLayout3)
-
-        # Objects for defining rotate motor pins
-        rotatePinsLabel = CustomQLabel("Define pins used for the rotate motor")
-        rotateEnableLabel = CustomQLabel("Enable")
-        rotatePin1Label = CustomQLabel("Pin 1")
-        rotatePin2Label = CustomQLabel("Pin 2")
-        rotatePin3Label = CustomQLabel("Speed")
-        rotateEnableCheck = CustomQCheckBox("")
-        rotatePin1Combo = CustomQComboBox()
-        rotatePin1Combo.addItems(pinChoicesStr)
-        rotatePin2Combo = CustomQComboBox()
-        rotatePin2Combo.addItems(pinChoicesStr)
-        rotatePin3Combo = CustomQComboBox()
-        rotatePin3Combo.addItems(pinChoicesStr)
-        rotateHLayout = QHBoxLayout()
-        rotateVLayout0 = QVBoxLayout()
-        rotateVLayout1 = QVBoxLayout()
-        rotateVLayout2 = QVBoxLayout()
-        rotateVLayout3 = QVBoxLayout()
-        rotateVLayout0.addWidget(rotateEnableLabel)
-        rotateVLayout0.addWidget(rotateEnableCheck)        
-        rotateVLayout1.addWidget(rotatePin1Label)
-        rotateVLayout1.addWidget(rotatePin1Combo)
-        rotateVLayout2.addWidget(rotatePin2Label)
-        rotateVLayout2.addWidget(rotatePin2Combo)
-        rotateVLayout3.addWidget(rotatePin3Label)
-        rotateVLayout3.addWidget(rotatePin3Combo)
-        rotateHLayout.addLayout(rotateVLayout0)
-        rotateHLayout.addLayout(rotateVLayout1)
-        rotateHLayout.addLayout(rotateVLayout2)
-        rotateHLayout.addLayout(rotateVLayout3)
-
-        # Objects for defining LED pins
-        ledLabel = CustomQLabel("LED Settings")
-        ledPinLabel = CustomQLabel("Define pin used for the LED")
-        ledEnableLabel = CustomQLabel("Enable")
-        ledPinCombo = CustomQComboBox()
-        ledPinCombo.addItems(pinChoicesStr)
-        ledEnableCheck = CustomQCheckBox("")
-        ledHLayout = QHBoxLayout()
-        ledVLayout1 = QVBoxLayout()
-        ledVLayout2 = QVBoxLayout()
-        ledVLayout1.addWidget(ledEnableLabel)
-        ledVLayout1.addWidget(ledEnableCheck)
-        ledVLayout2.addWidget(ledPinLabel)
-        ledVLayout2.addWidget(ledPinCombo)
-        ledHLayout.addLayout(ledVLayout1)
-        ledHLayout.addLayout(ledVLayout2)
+    # Build the widgets the first time the window is shown, so sessions that never open it do not pay for them
+    def show(self):
+        self.buildWidgets()
+        super().show()
+
+    def buildWidgets(self):
+        if self.built:
+            return
+        self.built = True
+
+        # Add these various objects to a layout that can then be added to the window
+        vLayout = QVBoxLayout()
+
+        # Add a row of widgets for each output in the schema: an enable check box and a combo box for each of its pins
+        for outputType, description, pinLabels in self.pins.schema:
+            outputPins = self.pins.pins[outputType]
+            enableCheck = CustomQCheckBox("")
+            enableCheck.setChecked(bool(outputPins["enable"]))
+            enableCheck.stateChanged.connect(lambda x, outputType=outputType: self.setEnableState(x, outputType))
+            hLayout = QHBoxLayout()
+            hLayout.addLayout(self.labelledLayout("Enable", enableCheck))
+            for pinNumber, pinLabel in enumerate(pinLabels, start=1):
+                # Pins not set already, for example from a profile, start with the first choice
+                if outputPins[pinNumber] == None:
+                    outputPins[pinNumber] = self.pinChoices[0]
+                pinCombo = CustomQComboBox()
+                pinCombo.addItems(self.pinChoices)
+                pinCombo.setCurrentText(outputPins[pinNumber])
+                pinCombo.textActivated.connect(lambda x, outputType=outputType, pinNumber=pinNumber: self.setPinValue(x, outputType, pinNumber))
+                hLayout.addLayout(self.labelledLayout(pinLabel, pinCombo))
+            vLayout.addWidget(CustomQLabel(f"Define pins used for the {description}"))
+            vLayout.addLayout(hLayout)
+            vLayout.addWidget(CustomQLabel(""))
 
         # Objects for determining whether to use remote GPIO
         remoteGPIOLabel = CustomQLabel("Define whether to use Remote GPIO or not")
-        remoteGPIOEnableLabel = CustomQLabel("Enable remote GPIO?")
-        remoteGPIOIPLabel = CustomQLabel("Enter server IP Address")
         self.remoteGPIOEnableCombo = CustomQComboBox()
         self.remoteGPIOEnableCombo.addItems(["Yes","No"])
-        self.remoteGPIOIP = CustomQLineEdit("")
-        remoteEnableVLayout = QVBoxLayout()
-        remoteIPVLayout = QVBoxLayout()
-        remoteEnableVLayout.addWidget(remoteGPIOEnableLabel)
-        remoteEnableVLayout.addWidget(self.remoteGPIOEnableCombo)
-        remoteIPVLayout.addWidget(remoteGPIOIPLabel)
-        remoteIPVLayout.addWidget(self.remoteGPIOIP)
+        self.remoteGPIOEnableCombo.setCurrentText("Yes" if self.robotArmControl.remote else "No")
+        self.remoteGPIOIP = CustomQLineEdit(self.robotArmControl.remoteIP)
         remoteHLayout = QHBoxLayout()
-        remoteHLayout.addLayout(remoteEnableVLayout)
-        remoteHLayout.addLayout(remoteIPVLayout)
-
-        setupGPIOButton = CustomQPushButton("Setup GPIO")
-
-        # Add these various objects to a layout that can then be added to the window
-        vLayout = QVBoxLayout()
-        vLayout.addWidget(rotatePinsLabel)
-        vLayout.addLayout(rotateHLayout)
-        vLayout.addWidget(spacerLabel)
-        vLayout.addWidget(shoulderPinsLabel)
-        vLayout.addLayout(shoulderHLayout)
-        vLayout.addWidget(spacerLabel)
-        vLayout.addWidget(elbowPinsLabel)
-        vLayout.addLayout(elbowHLayout)
-        vLayout.addWidget(spacerLabel)
-        vLayout.addWidget(wristPinsLabel)
-        vLayout.addLayout(wristHLayout)
-        vLayout.addWidget(spacerLabel)
-        vLayout.addWidget(clawPinsLabel)
-        vLayout.addLayout(clawHLayout)
-        vLayout.addWidget(spacerLabel)
-        vLayout.addWidget(ledLabel)
-        vLayout.addLayout(ledHLayout)
-        vLayout.addWidget(spacerLabel)
+        remoteHLayout.addLayout(self.labelledLayout("Enable remote GPIO?", self.remoteGPIOEnableCombo))
+        remoteHLayout.addLayout(self.labelledLayout("Enter server IP Address", self.remoteGPIOIP))
         vLayout.addWidget(remoteGPIOLabel)
         vLayout.addLayout(remoteHLayout)
-        vLayout.addWidget(spacerLabel)
-        vLayout.addWidget(setupGPIOButton)
+        vLayout.addWidget(CustomQLabel(""))
+
+        # Objects for saving the settings above as a named profile, which can be loaded with --profile
+        profileLabel = CustomQLabel("Save these settings as a profile")
+        self.profileNameEdit = CustomQLineEdit(self.profileName)
+        self.autoApplyCheck = CustomQCheckBox("")
+        saveProfileButton = CustomQPushButton("Save")
+        saveProfileButton.clicked.connect(self.saveProfile)
+        profileHLayout = QHBoxLayout()
+        profileHLayout.addLayout(self.labelledLayout("Profile name", self.profileNameEdit))
+        profileHLayout.addLayout(self.labelledLayout("Apply on start", self.autoApplyCheck))
+        profileHLayout.addLayout(self.labelledLayout("", saveProfileButton))
+        vLayout.addWidget(profileLabel)
+        vLayout.addLayout(profileHLayout)
+        vLayout.addWidget(CustomQLabel(""))
 
-        # Set the pins in the pin object to the original value
-        for pinType in self.pins.pins:
-            for pin in self.pins.pins[pinType]:
-                if pin != "enable":
-                    self.pins.pins[pinType][pin] = pinChoices[0]
-
-        # Add the signals for setting the pins. When button are pushed, functions are called
-        rotatePin1Combo.textActivated.connect(lambda x: self.setPinValue(x,"rotate",1))
-        rotatePin2Combo.textActivated.connect(lambda x: self.setPinValue(x,"rotate",2))
-        rotatePin3Combo.textActivated.connect(lambda x: self.setPinValue(x,"rotate",3))
-        shoulderPin1Combo.textActivated.connect(lambda x: self.setPinValue(x,"shoulder",1))
-        shoulderPin2Combo.textActivated.connect(lambda x: self.setPinValue(x,"shoulder",2))
-        shoulderPin3Combo.textActivated.connect(lambda x: self.setPinValue(x,"shoulder",3))
-        elbowPin1Combo.textActivated.connect(lambda x: self.setPinValue(x,"elbow",1))
-        elbowPin2Combo.textActivated.connect(lambda x: self.setPinValue(x,"elbow",2))
-        elbowPin3Combo.textActivated.connect(lambda x: self.setPinValue(x,"elbow",3))
-        wristPin1Combo.textActivated.connect(lambda x: self.setPinValue(x,"wrist",1))
-        wristPin2Combo.textActivated.connect(lambda x: self.setPinValue(x,"wrist",2))
-        wristPin3Combo.textActivated.connect(lambda x: self.setPinValue(x,"wrist",3))
-        clawPin1Combo.textActivated.connect(lambda x: self.setPinValue(x,"claw",1))
-        clawPin2Combo.textActivated.connect(lambda x: self.setPinValue(x,"claw",2))
-        clawPin3Combo.textActivated.connect(lambda x: self.setPinValue(x,"claw",3))
-        ledPinCombo.textActivated.connect(lambda x: self.setPinValue(x,"led",1))
-        shoulderEnableCheck.stateChanged.connect(lambda x: self.setEnableState(x,"shoulder"))
-        elbowEnableCheck.stateChanged.connect(lambda x: self.setEnableState(x,"elbow"))
-        wristEnableCheck.stateChanged.connect(lambda x: self.setEnableState(x,"wrist"))
-        clawEnableCheck.stateChanged.connect(lambda x: self.setEnableState(x,"claw"))
-        rotateEnableCheck.stateChanged.connect(lambda x: self.setEnableState(x,"rotate"))
-        ledEnableCheck.stateChanged.connect(lambda x: self.setEnableState(x,"led"))
+        setupGPIOButton = CustomQPushButton("Setup GPIO")
         setupGPIOButton.clicked.connect(self.setupGPIO)
+        vLayout.addWidget(setupGPIOButton)
 
         # Create a widget, define the vLayout to it and then assign the widget to be the main widget of the main window
         widget = QWidget()
         widget.setLayout(vLayout)
         self.setWidget(widget)
-        
+
+    # Return a layout with a label above a widget
+    def labelledLayout(self, text, widget):
+        layout = QVBoxLayout()
+        layout.addWidget(CustomQLabel(text))
+        layout.addWidget(widget)
+        return layout
+
     #Set the pin values in the pins object when the combo boxes are used
     def setPinValue(self, arg, pinType, pinNumber):
         self.pins.pins[pinType][pinNumber] = arg
@@ -350,17 +189,45 @@ class ConfigWindow(QScrollArea):
             setState = True
         self.pins.pins[motorType]["enable"] = setState
 
-    # When the setup GPIO button is pushed, call the function in the hardware library
+    # When the setup GPIO button is pushed, queue the function in the hardware library so the window does not freeze
+    # The pins are checked first, so a bad assignment is reported before any device is created
     def setupGPIO(self):
+        self.readRemoteSettings()
+        problems = validatePins(self.pins, self.robotArmControl.remote, self.robotArmControl.remoteIP)
+        if problems:
+            CustomQMessageBox("Invalid Pins", "\n".join(problems))
+            return
+
+        self.robotArmControl.submit("createGPIODevices", callback=lambda future: self.gpioSetupFinished.emit(future.exception() is None and bool(future.result())))
+
+    # Copy the remote GPIO settings into the hardware library, if the widgets have been built
+    def readRemoteSettings(self):
+        if not self.built:
+            return
         if self.remoteGPIOEnableCombo.currentText() == "Yes":
             self.robotArmControl.remote = True
             self.robotArmControl.remoteIP = self.remoteGPIOIP.text()
         else:
             self.robotArmControl.remote = False
-            
-        connect = self.robotArmControl.createGPIODevices()
 
-        # Report if the connection is sucessful or not
+    # When the save button is pushed, store the current settings under the profile name
+    def saveProfile(self):
+        self.readRemoteSettings()
+        name = self.profileNameEdit.text().strip()
+        if not name:
+            CustomQMessageBox("Profile Error", "Enter a name for the profile.")
+            return
+        profile = PinProfile(name, self.pins, self.robotArmControl.remote, self.robotArmControl.remoteIP, self.autoApplyCheck.isChecked())
+        try:
+            saveProfile(profile, self.profilesPath)
+        except (ProfileError, OSError) as error:
+            CustomQMessageBox("Profile Error", str(error))
+            return
+        self.profileName = name
+        self.logger.info(f"Saved profile {name} to {self.profilesPath}")
+
+    # Report if the connection is sucessful or not, once the executor has finished
+    def reportGPIOSetup(self, connect):
         if connect == True:
             messageBox = CustomQMessageBox("Connected", "Successfully connected.")
         else:
@@ -368,7 +235,7 @@ class ConfigWindow(QScrollArea):
 
 class MainWindow(QMainWindow):
     """Create our main window, sub-classed from the QMainWindow class"""
-    def __init__(self, configWindow, pins, logger, robotArmControl, windowWidth = 400, windowHeight = 700):
+    def __init__(self, configWindow, pins, logger, robotArmControl, windowWidth = 400, windowHeight = 780):
         super().__init__()
 
         # Variables to hold useful values
@@ -379,6 +246,9 @@ class MainWindow(QMainWindow):
         self.pins = pins
         self.robotArmControl = robotArmControl
 
+        # Event filter timing input events, installed on the application while tracing
+        self.inputEventTimer = None
+
         #Set the window sizes
         self.setMaximumHeight(windowHeight)
         self.setMaximumWidth(windowWidth)
@@ -400,9 +270,17 @@ class MainWindow(QMainWindow):
         configureMenu = menuBar.addMenu("&Configure")
         configureMenu.setFont(font)
         configApiMenuAction = configureMenu.addAction("Configure Pins")
+        recordingMenu = menuBar.addMenu("&Recording")
+        recordingMenu.setFont(font)
+        startRecordingAction = recordingMenu.addAction("Start Recording")
+        stopRecordingAction = recordingMenu.addAction("Stop Recording")
+        replayRecordingAction = recordingMenu.addAction("Replay Recording")
 
         #Connect signals to slots to show the other windows when the menu options are clicked
         configApiMenuAction.triggered.connect(self.showConfigWindow)
+        startRecordingAction.triggered.connect(self.startRecording)
+        stopRecordingAction.triggered.connect(self.stopRecording)
+        replayRecordingAction.triggered.connect(self.replayRecording)
 
         # Create the required widgets for controlling the speed of the motors
         speedLabel = CustomQLabel("Movement Speed")
@@ -411,6 +289,9 @@ class MainWindow(QMainWindow):
         speedSlider.setMaximum(255)
         speedSlider.setValue(255)
 
+        # Create a checkbox to ramp motors up and down smoothly rather than jumping straight to speed
+        self.smoothCheck = CustomQCheckBox("Smooth acceleration")
+
         # Create the widgets for the rotation buttons
         rotateLabel = CustomQLabel("Rotation")
         leftRotateButton = CustomQPushButton("&Left")
@@ -451,6 +332,21 @@ class MainWindow(QMainWindow):
         clawHLayout.addWidget(closeClawButton)
         clawHLayout.addWidget(openClawButton)
 
+        # Create the widgets to move the claw to a point, in millimetres from the base
+        clawPositionLabel = CustomQLabel("Claw Position (x, y, z mm)")
+        self.clawXEdit = CustomQLineEdit("150")
+        self.clawYEdit = CustomQLineEdit("0")
+        self.clawZEdit = CustomQLineEdit("100")
+        moveClawButton = CustomQPushButton("&Move")
+        clawPositionHLayout = QHBoxLayout()
+        clawPositionHLayout.addWidget(self.clawXEdit)
+        clawPositionHLayout.addWidget(self.clawYEdit)
+        clawPositionHLayout.addWidget(self.clawZEdit)
+        clawPositionHLayout.addWidget(moveClawButton)
+
+        # Create a button to stop every joint at once
+        stopAllButton = CustomQPushButton("&Stop All")
+
         # Create the widgets for the LED buttons and slider
         ledLabel = CustomQLabel("Light")
         ledButton = CustomQPushButton("On")
@@ -468,6 +364,7 @@ class MainWindow(QMainWindow):
         # Create the layout for the main window
         vLayout.addWidget(speedLabel)
         vLayout.addWidget(speedSlider)
+        vLayout.addWidget(self.smoothCheck)
     
         vLayout.addWidget(spacerLabel)
         vLayout.addWidget(shoulderLabel)
@@ -493,6 +390,13 @@ class MainWindow(QMainWindow):
         vLayout.addWidget(rotateLabel)
         vLayout.addLayout(rotateHLayout)
 
+        vLayout.addWidget(spacerLabel)
+        vLayout.addWidget(clawPositionLabel)
+        vLayout.addLayout(clawPositionHLayout)
+
+        vLayout.addWidget(spacerLabel)
+        vLayout.addWidget(stopAllButton)
+
         # Create a widget, define the vLayout to it and then assign the widget to be the main widget of the main window
         widget = QWidget()
         widget.setLayout(vLayout)
@@ -525,6 +429,8 @@ class MainWindow(QMainWindow):
         closeClawButton.pressed.connect(lambda: self.buttonPressed("claw","extend"))
         closeClawButton.released.connect(lambda: self.buttonReleased("claw","extend"))
         ledButton.toggled.connect(self.ledButtonPressed)
+        moveClawButton.clicked.connect(self.moveClawPressed)
+        stopAllButton.clicked.connect(self.stopAllPressed)
 
     # Slot used when window is closed
     def closeEvent(self, args):
@@ -538,38 +444,90 @@ class MainWindow(QMainWindow):
     # Create a function to set the speed instance variable
     def setMotorSpeed(self,speedValue):
         self.motorSpeed = speedValue / 255
-        self.robotArmControl.motorSpeed = self.motorSpeed
+        self.robotArmControl.setContinuousValue("speed", self.motorSpeed)
         
     # Create a function to set the LED brightness variable
     def setLedBrightness(self, brightnessValue):
         self.ledBrightness = brightnessValue / 255
         self.robotArmControl.ledBrightness = self.ledBrightness
 
+    # Create a function that times a slot as the first span of a new trace while tracing, starting from its input event
+    def traceSlot(self, name):
+        start = None
+        if self.inputEventTimer != None and self.inputEventTimer.lastInputTime != None and time.perf_counter() - self.inputEventTimer.lastInputTime < 1:
+            start = self.inputEventTimer.lastInputTime
+        return self.robotArmControl.traceSpan(name, "qt", start, newTrace=True)
+
     # Create a function to handle if a motor control button is pressed
     def buttonPressed(self, motorType, direction):
-        self.robotArmControl.motorSpeed = self.motorSpeed
-        #self.robotArmControl.setMotorSpeed(motorType)
-        self.robotArmControl.driveMotor(motorType, direction)
+        with self.traceSlot(f"buttonPressed {motorType}"):
+            # The speed is set on the executor, in order with the drive, rather than from this thread
+            self.robotArmControl.submit("setMotorSpeed", self.motorSpeed)
+            if self.smoothCheck.isChecked():
+                self.robotArmControl.submit("driveMotorRamped", motorType, direction)
+            else:
+                self.robotArmControl.submit("driveMotor", motorType, direction)
 
     def buttonReleased(self,motorType, direction):
-        self.robotArmControl.stopMotor(motorType)
+        with self.traceSlot(f"buttonReleased {motorType}"):
+            if self.smoothCheck.isChecked():
+                self.robotArmControl.submit("stopMotorRamped", motorType)
+            else:
+                self.robotArmControl.submit("stopMotor", motorType)
+
+    # Create a function to move the claw to the point entered. The move runs on the executor, so a point out of reach is logged
+    def moveClawPressed(self):
+        try:
+            target = [float(edit.text()) for edit in (self.clawXEdit, self.clawYEdit, self.clawZEdit)]
+        except ValueError:
+            CustomQMessageBox("Invalid Position", "The claw position must be three numbers, in millimetres")
+            return
+        self.robotArmControl.submit("moveClawTo", *target, self.motorSpeed)
+
+    # Create a function to stop every joint in one pass. Any replay in progress is cancelled first
+    def stopAllPressed(self):
+        with self.traceSlot("stopAllPressed"):
+            self.robotArmControl.cancelReplay()
+            self.robotArmControl.submit("stopMotors")
+
+    # Slots used to record the commands sent to the arm and to replay them
+    def startRecording(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Record to", "", "Timelines (*.timeline)")
+        if path:
+            self.robotArmControl.submit("startRecording", path)
+
+    def stopRecording(self):
+        self.robotArmControl.submit("stopRecording")
+
+    # The replay runs on a worker of its own, so the controls still work while it plays
+    def replayRecording(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Replay", "", "Timelines (*.timeline)")
+        if path:
+            self.robotArmControl.runInBackground("replayRecording", path, callback=self.replayFinished)
+
+    def replayFinished(self, future):
+        if future.exception() != None:
+            self.logger.error(f"Replay failed: {future.exception()}")
+        else:
+            self.logger.info(f"Replay finished: {future.result()['summary']}")
 
     # Create a function to handle if the LED control button is pressed
     def ledButtonPressed(self, buttonState):
-        if buttonState:
-            self.ledSlider.setDisabled(False)
-            self.robotArmControl.controlLedBrightness()
-        else:
-            self.robotArmControl.stopLed()
-            self.ledSlider.setDisabled(True)
-
-    # Create a function to send a different brightness value when the LED brightness slider is changed
+        with self.traceSlot("ledButtonPressed"):
+            if buttonState:
+                self.ledSlider.setDisabled(False)
+                self.robotArmControl.submit("controlLedBrightness")
+            else:
+                self.robotArmControl.submit("stopLed")
+                self.ledSlider.setDisabled(True)
+
+    # Create a function to send a different brightness value when the LED brightness slider is changed. Values are coalesced so a drag does not flood the GPIO
     def sendLedBrightness(self):
-        self.robotArmControl.controlLedBrightness()
+        self.robotArmControl.setContinuousValue("led", self.ledBrightness)
 
 class CustomQApplication(QApplication):
     """Create a class based on QApplication and define windows"""
-    def __init__(self,args):
+    def __init__(self,args, profileName=None, profilesPath=defaultProfilesPath, simulate=False, tracePath=None, isolate=False):
         super().__init__(args)
         #Set logging format
         logging.basicConfig(format='%(asctime)s %(message)s')    
@@ -584,16 +542,71 @@ class CustomQApplication(QApplication):
         pins = Pins()
 
         # Create an object to allow hardware control 
-        robotArmControl = RobotArmControl(pins, 1, 1, logger, remote=False)
+        # A simulated arm can stand in for the hardware. It runs in step with the wall clock so the controls feel real
+        simulator = None
+        if isolate:
+            # The hardware, or the simulated arm, is driven from a separate process that stops the motors if this one hangs
+            from isolatedControl import IsolatedArmControl
+            robotArmControl = IsolatedArmControl(pins, 1, 1, logger, remote=False, simulate=simulate)
+        else:
+            if simulate:
+                from simulatedArm import ArmSimulator
+                simulator = ArmSimulator(logger)
+                simulator.startRealTime()
+            robotArmControl = RobotArmControl(pins, 1, 1, logger, remote=False, simulator=simulator)
+
+        # Load a saved profile if one was asked for. An invalid profile stops the application before any window is shown
+        profile = None
+        if profileName != None:
+            try:
+                profile = loadProfile(profileName, profilesPath)
+            except ProfileError as error:
+                raise SystemExit(str(error))
+            profile.applyTo(pins, robotArmControl)
+
+        # Run hardware commands on a worker thread, or in the controller process, so the windows never wait on GPIO
+        robotArmControl.startExecutor()
+
+        # The controller process stops the motors if the heartbeat stops. It is beaten from this event loop, so a hang
+        # of the window, and not only of this whole process, stops them
+        if isolate:
+            heartbeatTimer = QTimer()
+            heartbeatTimer.timeout.connect(robotArmControl.heartbeat)
+            heartbeatTimer.start(int(robotArmControl.heartbeatInterval * 1000))
 
         # Create windows and pass in the useful objects
-        configWindow = ConfigWindow(pins, logger, robotArmControl)
+        configWindow = ConfigWindow(pins, logger, robotArmControl, profileName=profileName or "", profilesPath=profilesPath)
         mainWindow = MainWindow(configWindow, pins, logger, robotArmControl)
 
+        # While tracing, each input event is timed so a command's trace starts from the click or key press behind it
+        if tracePath != None:
+            tracer = robotArmControl.enableTracing()
+            mainWindow.inputEventTimer = InputEventTimer()
+            self.installEventFilter(mainWindow.inputEventTimer)
+
+        # Profiles marked to apply on start create the devices straight away, without opening the config window
+        if profile != None and profile.autoApply:
+            configWindow.setupGPIO()
+
         self.exec()
+        robotArmControl.stopExecutor()
+        if simulator != None:
+            simulator.stop()
+        if tracePath != None:
+            tracer.exportChromeTrace(tracePath)
+            logger.info(f"Trace written to {tracePath}\n{tracer.summaryText()}")
 
 # Only run this code when the file is run directly
 if __name__ == "__main__":
-    
+    parser = argparse.ArgumentParser(description="Control the robot arm from a window")
+    parser.add_argument("--profile", help="name of a saved pin profile to load")
+    parser.add_argument("--profiles", default=defaultProfilesPath, help="profiles file to use")
+    parser.add_argument("--simulate", action="store_true", help="drive a simulated arm instead of GPIO")
+    parser.add_argument("--trace", metavar="PATH", help="trace commands and write them to PATH as a Chrome trace on exit")
+    parser.add_argument("--isolate", action="store_true", help="drive the GPIO from a separate process, which stops the motors if the window hangs")
+    args, qtArgs = parser.parse_known_args()
+    if args.isolate and args.trace:
+        parser.error("--trace cannot follow commands into the separate process of --isolate")
+
     # Create an instance of the custom application class
-    app = CustomQApplication([])
\ No newline at end of file
+    app = CustomQApplication(sys.argv[:1] + qtArgs, args.profile, args.profiles, args.simulate, args.trace, args.isolate)
\ No newline at end of file
@@ -1,29 +1,121 @@
-from gpiozero import Device, PWMLED, Motor
-from gpiozero.pins.pigpio import PiGPIOFactory
+from concurrent.futures import Future
+from commandExecutor import CommandExecutor
+from coalescingWriter import CoalescingWriter
+from motionRecorder import MotionRecorder, MotionReplayer, ReplayRunner, readRecords
+from metrics import MetricsRegistry, latencySummary
+from connectionManager import ConnectionManager
+from timerWheel import StopTimers
+from jointRegistry import BACKWARD, FORWARD, STOP, JointRegistry, directionNames, directionsByName
+from contextlib import nullcontext
+from functools import lru_cache
 import logging
 import sys
+import threading
+import time
+
+# Returned by traceSpan() when tracing is off
+nullSpan = nullcontext()
+
+# The directions that drive each motor forwards or backwards
+forwardDirections = ("extend", "left")
+backwardDirections = ("retract", "right")
 
 class Pins():
     """Class used to store details of the pins used for motor / LED control"""
+    # Schema of every output on the arm: its name, its description in the config window and the label of each of its
+    # pins, in pin number order. Adding a joint here adds it to the pins object and the config window
+    schema = (
+        ("rotate", "rotate motor", ("Pin 1", "Pin 2", "Speed")),
+        ("shoulder", "shoulder motor", ("Pin 1", "Pin 2", "Speed")),
+        ("elbow", "elbow motor", ("Pin 1", "Pin 2", "Speed")),
+        ("wrist", "wrist motor", ("Pin 1", "Pin 2", "Speed")),
+        ("claw", "claw motor", ("Pin 1", "Pin 2", "Speed")),
+        ("led", "LED", ("Pin",)),
+    )
+
+    # Names of the GPIO pins that can be assigned to an output
+    pinChoices = ["GPIO2","GPIO3","GPIO4","GPIO14","GPIO15","GPIO17","GPIO18","GPIO27","GPIO22","GPIO23","GPIO24","GPIO10","GPIO9","GPIO25","GPIO11","GPIO8","GPIO7","GPIO0","GPIO1","GPIO5","GPIO6","GPIO12","GPIO13","GPIO19","GPIO16","GPIO26","GPIO20","GPIO21"]
+
     def __init__(self):
         self.pins = {}
-        self.pins["rotate"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["shoulder"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["elbow"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["wrist"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["claw"] = {1:None, 2:None, 3:None, "enable":False}
-        self.pins["led"] = {1:None, "enable":False}
+        for outputType, description, pinLabels in self.schema:
+            self.pins[outputType] = {pinNumber: None for pinNumber in range(1, len(pinLabels) + 1)}
+            self.pins[outputType]["enable"] = False
+
+    @classmethod
+    def allEnabled(cls):
+        """Return a Pins object with every output enabled on pins of its own, for demos and benchmarks on mock or simulated pins"""
+        pins = cls()
+        pinNames = iter(cls.pinChoices)
+        for outputType in pins.pins:
+            for pinNumber in pins.pins[outputType]:
+                if pinNumber != "enable":
+                    pins.pins[outputType][pinNumber] = next(pinNames)
+            pins.pins[outputType]["enable"] = True
+        return pins
+
+# Names of the motors on the arm
+motorTypesList = [outputType for outputType, description, pinLabels in Pins.schema if outputType != "led"]
+
+def checkLevel(value, name="value"):
+    """Return a speed or brightness as a float, raising ValueError if it is not a number between 0 and 1. NaN is rejected"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number between 0 and 1: {value!r}")
+    if not 0.0 <= value <= 1.0:
+        raise ValueError(f"{name} must be between 0 and 1: {value}")
+    return value
+
+@lru_cache(maxsize=None)
+def isRaspberryPi():
+    """Determine if the code is running on a Raspberry Pi. The answer is cached, so the file is only read once per process"""
+    try:
+        with open('/sys/firmware/devicetree/base/model', 'r') as m:
+            if 'raspberry pi' in m.read().lower(): 
+                return True
+    except Exception: 
+        pass
+    return False
+
+class ChangeReport():
+    """Class used to describe what a call to createGPIODevices changed. It is truthy when setup succeeded"""
+    def __init__(self, success=True, error=None):
+        self.success = success
+        self.error = error
+        self.created = []
+        self.rebuilt = []
+        self.closed = []
+        self.unchanged = []
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return f"ChangeReport(success={self.success}, created={self.created}, rebuilt={self.rebuilt}, closed={self.closed}, unchanged={self.unchanged})"
+
+    def asDict(self):
+        return {"success": self.success, "error": self.error, "created": self.created, "rebuilt": self.rebuilt, "closed": self.closed, "unchanged": self.unchanged}
 
 class RobotArmControl():
     """Class used to interact with GPIO pins and can connect to a remote device as well"""
-    def __init__(self,pins,motorSpeed,ledBrightness, logger, remote=False, remoteIP = ""):
-        # Variables used to allow instance-wide access
+    def __init__(self,pins,motorSpeed,ledBrightness, logger, remote=False, remoteIP = "", maxWriteRate=20, pinFactory=None, verbose=False, simulator=None):
+        # Variables used to allow instance-wide access. Per-command log messages are only written when verbose is set
         self.logger = logger
+        self.verbose = verbose
         self.raspberryPi = self.isRaspberryPi()
 
         self.remote = remote
         self.remoteIP = remoteIP
-        self.factory = None
+
+        # A pin factory, such as gpiozero's MockFactory, can be passed in to drive devices without a Raspberry Pi
+        self.pinFactory = pinFactory
+
+        # A simulator, such as simulatedArm.ArmSimulator, can be passed in to create simulated devices in place of gpiozero's.
+        # Timed moves, ramps and joint state then run on its simulated time, so they land at the right simulated times
+        # however fast a script runs
+        self.simulator = simulator
+        self.clock = time.monotonic if simulator == None else simulator.clock
 
         self.pins = pins
         self.motorSpeed = motorSpeed
@@ -33,8 +125,67 @@ class RobotArmControl():
         self.motorObjects = {}
         self.led = None
 
+        # The pins and pin factory each open device was created with, used to work out what needs rebuilding
+        self.realizedDevices = {}
+
+        # Direction of each motor that is currently being driven, and whether the LED is lit
+        self.motorDirections = {}
+        self.ledOn = False
+
+        # Scheduler used to play acceleration / deceleration ramps, created on first use
+        self.profileScheduler = None
+        self.profileRate = 100
+
+        # Held by every drive, stop and ramp write, and by timed and soft limit stops. The profile scheduler uses it as its
+        # own lock, so ramp writes from the scheduler thread and stops fired from the timer wheel thread, when there is no
+        # executor to hand them to, can never interleave with a command on the executor or caller's thread
+        self.outputLock = threading.RLock()
+
+        # Pending timed stops, keyed by motor name, and soft limit stops, keyed by joint ID, on one shared timer wheel
+        self.stopTimers = StopTimers(self.logger, simulator)
+
+        # Writer used to coalesce continuous values, such as slider positions, into rate-limited writes
+        self.maxWriteRate = maxWriteRate
+        self.coalescer = None
+
+        # Optional worker used to run commands away from the caller's thread
+        self.executor = None
+
+        # Counters and latency histograms for commands, GPIO writes and connection errors
+        self.metrics = MetricsRegistry()
+        self.metrics.describe("robotarm_commands_total", "Commands received, by joint and operation")
+        self.metrics.describe("robotarm_gpio_write_seconds", "Time spent writing to GPIO devices, by operation")
+        self.metrics.describe("robotarm_remote_round_trip_seconds", "Time spent on GPIO writes that went to remote pigpio, by operation")
+        self.metrics.describe("robotarm_connection_errors_total", "Failed connections to remote pigpio")
+        self.metrics.describe("robotarm_gpio_writes_total", "GPIO writes issued, and writes suppressed as the output was already in that state, by joint")
+        self.commandCounters = {}
+        self.writeHistograms = {}
+
+        # Table of joints indexed by ID, holding pre-bound devices, counters and the shadow state of each output for the
+        # drive and stop hot paths. Writes that would not change an output are skipped, saving a round trip on remote GPIO
+        self.joints = JointRegistry(pins, self.metrics)
+
+        # Optional dead reckoned position of each joint
+        self.jointState = None
+        self.metrics.describe("robotarm_soft_limit_stops_total", "Joints stopped automatically at a soft limit")
+
+        # Optional inverse kinematics solver used to move the claw to a point, created by enableKinematics()
+        self.kinematics = None
+
+        # Cached, health-checked connections to remote pigpio hosts
+        self.connectionManager = ConnectionManager(self.logger, self.metrics, onReconnect=self.handleReconnect)
+
+        # Optional span tracer, created by enableTracing()
+        self.tracer = None
+
+        # Optional recorder that commands are logged to, and the runner that plays replays and macros one at a time
+        self.recorder = None
+        self.replays = ReplayRunner()
+
         # Print some messages to show information
-        if self.raspberryPi:
+        if self.simulator != None:
+            self.logger.info("You are running against a simulated arm.")
+        elif self.raspberryPi:
             self.logger.info("You are running on a Raspberry Pi.")
         elif not self.raspberryPi:
             self.logger.info("You are not running on a Raspberry Pi.")
@@ -43,102 +194,894 @@ class RobotArmControl():
         else:
             self.logger.info("Remote GPIO is not configured")
 
-    def createGPIODevices(self):
-        """Generate the GPIO objects"""
-        # Connect to remote pins if this is configured
-        if self.remote and self.factory == None:
+    def createGPIODevices(self, force=False):
+        """Generate the GPIO objects
+
+        Only devices whose pins, enable flag or pin factory have changed since the last call are closed and re-created,
+        so motors that are unchanged keep running. Passing force re-creates every enabled device. Returns a ChangeReport."""
+        # Connect to remote pins if this is configured. Connections are cached per host, so switching back to a host is instant
+        remoteFactory = None
+        if self.remote and self.simulator == None:
             try:
-                self.factory = PiGPIOFactory(host=self.remoteIP)
-                Device.pin_factory = self.factory
-            except IOError:
-                return False
-        # Generate motor objects for each defined motor
-        if self.raspberryPi or self.remote == True:
-            motorTypesList = ["claw","shoulder","elbow","wrist","rotate"]
-            for motorType in motorTypesList:
-                # Close the GPIO if already defined
-                if self.pins.pins[motorType]["enable"] and motorType in self.motorObjects:
-                    self.logger.info(f"Destroying existing GPIO and creating new: {motorType}")
-                    self.closeGPIO(motorType)
-                # Create the objects for control
-                if self.pins.pins[motorType]["enable"] and self.pins.pins[motorType][1] != None and self.pins.pins[motorType][2] != None and self.pins.pins[motorType][3] != None:
-                    self.motorObjects[motorType] = Motor(self.pins.pins[motorType][1],self.pins.pins[motorType][2],pwm=True,enable=self.pins.pins[motorType][3])
-            # Close the PWMLED object if already defined
-            if self.pins.pins["led"]["enable"] and self.led != None:
-                self.logger.info("Destroying existing GPIO for LED and creating new")
-                self.closeGPIO("led")
-            # Create the PWMLED object
-            if self.pins.pins["led"]["enable"]:           
-                self.led = PWMLED(self.pins.pins["led"][1])
-        return True
-    
+                remoteFactory = self.connectionManager.use(self.remoteIP)
+            except IOError as error:
+                return ChangeReport(False, error)
+        report = ChangeReport()
+        if not self.gpioAvailable():
+            return report
+
+        # gpiozero is only loaded once devices are actually needed, so simulated and headless start-up stays quick
+        if self.simulator == None:
+            from gpiozero import PWMLED, Motor
+
+        # Work out the wanted configuration of every output, then compare it with the open devices. The factory is passed to
+        # each device rather than set globally, so several RobotArmControl objects can drive different arms in one process
+        if self.simulator != None:
+            factory = self.simulator
+        else:
+            factory = self.pinFactory if self.pinFactory != None else remoteFactory
+        changes = []
+        for outputType in motorTypesList + ["led"]:
+            wanted = self.deviceSpec(outputType, factory)
+            current = self.realizedDevices.get(outputType)
+            if wanted == current and not (force and wanted != None):
+                if wanted != None:
+                    report.unchanged.append(outputType)
+            else:
+                changes.append((outputType, wanted, current))
+
+        # Close everything that is changing first, as pins may have moved from one output to another
+        for outputType, wanted, current in changes:
+            if current != None:
+                if self.verbose:
+                    self.logger.info(f"Destroying existing GPIO: {outputType}")
+                self.closeGPIO(outputType)
+
+        for outputType, wanted, current in changes:
+            if wanted != None:
+                if self.simulator != None:
+                    self.bindDevice(outputType, self.simulator.createLed() if outputType == "led" else self.simulator.createMotor(outputType))
+                elif outputType == "led":
+                    self.bindDevice(outputType, PWMLED(wanted[0],pin_factory=factory))
+                else:
+                    self.bindDevice(outputType, Motor(wanted[0],wanted[1],pwm=True,enable=wanted[2],pin_factory=factory))
+                self.realizedDevices[outputType] = wanted
+                (report.rebuilt if current != None else report.created).append(outputType)
+            else:
+                report.closed.append(outputType)
+        return report
+
+    def bindDevice(self, outputType, device):
+        """Store the device for an output, both by name and in its joint record so commands reach it without a look-up"""
+        if outputType == "led":
+            self.led = device
+        else:
+            self.motorObjects[outputType] = device
+        joint = self.joints.byName(outputType)
+        joint.device = device
+        joint.written = None
+
+    def handleReconnect(self, host, factory):
+        """Called by the connection manager after a dropped host comes back, to re-create the devices on the new connection"""
+        if self.remote and host == self.connectionManager.currentHost:
+            self.logger.warning(f"Re-creating GPIO devices and resyncing outputs after reconnecting to {host}")
+            self.submit("resyncOutputs")
+
+    def resyncOutputs(self):
+        """Write the last known state of every output to its device again, whether or not the shadow state says it is needed
+
+        Used after a reconnect, when the devices may have been re-created or the remote pins reset, so the hardware is
+        brought back in line with what the controller believes. Devices are created first where needed. Returns the
+        ChangeReport from createGPIODevices."""
+        # Closing a rebuilt device forgets that its motor was moving, so the direction of every motor and whether the LED
+        # is lit are put back once it is driven again, along with its joint state velocity and soft limit stop
+        values = [joint.written for joint in self.joints]
+        directions = dict(self.motorDirections)
+        ledOn = self.ledOn
+        report = self.createGPIODevices()
+        if not report:
+            return report
+        for joint, value in zip(self.joints, values):
+            if joint.device == None or value == None or not joint.pins["enable"]:
+                continue
+            startTime = time.perf_counter()
+            joint.device.value = value
+            self.observeWrite("resync", startTime)
+            joint.written = value
+            joint.issuedCounter.inc()
+            if joint.name == "led":
+                self.ledOn = ledOn
+                continue
+            if joint.name in directions:
+                self.motorDirections[joint.name] = directions[joint.name]
+            if self.jointState != None:
+                self.trackJoint(joint.id, value)
+        return report
+
+    def writeStats(self):
+        """Return how many GPIO writes have been issued and how many were suppressed by the shadow state, by joint"""
+        return {joint.name: {"issued": joint.issuedCounter.value, "suppressed": joint.suppressedCounter.value} for joint in self.joints}
+
+    def connectionStats(self):
+        """Return connect time, round trip time and failure counts for every remote host used so far"""
+        return self.connectionManager.stats()
+
+    def deviceSpec(self, outputType, factory):
+        """Return the pins and factory an output should be created with, or None if it should not exist"""
+        pins = self.pins.pins[outputType]
+        pinNumbers = [pinNumber for pinNumber in pins if pinNumber != "enable"]
+        if not pins["enable"] or any(pins[pinNumber] == None for pinNumber in pinNumbers):
+            return None
+        return tuple(pins[pinNumber] for pinNumber in pinNumbers) + (factory,)
+
+    def startExecutor(self, name="RobotArmExecutor"):
+        """Run commands submitted through submit() on a dedicated worker thread"""
+        if self.executor == None:
+            self.executor = CommandExecutor(self.logger, name)
+        self.executor.start()
+
+    def stopExecutor(self):
+        """Stop the worker thread once queued commands have been run"""
+        if self.executor != None:
+            self.executor.stop()
+
+    def submit(self, commandName, *args, callback=None):
+        """Queue a command, such as "driveMotor", and return a Future for its result
+
+        Without a running executor, or when called from the executor itself, the command is run straight away and a completed Future is returned."""
+        command = getattr(self, commandName)
+        if self.tracer != None:
+            command = self.tracer.traced(command, commandName)
+        if self.executor != None and self.executor.running and threading.current_thread() is not self.executor.thread:
+            return self.executor.submit(command, *args, callback=callback)
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        try:
+            future.set_result(command(*args))
+        except Exception as error:
+            # Logged as the executor logs the commands it runs, as callers such as a replay do not wait on the Future
+            self.logger.exception("Command %s failed", commandName)
+            future.set_exception(error)
+        return future
+
+    def submitAsync(self, commandName, *args):
+        """Queue a command and return an awaitable for use from an asyncio event loop"""
+        import asyncio
+        return asyncio.wrap_future(self.submit(commandName, *args))
+
+    def commandLatencyStats(self):
+        """Return recent queueing latency for submitted commands, in milliseconds"""
+        if self.executor == None:
+            return latencySummary([])
+        return self.executor.latencyStats()
+
+    def gpioAvailable(self):
+        """Determine whether commands are written to GPIO devices rather than simulated"""
+        return self.raspberryPi or self.remote or self.pinFactory != None or self.simulator != None
+
     def isRaspberryPi(self):
         """Determine if the code is running on a Raspberry Pi"""
-        try:
-            with open('/sys/firmware/devicetree/base/model', 'r') as m:
-                if 'raspberry pi' in m.read().lower(): 
-                    return True
-        except Exception: 
-            pass
-        return False
+        return isRaspberryPi()
     
-    def driveMotor(self,motorType, direction):
-        """Function to drive a motor, with the type defined by the previous function"""
-        self.logger.info(f"Drive motor function called for {motorType} motor, with direction {direction}")
-
-        # Use some conditions to determine whether to write to GPIO pins or to simulate
-        if (self.raspberryPi or self.remote) and self.pins.pins[motorType]["enable"]:
-            motor = self.motorObjects[motorType]
-        
-            # The direction is controlled by a function argument
-            if direction == "extend" or direction == "left":
-                motor.forward(self.motorSpeed)
-            elif direction == "retract" or direction == "right":
-                motor.backward(self.motorSpeed)
-        elif not self.pins.pins[motorType]["enable"]:
-            self.logger.info("Motor was not enabled")
+    def driveMotor(self,motorType, direction, speed=None):
+        """Function to drive a motor, with the type defined by the previous function, at speed or else the arm's speed.
+        Raises ValueError for an unknown motor or direction, or a bad speed, before anything is recorded or written"""
+        jointId = self.jointId(motorType)
+        if direction not in directionsByName:
+            raise ValueError(f"Unknown direction for {motorType}: {direction}")
+        if speed != None:
+            speed = checkLevel(speed, "speed")
+        self.driveJoint(jointId, directionsByName[direction], direction, speed)
 
     def stopMotor(self,motorType):
-        """A function to stop the motor"""
-        self.logger.info(f"Stop motor function called for {motorType} motor")
-        if (self.raspberryPi or self.remote) and self.pins.pins[motorType]["enable"]:
-            motor = self.motorObjects[motorType]
-            motor.stop()
-        elif not self.pins.pins[motorType]["enable"]:
-            self.logger.info("Motor not enabled")
+        """A function to stop the motor. Raises ValueError for an unknown motor"""
+        self.stopJoint(self.jointId(motorType))
+
+    def jointId(self, motorType):
+        """Return the ID of a motor, for use with driveJoint and stopJoint. Raises ValueError for an unknown motor or the LED"""
+        jointId = self.joints.ids.get(motorType)
+        if jointId == None or motorType == "led":
+            raise ValueError(f"Unknown motor: {motorType}")
+        return jointId
+
+    def driveJoint(self, jointId, direction, directionName=None, speed=None):
+        """Drive a motor by joint ID in a Direction. This is the hot path that driveMotor uses once names are resolved
+
+        directionName is the name recorded for the move, which defaults to the name of the direction. speed only applies
+        to this move, leaving the arm's speed as it is, and defaults to it"""
+        with self.outputLock:
+            joint = self.joints.joints[jointId]
+            if directionName == None:
+                directionName = directionNames[direction]
+            motorSpeed = self.motorSpeed if speed == None else speed
+            if self.verbose:
+                self.logger.info(f"Drive motor function called for {joint.name} motor, with direction {directionName}")
+            joint.driveCounter.inc()
+            if self.recorder != None:
+                self.recorder.recordDrive(joint.name, directionName, motorSpeed)
+            if self.profileScheduler != None:
+                self.profileScheduler.cancel(joint.name)
+            self.stopTimers.cancel(joint.name)
+
+            # Use some conditions to determine whether to write to GPIO pins or to simulate
+            motor = joint.device
+            if motor != None and joint.pins["enable"] and self.gpioAvailable():
+                speed = motorSpeed if direction == FORWARD else (-motorSpeed if direction == BACKWARD else 0.0)
+                # A joint already at a soft limit is stopped rather than driven further into it
+                if self.jointState != None and self.jointState.atLimit(jointId, speed):
+                    self.logger.warning(f"Not driving {joint.name} {directionName}, as it is at its soft limit")
+                    self.stopJoint(jointId)
+                    return
+
+                # The direction is controlled by a function argument. A motor already running at this speed is not written again
+                if joint.written == speed:
+                    joint.suppressedCounter.inc()
+                else:
+                    startTime = time.perf_counter()
+                    if direction == FORWARD:
+                        motor.forward(motorSpeed)
+                    elif direction == BACKWARD:
+                        motor.backward(motorSpeed)
+                    self.observeWrite("drive", startTime)
+                    if direction != STOP:
+                        joint.written = speed
+                        joint.issuedCounter.inc()
+                self.motorDirections[joint.name] = directionName
+                if self.jointState != None:
+                    self.trackJoint(jointId, speed)
+            elif not joint.pins["enable"] and self.verbose:
+                self.logger.info("Motor was not enabled")
+
+    def stopJoint(self, jointId):
+        """Stop a motor by joint ID"""
+        with self.outputLock:
+            joint = self.joints.joints[jointId]
+            if self.verbose:
+                self.logger.info(f"Stop motor function called for {joint.name} motor")
+            joint.stopCounter.inc()
+            if self.recorder != None:
+                self.recorder.recordStop(joint.name)
+            if self.profileScheduler != None:
+                self.profileScheduler.cancel(joint.name)
+            self.stopTimers.cancel(joint.name)
+            motor = joint.device
+            if motor != None and joint.pins["enable"] and self.gpioAvailable():
+                if joint.written == 0.0:
+                    joint.suppressedCounter.inc()
+                else:
+                    startTime = time.perf_counter()
+                    motor.stop()
+                    self.observeWrite("stop", startTime)
+                    joint.written = 0.0
+                    joint.issuedCounter.inc()
+                self.motorDirections.pop(joint.name, None)
+                if self.jointState != None:
+                    self.trackJoint(jointId, 0.0)
+            elif not joint.pins["enable"] and self.verbose:
+                self.logger.info("Motor not enabled")
+
+    def driveMotorFor(self, motorType, direction, duration):
+        """Drive a motor for a number of seconds, then stop it"""
+        self.driveMotorUntil(motorType, direction, self.clock() + duration)
+
+    def driveMotorUntil(self, motorType, direction, deadline):
+        """Drive a motor until a deadline on self.clock(), which is time.monotonic() unless a simulator is used, then stop it
+
+        All timed stops share one timer wheel thread. Any other drive or stop command for the motor cancels its timed stop."""
+        self.driveMotor(motorType, direction)
+        self.scheduleTimedStop(motorType, deadline)
+
+    def scheduleTimedStop(self, motorType, deadline):
+        """Stop a motor at a deadline on self.clock(), replacing any timed stop it already has"""
+        with self.outputLock:
+            self.stopTimers.schedule(motorType, deadline, lambda token: self.submit("timedStop", motorType, token))
+
+    def timedStop(self, motorType, token):
+        """Stop a motor when its timed move ends, unless a newer command has replaced the move"""
+        with self.outputLock:
+            if self.stopTimers.claim(motorType, token):
+                self.stopMotor(motorType)
+
+    def timedStopStats(self):
+        """Return how late recent timed and soft limit stops landed compared with their deadlines, in milliseconds"""
+        return latencySummary(self.stopTimers.lateness)
+
+    def driveMotorRamped(self, motorType, direction, rampTime=0.5, profile="scurve"):
+        """Drive a motor, ramping its speed up over rampTime seconds with a "trapezoid" or "scurve" profile
+
+        If the motor is already moving, or part way through a ramp, the ramp starts from its current value."""
+        self.jointId(motorType)
+        if direction not in forwardDirections and direction not in backwardDirections:
+            raise ValueError(f"Unknown direction for {motorType}: {direction}")
+        self.countCommand(motorType, "driveRamped")
+        target = self.motorSpeed if direction in forwardDirections else -self.motorSpeed
+        with self.outputLock:
+            self.stopTimers.cancel(motorType)
+            self.startRamp(motorType, target, rampTime, profile)
+            if self.recorder != None:
+                self.recorder.recordDriveRamped(motorType, direction, self.motorSpeed, rampTime, profile)
+            if self.gpioAvailable() and self.pins.pins[motorType]["enable"]:
+                self.motorDirections[motorType] = direction
+
+    def stopMotorRamped(self, motorType, rampTime=0.5, profile="scurve"):
+        """Stop a motor, ramping its speed down to zero over rampTime seconds"""
+        self.jointId(motorType)
+        self.countCommand(motorType, "stopRamped")
+        with self.outputLock:
+            self.stopTimers.cancel(motorType)
+            self.startRamp(motorType, 0.0, rampTime, profile, onDone=self.finishRampedStop)
+            if self.recorder != None:
+                self.recorder.recordStopRamped(motorType, rampTime, profile)
+
+    def finishRampedStop(self, motorType):
+        """Forget the direction of a motor once it has ramped down to a stop, unless it has been driven again since"""
+        with self.outputLock:
+            if self.joints.joints[self.joints.ids[motorType]].written == 0.0:
+                self.motorDirections.pop(motorType, None)
+
+    def startRamp(self, motorType, target, rampTime, profile, onDone=None):
+        """Ramp a motor to a target value on the profile scheduler, creating the scheduler on first use"""
+        if not (self.gpioAvailable() and self.pins.pins[motorType]["enable"]):
+            return
+        # NumPy is only loaded the first time a ramp is used
+        from motionProfiles import ProfileScheduler
+        with self.outputLock:
+            if self.profileScheduler == None:
+                # Against a simulator, ramps are played on simulated time
+                if self.simulator != None:
+                    self.profileScheduler = ProfileScheduler(self.writeMotorValue, self.logger, self.profileRate, lock=self.outputLock, clock=self.simulator.clock)
+                    self.simulator.attach(self.profileScheduler)
+                else:
+                    self.profileScheduler = ProfileScheduler(self.writeMotorValue, self.logger, self.profileRate, lock=self.outputLock)
+            # A motor that is not ramping starts from the speed it was last driven at
+            direction = self.motorDirections.get(motorType)
+            current = 0.0 if direction == None else (self.motorSpeed if direction in forwardDirections else -self.motorSpeed)
+            self.profileScheduler.ramp(motorType, profile, current, target, rampTime, onDone)
+
+    def writeMotorValue(self, motorType, value):
+        """Set a motor to a signed value between -1 (backward) and 1 (forward). Used by the profile scheduler, which already
+        holds outputLock while it writes"""
+        jointId = self.joints.ids[motorType]
+        joint = self.joints.joints[jointId]
+        with self.outputLock:
+            if self.jointState != None and self.jointState.atLimit(jointId, value):
+                value = 0.0
+            if joint.written == value:
+                joint.suppressedCounter.inc()
+            else:
+                startTime = time.perf_counter()
+                self.motorObjects[motorType].value = value
+                self.observeWrite("ramp", startTime)
+                joint.written = value
+                joint.issuedCounter.inc()
+            if self.jointState != None:
+                self.trackJoint(jointId, value)
+
+    def enableJointState(self, travelRates=None, limits=None):
+        """Start estimating the position of every joint from the commands written to it, and return the estimator
+
+        travelRates maps joint names to the distance each travels in one second at full speed, in whatever unit the limits
+        use, and limits maps joint names to (lower, upper) soft limits. Joints start at position 0."""
+        # NumPy is only loaded when joint state is wanted
+        from jointState import JointStateEstimator
+        travelRates = travelRates or {}
+        self.jointState = JointStateEstimator(len(self.joints), [travelRates.get(joint.name, 1.0) for joint in self.joints], clock=self.clock)
+        for motorType, (lower, upper) in (limits or {}).items():
+            self.setSoftLimits(motorType, lower, upper)
+        return self.jointState
+
+    def requireJointState(self, action):
+        """Raise RuntimeError if joint state has not been enabled, naming the action that needs it"""
+        if self.jointState == None:
+            raise RuntimeError(f"Joint state must be enabled with enableJointState() to {action}")
+
+    def setSoftLimits(self, motorType, lower, upper):
+        """Set the soft limits of a joint, re-planning its limit stop if it is moving. Raises RuntimeError if joint state is off"""
+        self.requireJointState("set soft limits")
+        jointId = self.jointId(motorType)
+        self.jointState.setLimits(jointId, lower, upper)
+        self.trackJoint(jointId, self.jointState.velocities[jointId] / self.jointState.travelRates[jointId])
+
+    def homeJoint(self, motorType, position=0.0):
+        """Tell the estimator where a joint is, for example once it has been driven against a known end stop. Raises
+        RuntimeError if joint state is off"""
+        self.requireJointState("home a joint")
+        jointId = self.jointId(motorType)
+        self.jointState.setPosition(jointId, position)
+        self.trackJoint(jointId, self.jointState.velocities[jointId] / self.jointState.travelRates[jointId])
+
+    def jointPosition(self, motorType):
+        """Return the estimated position of a joint, or None if joint state is not enabled"""
+        if self.jointState == None:
+            return None
+        return self.jointState.position(self.jointId(motorType))
+
+    def jointPositions(self):
+        """Return the estimated position of every joint, keyed by name"""
+        if self.jointState == None:
+            return {}
+        positions = self.jointState.allPositions()
+        return {joint.name: float(positions[joint.id]) for joint in self.joints}
+
+    def trackJoint(self, jointId, speed):
+        """Record a joint's new signed speed in the estimator, and schedule a stop for when it will reach a soft limit"""
+        self.scheduleLimitStop(jointId, self.jointState.setVelocity(jointId, speed))
+
+    def scheduleLimitStop(self, jointId, timeToLimit):
+        """Replace a joint's pending soft limit stop with one timeToLimit seconds from now, if it is finite"""
+        if timeToLimit == float("inf"):
+            self.stopTimers.cancel(jointId)
+        else:
+            self.stopTimers.scheduleAfter(jointId, timeToLimit, lambda token: self.submit("softLimitStop", jointId, token))
+
+    def softLimitStop(self, jointId, token):
+        """Stop a joint that has reached a soft limit, unless a newer command has changed its motion since the stop was planned"""
+        with self.outputLock:
+            if self.jointState == None or not self.stopTimers.claim(jointId, token):
+                return
+            joint = self.joints[jointId]
+            self.logger.warning(f"Stopping {joint.name} at its soft limit, position {self.jointState.position(jointId):.3f}")
+            self.metrics.counter("robotarm_soft_limit_stops_total", joint=joint.name).inc()
+            self.stopJoint(jointId)
+
+    def enableKinematics(self, linkLengths=None, jointLimits=None, travelRates=None):
+        """Enable moveClawTo() and return the solver, starting joint state in degrees if it is not already enabled
+
+        linkLengths and jointLimits default to the figures in the kinematics module. The joint limits also become the
+        soft limits of the joints, and travelRates, in degrees per second at full speed, are used for the joint state."""
+        # NumPy is only loaded when kinematics are wanted
+        from kinematics import ArmKinematics, defaultJointLimits, defaultLinkLengths, defaultTravelRates
+        jointLimits = jointLimits or defaultJointLimits
+        self.kinematics = ArmKinematics(linkLengths or defaultLinkLengths, jointLimits)
+        if self.jointState == None:
+            self.enableJointState(travelRates or defaultTravelRates, jointLimits)
+        # Build the workspace index now, rather than on the first move
+        self.kinematics.index()
+        return self.kinematics
+
+    def solveClawTargets(self, targets):
+        """Return joint angles in degrees, as rows of (rotate, shoulder, elbow, wrist), and the distance left to each
+        target, for rows of (x, y, z) claw targets in millimetres. Every target is solved in one vectorized call"""
+        return self.kinematics.solve(targets)
+
+    def clawPosition(self):
+        """Return the estimated (x, y, z) position of the claw in millimetres, from the estimated joint angles"""
+        from kinematics import kinematicJoints
+        angles = [self.jointState.position(self.joints.ids[motorType]) for motorType in kinematicJoints]
+        return tuple(self.kinematics.forward(angles)[0].tolist())
+
+    def moveClawTo(self, x, y, z, speed=None, tolerance=1.0):
+        """Move the claw to a point, in millimetres from the base, driving the joints so they all arrive together
+
+        The joint angles come from the kinematics solver and the moves are timed from the estimated joint positions, so
+        the accuracy depends on the travel rates and on the joints having been homed. Raises ValueError if the point is
+        more than tolerance millimetres out of reach. Returns the driveMotors report, with the target angles and the
+        move's duration in seconds added."""
+        from kinematics import kinematicJoints
+        if self.kinematics == None:
+            self.enableKinematics()
+        speed = self.motorSpeed if speed == None else speed
+        if not 0 < speed <= 1:
+            raise ValueError(f"Speed must be above 0 and at most 1, not {speed}")
+        angles, errors = self.kinematics.solve([x, y, z])
+        if errors[0] > tolerance:
+            raise ValueError(f"({x}, {y}, {z}) is out of reach, the nearest pose found leaves the claw {errors[0]:.1f} mm away")
+
+        # Every joint runs for the time the slowest one needs at full speed, with the others slowed to match
+        jointIds = [self.joints.ids[motorType] for motorType in kinematicJoints]
+        deltas = angles[0] - self.jointState.allPositions()[jointIds]
+        rates = self.jointState.travelRates[jointIds]
+        duration = float((abs(deltas) / (rates * speed)).max())
+        commands = {}
+        for motorType, delta, rate in zip(kinematicJoints, deltas.tolist(), rates.tolist()):
+            if abs(delta) >= 0.1:
+                commands[motorType] = ("extend" if delta > 0 else "retract", min(speed, abs(delta) / (rate * duration)))
+
+        # Joints left over from an earlier move, that are not part of this one, are stopped where they are
+        idle = [motorType for motorType in kinematicJoints if motorType not in commands and motorType in self.motorDirections]
+        if idle:
+            self.stopMotors(idle)
+        report = self.driveMotors(commands) if commands else {"joints": [], "skipped": [], "limited": [], "skew": 0.0}
+        deadline = self.clock() + duration
+        for motorType in report["joints"]:
+            self.scheduleTimedStop(motorType, deadline)
+        report["angles"] = dict(zip(kinematicJoints, angles[0].tolist()))
+        report["duration"] = duration if commands else 0.0
+        return report
+
+    def profileStats(self):
+        """Return the achieved update rate and timing jitter of the profile scheduler"""
+        if self.profileScheduler == None:
+            return None
+        return self.profileScheduler.stats()
+
+    def countCommand(self, joint, operation):
+        """Count a command, caching the counter so the hot path only does a single dictionary look-up"""
+        counter = self.commandCounters.get((joint, operation))
+        if counter == None:
+            counter = self.commandCounters[(joint, operation)] = self.metrics.counter("robotarm_commands_total", joint=joint, operation=operation)
+        counter.inc()
+
+    def observeWrite(self, operation, startTime):
+        """Record how long a GPIO write took, which for remote GPIO is a network round trip"""
+        endTime = time.perf_counter()
+        elapsed = endTime - startTime
+        if self.tracer != None:
+            self.tracer.record(operation, "gpio", startTime, endTime)
+        histograms = self.writeHistograms.get((operation, self.remote))
+        if histograms == None:
+            histograms = [self.metrics.histogram("robotarm_gpio_write_seconds", operation=operation)]
+            if self.remote:
+                histograms.append(self.metrics.histogram("robotarm_remote_round_trip_seconds", operation=operation))
+            self.writeHistograms[(operation, self.remote)] = histograms
+        for histogram in histograms:
+            histogram.observe(elapsed)
+
+    def driveMotors(self, commands):
+        """Drive several motors together from a mapping of motorType to direction or (direction, speed)
+
+        Every command is checked before anything is written, so a bad entry leaves all motors untouched. Writes are done
+        in two passes: first the opposite leg of every motor is switched off, then the driving legs are set back-to-back,
+        so the joints start as close together as possible. Returns a report including the skew, in seconds, between the
+        first and last joint starting."""
+        with self.outputLock:
+            # Validate every command up front
+            plan = []
+            skipped = []
+            for motorType, command in commands.items():
+                if isinstance(command, str):
+                    direction, speed = command, None
+                else:
+                    direction, speed = command
+                if speed == None:
+                    speed = self.motorSpeed
+                if motorType not in motorTypesList:
+                    raise ValueError(f"Unknown motor: {motorType}")
+                if direction not in forwardDirections and direction not in backwardDirections:
+                    raise ValueError(f"Unknown direction for {motorType}: {direction}")
+                if not 0 <= speed <= 1:
+                    raise ValueError(f"Speed for {motorType} must be between 0 and 1, not {speed}")
+                if not self.pins.pins[motorType]["enable"]:
+                    skipped.append(motorType)
+                else:
+                    plan.append((motorType, direction, speed))
+
+            report = {"joints": [motorType for motorType, direction, speed in plan], "skipped": skipped, "limited": [], "suppressed": [], "skew": 0.0}
+            for motorType, direction, speed in plan:
+                self.countCommand(motorType, "drive")
+            if self.recorder != None:
+                for motorType, direction, speed in plan:
+                    self.recorder.recordDrive(motorType, direction, speed)
+            # A batch command replaces any ramp or timed move its joints are part way through, as driveMotor does
+            for motorType, direction, speed in plan:
+                if self.profileScheduler != None:
+                    self.profileScheduler.cancel(motorType)
+                self.stopTimers.cancel(motorType)
+            if not self.gpioAvailable() or not plan:
+                return report
+
+            # Enabled joints whose device could not be created are skipped, as driveJoint does
+            missing = [motorType for motorType, direction, speed in plan if self.joints.byName(motorType).device == None]
+            if missing:
+                report["skipped"] += missing
+                plan = [entry for entry in plan if entry[0] not in missing]
+                report["joints"] = [motorType for motorType, direction, speed in plan]
+                if not plan:
+                    return report
+
+            # Joints already at a soft limit are stopped and left out of the move. The whole batch is checked in one call
+            if self.jointState != None:
+                jointIds = [self.joints.ids[motorType] for motorType, direction, speed in plan]
+                speeds = [speed if direction in forwardDirections else -speed for motorType, direction, speed in plan]
+                blocked = self.jointState.atLimits(jointIds, speeds).tolist()
+                if any(blocked):
+                    report["limited"] = [entry[0] for entry, isBlocked in zip(plan, blocked) if isBlocked]
+                    plan = [entry for entry, isBlocked in zip(plan, blocked) if not isBlocked]
+                    report["joints"] = [motorType for motorType, direction, speed in plan]
+                    self.logger.warning(f"Not driving {report['limited']}, as they are at their soft limits")
+                    self.stopMotors(report["limited"])
+                    if not plan:
+                        return report
+
+            # Resolve the output devices before writing anything, leaving out motors already running at the wanted speed
+            writes = []
+            for motorType, direction, speed in plan:
+                joint = self.joints.byName(motorType)
+                value = speed if direction in forwardDirections else -speed
+                if joint.written == value:
+                    joint.suppressedCounter.inc()
+                    report["suppressed"].append(motorType)
+                    continue
+                motor = joint.device
+                if direction in forwardDirections:
+                    writes.append((joint, value, motor.backward_device, motor.forward_device, speed))
+                else:
+                    writes.append((joint, value, motor.forward_device, motor.backward_device, speed))
+
+            # Switch off the opposite legs, then start every joint in one tight pass
+            if writes:
+                batchStartTime = time.perf_counter()
+                for joint, value, offDevice, onDevice, speed in writes:
+                    offDevice.off()
+                startTimes = []
+                for joint, value, offDevice, onDevice, speed in writes:
+                    onDevice.value = speed
+                    startTimes.append(time.perf_counter())
+                report["skew"] = startTimes[-1] - startTimes[0]
+                self.observeWrite("driveBatch", batchStartTime)
+                for joint, value, offDevice, onDevice, speed in writes:
+                    joint.written = value
+                    joint.issuedCounter.inc()
+
+            for motorType, direction, speed in plan:
+                self.motorDirections[motorType] = direction
+            if self.jointState != None:
+                jointIds = [self.joints.ids[motorType] for motorType, direction, speed in plan]
+                speeds = [speed if direction in forwardDirections else -speed for motorType, direction, speed in plan]
+                for jointId, timeToLimit in zip(jointIds, self.jointState.setVelocities(jointIds, speeds).tolist()):
+                    self.scheduleLimitStop(jointId, timeToLimit)
+            return report
+
+    def stopMotors(self, motorTypes=motorTypesList):
+        """Stop several motors in one tight pass and return a report including the skew between the first and last stop"""
+        with self.outputLock:
+            for motorType in motorTypes:
+                if motorType not in motorTypesList:
+                    raise ValueError(f"Unknown motor: {motorType}")
+            enabled = [motorType for motorType in motorTypes if self.pins.pins[motorType]["enable"]]
+            report = {"joints": enabled, "skipped": [motorType for motorType in motorTypes if motorType not in enabled], "suppressed": [], "skew": 0.0}
+            for motorType in enabled:
+                self.countCommand(motorType, "stop")
+            if self.recorder != None:
+                for motorType in enabled:
+                    self.recorder.recordStop(motorType)
+            # Any ramp still playing would otherwise drive the motors again on its next tick, and a timed stop is no longer needed
+            for motorType in enabled:
+                if self.profileScheduler != None:
+                    self.profileScheduler.cancel(motorType)
+                self.stopTimers.cancel(motorType)
+            if not self.gpioAvailable() or not enabled:
+                return report
+
+            # Motors already stopped are not written again, and enabled joints whose device could not be created are skipped
+            joints = []
+            missing = []
+            for motorType in enabled:
+                joint = self.joints.byName(motorType)
+                if joint.device == None:
+                    missing.append(motorType)
+                elif joint.written == 0.0:
+                    joint.suppressedCounter.inc()
+                    report["suppressed"].append(motorType)
+                else:
+                    joints.append(joint)
+            if missing:
+                report["skipped"] += missing
+                report["joints"] = [motorType for motorType in enabled if motorType not in missing]
+            if joints:
+                motors = [joint.device for joint in joints]
+                batchStartTime = time.perf_counter()
+                stopTimes = []
+                for motor in motors:
+                    motor.stop()
+                    stopTimes.append(time.perf_counter())
+                report["skew"] = stopTimes[-1] - stopTimes[0]
+                self.observeWrite("stopBatch", batchStartTime)
+                for joint in joints:
+                    joint.written = 0.0
+                    joint.issuedCounter.inc()
+
+            for motorType in enabled:
+                self.motorDirections.pop(motorType, None)
+            if self.jointState != None:
+                jointIds = [self.joints.ids[motorType] for motorType in enabled]
+                for jointId, timeToLimit in zip(jointIds, self.jointState.setVelocities(jointIds, [0.0] * len(jointIds)).tolist()):
+                    self.scheduleLimitStop(jointId, timeToLimit)
+            return report
         
     def controlLedBrightness(self):
         """A function to control the brightness of the LED"""
-        self.logger.info(f"Control LED function called for LED, with brightness {self.ledBrightness}")
+        if self.verbose:
+            self.logger.info(f"Control LED function called for LED, with brightness {self.ledBrightness}")
+        self.countCommand("led", "brightness")
+        if self.recorder != None:
+            self.recorder.recordLed(self.ledBrightness)
         
-        if (self.raspberryPi or self.remote) and self.pins.pins["led"]["enable"]:
-            if not self.led.is_active:
-                self.led.on()
-            self.led.value = self.ledBrightness
+        if self.gpioAvailable() and self.pins.pins["led"]["enable"]:
+            self.writeLed(self.ledBrightness, "brightness")
+            self.ledOn = True
         
+    def setLedBrightness(self, brightness):
+        """Set the LED brightness and switch the LED on at that brightness"""
+        self.ledBrightness = checkLevel(brightness, "brightness")
+        self.controlLedBrightness()
+
     def stopLed(self):
         """A function to switch off the LED"""
-        self.logger.info("Stop LED function called")
-        if (self.raspberryPi or self.remote) and self.pins.pins["led"]["enable"]:
-            self.led.off()
+        if self.verbose:
+            self.logger.info("Stop LED function called")
+        self.countCommand("led", "off")
+        if self.recorder != None:
+            self.recorder.recordLedOff()
+        if self.coalescer != None:
+            self.coalescer.discard("led")
+        if self.gpioAvailable() and self.pins.pins["led"]["enable"]:
+            self.writeLed(0.0, "off")
+        self.ledOn = False
+
+    def writeLed(self, value, operation):
+        """Write a brightness to the LED, which switches it on or off, unless its shadow state shows it already has it"""
+        joint = self.joints.byName("led")
+        if joint.written == value:
+            joint.suppressedCounter.inc()
+            return
+        startTime = time.perf_counter()
+        self.led.value = value
+        self.observeWrite(operation, startTime)
+        joint.written = value
+        joint.issuedCounter.inc()
+
+    def setMotorSpeed(self, speed):
+        """Set the speed later drives and ramps run at, leaving motors that are already running as they are"""
+        self.motorSpeed = checkLevel(speed, "speed")
+        if self.recorder != None:
+            self.recorder.recordSpeed(self.motorSpeed)
+
+    def setContinuousValue(self, output, value):
+        """Queue a new value for a continuous output ("led" brightness or motor "speed")
+
+        Only the newest value is kept, and values are written at most maxWriteRate times a second. The final value always lands."""
+        if output not in ("led", "speed"):
+            raise ValueError(f"Unknown continuous output: {output}")
+        value = checkLevel(value, "brightness" if output == "led" else "speed")
+        if self.coalescer == None:
+            self.coalescer = CoalescingWriter(lambda output, value: self.submit("writeContinuousValue", output, value).result(), self.logger, self.maxWriteRate)
+        self.coalescer.set(output, value)
+
+    def flushContinuousValues(self):
+        """Write any continuous values that are still waiting"""
+        if self.coalescer != None:
+            self.coalescer.flush()
+
+    def writeContinuousValue(self, output, value):
+        """Apply a coalesced value. Brightness is only written while the LED is lit, and speed is applied to moving motors
+
+        The value is checked before it is stored, so a bad value cannot break the commands that follow it."""
+        if output == "led":
+            self.ledBrightness = checkLevel(value, "brightness")
+            if self.recorder != None and self.ledOn:
+                self.recorder.recordLed(self.ledBrightness)
+            if self.ledOn and self.gpioAvailable() and self.pins.pins["led"]["enable"]:
+                self.writeLed(self.ledBrightness, "brightness")
+        elif output == "speed":
+            self.motorSpeed = checkLevel(value, "speed")
+            if self.recorder != None:
+                self.recorder.recordSpeed(self.motorSpeed)
+            for motorType, direction in list(self.motorDirections.items()):
+                self.driveMotor(motorType, direction)
+        else:
+            raise ValueError(f"Unknown continuous output: {output}")
+
+    def metricsSnapshot(self):
+        """Return every counter and histogram as plain dictionaries, including the executor's queueing latency"""
+        snapshot = self.metrics.snapshot()
+        snapshot["queueLatency"] = self.commandLatencyStats()
+        return snapshot
+
+    def metricsText(self):
+        """Return every counter and histogram in the Prometheus text format"""
+        return self.metrics.prometheusText()
+
+    def enableTracing(self, capacity=100000):
+        """Start recording spans for submitted commands, GPIO writes and pigpio round trips, and return the tracer
+
+        Tracing is off by default, when each traced point costs a single comparison. Only the newest capacity spans
+        are kept."""
+        # The tracer is only loaded when tracing is wanted
+        from tracing import Tracer
+        if self.tracer == None:
+            self.tracer = Tracer(capacity).instrument()
+        return self.tracer
+
+    def disableTracing(self):
+        """Stop recording spans and return the tracer, so its spans can still be exported"""
+        tracer = self.tracer
+        self.tracer = None
+        if tracer != None:
+            tracer.close()
+        return tracer
+
+    def traceSpan(self, name, category, start=None, newTrace=False):
+        """Return a context manager timing a block as a span, such as a GUI slot, which does nothing unless tracing is on"""
+        if self.tracer == None:
+            return nullSpan
+        return self.tracer.span(name, category, start, newTrace)
+
+    def startRecording(self, path):
+        """Start recording motor and LED commands to a timeline file"""
+        self.stopRecording()
+        self.recorder = MotionRecorder(path)
+
+    def stopRecording(self):
+        """Stop recording and close the timeline file"""
+        if self.recorder != None:
+            self.recorder.close()
+            self.recorder = None
+
+    def replayRecording(self, path, speedFactor=1.0):
+        """Replay a timeline file on its original schedule and return a report of the timing error of each event"""
+        return self.replays.play(MotionReplayer(self, readRecords(path), speedFactor))
+
+    def runMacro(self, program, spinTime=0.002):
+        """Run a macro compiled by motionMacros on its schedule and return a report of the timing error of each instruction"""
+        # motionMacros imports this module, so it is only loaded once a macro is run
+        from motionMacros import MacroInterpreter
+        return self.replays.play(MacroInterpreter(self, program, spinTime))
+
+    def runInBackground(self, commandName, *args, callback=None):
+        """Run a long command, such as "replayRecording" or "runMacro", on a worker thread of its own and return a Future
+        for its result
+
+        Replays and macros submit their commands one at a time, so commands submitted while they play, such as a stop
+        from the GUI, are run in between rather than queued behind the whole replay."""
+        command = getattr(self, commandName)
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        def run():
+            try:
+                future.set_result(command(*args))
+            except Exception as error:
+                self.logger.exception("Command %s failed", commandName)
+                future.set_exception(error)
+        threading.Thread(target=run, name=commandName, daemon=True).start()
+        return future
+
+    def cancelReplay(self):
+        """Stop a replay or macro that is in progress. This is safe to call from any thread"""
+        self.replays.cancel()
 
     def closeGPIO(self, outputType):
-        """A function to close a GPIO device"""
-        if self.pins.pins[outputType]["enable"]:
+        """A function to close a GPIO device. Errors are logged rather than raised, as the connection may already have gone"""
+        if self.profileScheduler != None:
+            self.profileScheduler.cancel(outputType)
+        self.stopTimers.cancel(outputType)
+        joint = self.joints.byName(outputType)
+        joint.device = None
+        joint.written = None
+        try:
             if outputType in self.motorObjects and outputType != "led":
-                self.motorObjects[outputType].close()
-            if outputType == "led" and self.pins.pins["led"]["enable"]:
-                self.led.close()
+                self.motorDirections.pop(outputType, None)
+                if self.jointState != None:
+                    self.trackJoint(self.joints.ids[outputType], 0.0)
+                self.motorObjects.pop(outputType).close()
+            if outputType == "led" and self.led != None:
+                self.ledOn = False
+                led = self.led
+                self.led = None
+                led.close()
+        except Exception as error:
+            self.logger.warning(f"Error closing GPIO for {outputType}: {error}")
+        self.realizedDevices.pop(outputType, None)
 
     def closeAllGPIO(self):
-        """A function to close all GPIO objects"""
-        if self.pins.pins["led"]["enable"] and self.led != None:
-            self.led.close()
-        motorTypesList = ["claw","shoulder","elbow","wrist","rotate"]
-        for motorType in motorTypesList:
-            # Close the GPIO if already defined
-            if self.pins.pins[motorType]["enable"] and motorType in self.motorObjects:
-                self.motorObjects[motorType].close()
+        """A function to close all GPIO objects, along with the threads and remote connections they use"""
+        # Drop any coalesced values that have not been written yet, as the devices are about to close
+        if self.coalescer != None:
+            self.coalescer.stop(flush=False)
+            self.coalescer = None
+        for outputType in motorTypesList + ["led"]:
+            self.closeGPIO(outputType)
+        # Stop the scheduler and timer wheel threads. They are created again when the next ramp or timed move is started
+        if self.profileScheduler != None:
+            self.profileScheduler.stop()
+            if self.simulator != None:
+                self.simulator.detach(self.profileScheduler)
+            self.profileScheduler = None
+        self.stopTimers.stop()
+        # Stop probing remote hosts and close their connections. The next createGPIODevices() connects again
+        self.connectionManager.stop()
 
 if __name__ == "__main__":
     # Create a logger object
@@ -0,0 +1,138 @@
+from multiprocessing import shared_memory
+import os
+import struct
+import time
+import zlib
+
+# Layout of the shared memory block. The write position, the read position and the writer's status are each written by
+# only one side, and each sits on its own 64 byte cache line, followed by the records
+writePositionOffset = 0
+readPositionOffset = 64
+writerStatusOffset = 128
+dataOffset = 192
+
+positionStruct = struct.Struct("<I")
+
+# Writer status: its process ID, a heartbeat in milliseconds of time.monotonic(), whether it has closed the ring and the
+# capacity of the ring, which is stored as the operating system may round the block's size up to a whole page
+writerStatusStruct = struct.Struct("<IIII")
+heartbeatStruct = struct.Struct("<I")
+beatStruct = struct.Struct("<II")
+closedOffset = writerStatusOffset + 8
+
+# Every record starts with a 16 byte header: the position it was written at, the payload length and a CRC covering both
+# and the payload. Records are padded to a multiple of 16 bytes, so a header never straddles the end of the buffer. A
+# record too long for the space left before the end is preceded by a wrap marker, and written from the start
+recordHeaderStruct = struct.Struct("<IIIxxxx")
+wrapLength = 0xFFFFFFFF
+positionMask = 0xFFFFFFFF
+
+class SharedRing():
+    """Class used to pass variable length records from one process to another through a shared memory ring buffer, without locks
+
+    There must be one writer and one reader. Positions are 32-bit counters that only grow, wrapping at 2^32, so each is
+    stored with a single aligned write that the other side can never see half done. The writer fills in a record before
+    publishing the new write position, and the reader copies it out before publishing the new read position. Python has
+    no memory barriers, so rather than rely on the order the writes become visible in on weakly ordered processors such
+    as the Raspberry Pi's, the reader checks each record's position stamp and CRC, and leaves a record that does not yet
+    check out to be read on a later call.
+
+    Creating a ring with no name allocates a new block, which is freed when the creator closes it. Passing the name of an
+    existing ring attaches to it, from a process started by multiprocessing so it shares the creator's resource tracker."""
+    def __init__(self, name=None, capacity=65536):
+        create = name == None
+        if create and (capacity < 64 or capacity & (capacity - 1)):
+            raise ValueError(f"Ring capacity must be a power of two of at least 64 bytes: {capacity}")
+        self.memory = shared_memory.SharedMemory(name=name, create=create, size=dataOffset + capacity if create else 0)
+        self.buffer = self.memory.buf
+        self.name = self.memory.name
+        self.owner = create
+        if create:
+            writerStatusStruct.pack_into(self.buffer, writerStatusOffset, 0, 0, 0, capacity)
+        else:
+            capacity = writerStatusStruct.unpack_from(self.buffer, writerStatusOffset)[3]
+        self.capacity = capacity
+        self.mask = capacity - 1
+
+        # Each side's own position, kept locally as only that side changes it
+        self.writePosition = positionStruct.unpack_from(self.buffer, writePositionOffset)[0]
+        self.readPosition = positionStruct.unpack_from(self.buffer, readPositionOffset)[0]
+
+    def put(self, payload):
+        """Append a record, returning False without writing anything if there is not room for it"""
+        length = len(payload)
+        size = 16 + ((length + 15) & ~15)
+        write = self.writePosition
+        offset = write & self.mask
+        skip = self.capacity - offset if self.capacity - offset < size else 0
+        read = positionStruct.unpack_from(self.buffer, readPositionOffset)[0]
+        if ((write - read) & positionMask) + skip + size > self.capacity:
+            return False
+        if skip:
+            recordHeaderStruct.pack_into(self.buffer, dataOffset + offset, write, wrapLength, write ^ wrapLength)
+            write = (write + skip) & positionMask
+            offset = 0
+        start = dataOffset + offset + 16
+        self.buffer[start:start + length] = payload
+        recordHeaderStruct.pack_into(self.buffer, dataOffset + offset, write, length, zlib.crc32(payload, write ^ length))
+        self.writePosition = (write + size) & positionMask
+        positionStruct.pack_into(self.buffer, writePositionOffset, self.writePosition)
+        return True
+
+    def get(self):
+        """Remove and return the oldest record as bytes, or None if there is no complete record to read"""
+        read = self.readPosition
+        while read != positionStruct.unpack_from(self.buffer, writePositionOffset)[0]:
+            offset = read & self.mask
+            position, length, crc = recordHeaderStruct.unpack_from(self.buffer, dataOffset + offset)
+            if position != read:
+                return None
+            if length == wrapLength:
+                if crc != read ^ wrapLength:
+                    return None
+                read = (read + self.capacity - offset) & positionMask
+                self.readPosition = read
+                positionStruct.pack_into(self.buffer, readPositionOffset, read)
+                continue
+            if length > self.capacity - offset - 16:
+                return None
+            start = dataOffset + offset + 16
+            payload = bytes(self.buffer[start:start + length])
+            if zlib.crc32(payload, read ^ length) != crc:
+                return None
+            self.readPosition = (read + 16 + ((length + 15) & ~15)) & positionMask
+            positionStruct.pack_into(self.buffer, readPositionOffset, self.readPosition)
+            return payload
+        return None
+
+    def pending(self):
+        """Return the number of bytes written but not yet read, including headers and padding"""
+        write = positionStruct.unpack_from(self.buffer, writePositionOffset)[0]
+        read = positionStruct.unpack_from(self.buffer, readPositionOffset)[0]
+        return (write - read) & positionMask
+
+    def beat(self):
+        """Record that the writer is alive, and its process ID, for the reader to check with writerAge() and writerPid()"""
+        beatStruct.pack_into(self.buffer, writerStatusOffset, os.getpid(), int(time.monotonic() * 1000) & positionMask)
+
+    def writerAge(self):
+        """Return the seconds since the writer's last heartbeat. time.monotonic() is system wide, so this works across processes"""
+        beat = beatStruct.unpack_from(self.buffer, writerStatusOffset)[1]
+        return ((int(time.monotonic() * 1000) - beat) & positionMask) / 1000
+
+    def writerPid(self):
+        return writerStatusStruct.unpack_from(self.buffer, writerStatusOffset)[0]
+
+    def markClosed(self):
+        """Tell the reader that no more records will be written"""
+        heartbeatStruct.pack_into(self.buffer, closedOffset, 1)
+
+    def writerClosed(self):
+        return heartbeatStruct.unpack_from(self.buffer, closedOffset)[0] == 1
+
+    def close(self):
+        """Detach from the block, and free it if this side created it"""
+        self.buffer = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
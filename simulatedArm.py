@@ -0,0 +1,298 @@
+import math
+import numpy as np
+import threading
+import time
+
+# Kinematic model of each joint: travel in degrees per second at full speed, then the lower and upper end stops in degrees.
+# Rough figures, to be tuned against the real arm
+jointModels = {
+    "rotate": (20.0, -135.0, 135.0),
+    "shoulder": (15.0, -90.0, 90.0),
+    "elbow": (15.0, -150.0, 150.0),
+    "wrist": (20.0, -60.0, 60.0),
+    "claw": (10.0, -20.0, 20.0),
+}
+
+class SimulatedLeg():
+    """Class used to stand in for one direction of a gpiozero Motor, as used by RobotArmControl's batch moves"""
+    def __init__(self, motor, sign):
+        self.motor = motor
+        self.sign = sign
+        self.legValue = 0.0
+
+    @property
+    def value(self):
+        return self.legValue
+
+    @value.setter
+    def value(self, value):
+        self.legValue = value
+        self.motor.applyLegs()
+
+    def off(self):
+        self.value = 0.0
+
+class SimulatedMotor():
+    """Class used in place of a gpiozero Motor, passing the signed value written to it to the simulator"""
+    def __init__(self, simulator, jointIndex):
+        self.simulator = simulator
+        self.jointIndex = jointIndex
+        self.forward_device = SimulatedLeg(self, 1)
+        self.backward_device = SimulatedLeg(self, -1)
+        self.closed = False
+
+    @property
+    def value(self):
+        return float(self.simulator.commands[self.jointIndex])
+
+    @value.setter
+    def value(self, value):
+        self.forward_device.legValue = max(value, 0.0)
+        self.backward_device.legValue = max(-value, 0.0)
+        self.applyLegs()
+
+    @property
+    def is_active(self):
+        return self.value != 0
+
+    def applyLegs(self):
+        self.simulator.commands[self.jointIndex] = self.forward_device.legValue - self.backward_device.legValue
+
+    def forward(self, speed=1):
+        self.value = speed
+
+    def backward(self, speed=1):
+        self.value = -speed
+
+    def stop(self):
+        self.value = 0.0
+
+    def close(self):
+        self.stop()
+        self.closed = True
+
+class SimulatedLED():
+    """Class used in place of a gpiozero PWMLED, storing its brightness in the simulator"""
+    def __init__(self, simulator):
+        self.simulator = simulator
+
+    @property
+    def value(self):
+        return self.simulator.ledValue
+
+    @value.setter
+    def value(self, value):
+        self.simulator.ledValue = value
+
+    @property
+    def is_active(self):
+        return self.simulator.ledValue > 0
+
+    def on(self):
+        self.value = 1.0
+
+    def off(self):
+        self.value = 0.0
+
+    def close(self):
+        self.off()
+
+class ArmSimulator():
+    """Class used to simulate the arm's joints, standing in for gpiozero devices when there is no hardware
+
+    Each joint's velocity follows its commanded value with a first-order lag of timeConstant seconds, and its position
+    stops at the end stops, where the time spent stalled against them is counted. Simulated time only moves when
+    advance() is called, so a scripted session runs as fast as the steps can be computed. startRealTime() advances it
+    from a background thread in step with the wall clock instead, for the GUI.
+
+    Timer wheels and profile schedulers created with clock() as their clock are attached with attach(), and advance()
+    runs their timers and ramp ticks at the simulated times they are due, however fast simulated time is moving."""
+    def __init__(self, logger, models=jointModels, stepTime=0.001, timeConstant=0.05):
+        self.logger = logger
+        self.names = list(models)
+        self.stepTime = stepTime
+        self.timeConstant = timeConstant
+        self.travelRates = np.array([models[name][0] for name in self.names])
+        self.lower = np.array([models[name][1] for name in self.names])
+        self.upper = np.array([models[name][2] for name in self.names])
+
+        # Joint state, with one entry per joint: the value last written, velocity in degrees per second, position in
+        # degrees and total seconds stalled against an end stop
+        self.commands = np.zeros(len(self.names))
+        self.velocities = np.zeros(len(self.names))
+        self.positions = np.zeros(len(self.names))
+        self.stalledTime = np.zeros(len(self.names))
+        self.ledValue = 0.0
+        self.time = 0.0
+        self.steps = 0
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+
+        # Timer wheels and profile schedulers running on simulated time
+        self.schedulers = []
+
+    def createMotor(self, motorType):
+        """Return a motor device for a joint, in place of gpiozero's Motor"""
+        return SimulatedMotor(self, self.names.index(motorType))
+
+    def createLed(self):
+        """Return an LED device, in place of gpiozero's PWMLED"""
+        return SimulatedLED(self)
+
+    def clock(self):
+        """Return simulated time in seconds, for use as the clock of a timer wheel or profile scheduler"""
+        return self.time
+
+    def attach(self, scheduler):
+        """Run a timer wheel or profile scheduler created with clock() as its clock as simulated time moves on"""
+        self.schedulers.append(scheduler)
+
+    def detach(self, scheduler):
+        if scheduler in self.schedulers:
+            self.schedulers.remove(scheduler)
+
+    def advance(self, seconds):
+        """Move simulated time on by a number of seconds, in steps of stepTime
+
+        Time is moved on in stretches that end where an attached timer or ramp tick is due, which is then run, so
+        commands they write land at the right simulated time, as late as one step at most."""
+        steps = max(1, int(round(seconds / self.stepTime)))
+        while steps > 0:
+            count = steps
+            for scheduler in list(self.schedulers):
+                scheduler.advanceTo(self.time)
+                deadline = scheduler.nextDeadline()
+                if deadline != None:
+                    count = min(count, max(1, math.ceil((deadline - self.time) / self.stepTime - 1e-9)))
+            self.step(count)
+            steps -= count
+        for scheduler in list(self.schedulers):
+            scheduler.advanceTo(self.time)
+
+    def step(self, steps):
+        """Move simulated time on by a number of steps, with the commanded values fixed
+
+        The commanded values cannot change during a call, so each joint's steps are worked out together with NumPy, in
+        blocks, rather than one at a time. Only a joint reaching an end stop starts a new block."""
+        with self.lock:
+            # The fraction of the gap to the commanded velocity left after one step
+            decay = np.exp(-self.stepTime / self.timeConstant)
+            targets = self.commands * self.travelRates
+            for joint in range(len(self.names)):
+                self.advanceJoint(joint, targets[joint], steps, decay)
+            self.time += steps * self.stepTime
+            self.steps += steps
+
+    def advanceJoint(self, joint, target, steps, decay, blockSize=4096):
+        """Move one joint on by a number of steps towards a target velocity, stopping it at its end stops
+
+        After k steps the velocity has closed all but decay ** k of its gap to the target, and the positions are the
+        running sum of the velocities, so a whole block is a few array operations. A joint that reaches an end stop is
+        stopped there and the next block starts from rest."""
+        velocity = self.velocities[joint]
+        position = self.positions[joint]
+        lower = self.lower[joint]
+        upper = self.upper[joint]
+        while steps > 0:
+            count = min(steps, blockSize)
+            velocities = target + (velocity - target) * decay ** np.arange(1, count + 1)
+            positions = np.cumsum(np.concatenate(([position], velocities * self.stepTime)))[1:]
+            stalled = ((positions >= upper) & (velocities > 0)) | ((positions <= lower) & (velocities < 0))
+            if not stalled.any():
+                velocity = velocities[-1]
+                position = positions[-1]
+                steps -= count
+                continue
+            first = int(np.argmax(stalled))
+            position = upper if velocities[first] > 0 else lower
+            velocity = 0.0
+            self.stalledTime[joint] += self.stepTime
+            steps -= first + 1
+            # Driven into the stop it is resting against, the joint stalls again on every step that is left
+            if (position == upper and target > 0) or (position == lower and target < 0):
+                self.stalledTime[joint] += steps * self.stepTime
+                steps = 0
+        self.velocities[joint] = velocity
+        self.positions[joint] = position
+
+    def startRealTime(self, period=0.01):
+        """Advance simulated time from a background thread, keeping it in step with the wall clock"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.runRealTime, args=(period,), name="ArmSimulator", daemon=True)
+        self.thread.start()
+
+    def runRealTime(self, period):
+        # Simulated time is advanced in whole steps towards the wall clock, so rounding never builds up into drift
+        startTime = time.monotonic()
+        startSimulatedTime = self.time
+        while self.running:
+            time.sleep(period)
+            steps = int((startSimulatedTime + time.monotonic() - startTime - self.time) / self.stepTime)
+            if steps > 0:
+                self.advance(steps * self.stepTime)
+
+    def stop(self):
+        self.running = False
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+
+    def jointPositions(self):
+        """Return the simulated position of every joint, keyed by name"""
+        return dict(zip(self.names, self.positions.tolist()))
+
+    def stats(self):
+        """Return simulated time, steps run, and how long each joint has spent stalled against an end stop"""
+        return {"time": self.time, "steps": self.steps, "stalled": dict(zip(self.names, self.stalledTime.tolist())), "led": self.ledValue}
+
+def runScript(robotArmControl, simulator, script):
+    """Run a scripted session in simulated time, as fast as it can be computed
+
+    script is a list of (seconds, commandName, args) entries, sorted by time, where commandName is a RobotArmControl method
+    such as "driveMotor". Simulated time is advanced to each entry before it is run. Returns the simulated and wall clock
+    time taken."""
+    startTime = time.perf_counter()
+    startSimulatedTime = simulator.time
+    for seconds, commandName, args in script:
+        delay = startSimulatedTime + seconds - simulator.time
+        if delay > 0:
+            simulator.advance(delay)
+        getattr(robotArmControl, commandName)(*args)
+    return {"simulated": simulator.time - startSimulatedTime, "wall": time.perf_counter() - startTime}
+
+if __name__ == "__main__":
+    # Soak test: make random moves of random joints for a simulated hour, reporting the speed-up over real time
+    from robotArmControl import RobotArmControl, Pins, motorTypesList
+    import logging
+    import random
+    import sys
+
+    logging.basicConfig(format='%(asctime)s %(message)s')
+    logger = logging.getLogger()
+    logger.setLevel(logging.WARNING)
+
+    simulatedSeconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3600
+
+    simulator = ArmSimulator(logger, stepTime=0.01)
+    a = RobotArmControl(Pins.allEnabled(), 1, 1, logger, simulator=simulator)
+    a.createGPIODevices()
+
+    random.seed(1)
+    script = []
+    moveTime = 0.0
+    while moveTime < simulatedSeconds:
+        motorType = random.choice(motorTypesList)
+        duration = random.uniform(0.5, 5)
+        script.append((moveTime, "driveMotor", (motorType, random.choice(["extend", "retract"]))))
+        script.append((moveTime + duration, "stopMotor", (motorType,)))
+        moveTime += duration + random.uniform(0, 1)
+
+    result = runScript(a, simulator, script)
+    print(f"{len(script)} commands over {result['simulated']:.0f} simulated seconds in {result['wall']:.2f} s, {result['simulated'] / result['wall']:.0f}x real time")
+    print(simulator.jointPositions())
+    print(simulator.stats()["stalled"])
+    a.closeAllGPIO()
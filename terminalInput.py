@@ -0,0 +1,214 @@
+from jointRegistry import directionsByName
+from robotArmControl import checkLevel
+from functools import lru_cache
+import os
+import selectors
+import sys
+import time
+
+# Keys held to move each joint, as (motorType, direction). The arrow keys double up for the rotate and shoulder joints
+defaultKeyMap = {
+    "a": ("rotate", "left"), "d": ("rotate", "right"), "left": ("rotate", "left"), "right": ("rotate", "right"),
+    "w": ("shoulder", "extend"), "s": ("shoulder", "retract"), "up": ("shoulder", "extend"), "down": ("shoulder", "retract"),
+    "r": ("elbow", "extend"), "f": ("elbow", "retract"),
+    "t": ("wrist", "extend"), "g": ("wrist", "retract"),
+    "c": ("claw", "extend"), "v": ("claw", "retract"),
+}
+
+# Escape sequences sent by the arrow keys
+escapeSequences = {b"\x1b[A": "up", b"\x1b[B": "down", b"\x1b[C": "right", b"\x1b[D": "left"}
+
+def decodeKeys(data):
+    """Split bytes read from a raw terminal into key names: single characters, or the names of the arrow keys"""
+    keys = []
+    index = 0
+    while index < len(data):
+        sequence = data[index:index + 3]
+        if sequence in escapeSequences:
+            keys.append(escapeSequences[sequence])
+            index += 3
+        else:
+            keys.append(chr(data[index]))
+            index += 1
+    return keys
+
+class KeyHoldTracker():
+    """Class used to turn the characters a terminal sends into key press and release events
+
+    A terminal only sends a character when a key goes down and then again each time it auto-repeats, so a release is
+    inferred when the repeats stop. Before the first repeat the gap is the keyboard's repeat delay, which is learned
+    from the first key that is held, and after it the much shorter repeat interval. A release is therefore reported at
+    most repeatTimeout seconds after the last repeat, or firstRepeatTimeout seconds after a tap."""
+    def __init__(self, onPress, onRelease, firstRepeatTimeout=0.6, repeatTimeout=0.1):
+        self.onPress = onPress
+        self.onRelease = onRelease
+        self.firstRepeatTimeout = firstRepeatTimeout
+        self.repeatTimeout = repeatTimeout
+
+        # Held keys, mapped to [time pressed, time of the last character, release deadline]
+        self.held = {}
+        self.learned = False
+
+    def feed(self, key, now):
+        """Record a character from the terminal, reporting a press if the key was not already held"""
+        entry = self.held.get(key)
+        if entry == None:
+            self.held[key] = [now, now, now + self.firstRepeatTimeout]
+            self.onPress(key)
+            return
+        if entry[1] == entry[0] and not self.learned and now - entry[0] > self.repeatTimeout:
+            # First repeat of a held key: the keyboard's repeat delay, plus a margin for scheduling jitter. Gaps shorter
+            # than a repeat are characters that arrived together, such as pasted text, and say nothing about the delay
+            self.firstRepeatTimeout = (now - entry[0]) * 1.2 + 0.02
+            self.learned = True
+        entry[1] = now
+        entry[2] = now + self.repeatTimeout
+
+    def expire(self, now):
+        """Report a release for every held key whose repeats have stopped"""
+        for key in [key for key, entry in self.held.items() if entry[2] <= now]:
+            del self.held[key]
+            self.onRelease(key)
+
+    def nextDeadline(self):
+        """Return the time the next release is due, or None if no key is held"""
+        if not self.held:
+            return None
+        return min(entry[2] for entry in self.held.values())
+
+    def releaseAll(self):
+        for key in list(self.held):
+            del self.held[key]
+            self.onRelease(key)
+
+class RawTerminal():
+    """Context manager used to put a terminal into cbreak mode, so keys arrive as they are pressed without Enter
+
+    Ctrl-C still raises KeyboardInterrupt, and the terminal's settings are put back on exit."""
+    def __init__(self, fd):
+        self.fd = fd
+        self.settings = None
+
+    def __enter__(self):
+        # termios is only available on Unix, so it is loaded when a terminal is actually used
+        import termios
+        import tty
+        self.settings = termios.tcgetattr(self.fd)
+        tty.setcbreak(self.fd)
+        return self
+
+    def __exit__(self, *exc):
+        import termios
+        termios.tcsetattr(self.fd, termios.TCSADRAIN, self.settings)
+
+class KeyStreamController():
+    """Class used to drive the arm from a raw terminal, moving a joint for as long as its key is held
+
+    Keys in keyMap move joints, and actions maps other keys to functions called on each press, which return False to
+    quit. The loop waits on the terminal with a selector, so it wakes for each character or release deadline and never
+    blocks beyond the next one. Commands go through RobotArmControl.submit(), so they are queued if an executor runs."""
+    def __init__(self, robotArmControl, logger, keyMap=defaultKeyMap, actions=None, firstRepeatTimeout=0.6, repeatTimeout=0.1):
+        self.robotArmControl = robotArmControl
+        self.logger = logger
+        self.keyMap = keyMap
+        self.actions = actions or {}
+        self.tracker = KeyHoldTracker(self.press, self.release, firstRepeatTimeout, repeatTimeout)
+
+        # The key currently moving each joint, so releasing a key that has since been overridden leaves the joint moving
+        self.owners = {}
+
+    def press(self, key):
+        motorType, direction = self.keyMap[key]
+        self.owners[motorType] = key
+        with self.robotArmControl.traceSpan(f"press {key}", "input", newTrace=True):
+            self.robotArmControl.submit("driveMotor", motorType, direction)
+
+    def release(self, key):
+        motorType, direction = self.keyMap[key]
+        if self.owners.get(motorType) == key:
+            del self.owners[motorType]
+            with self.robotArmControl.traceSpan(f"release {key}", "input", newTrace=True):
+                self.robotArmControl.submit("stopMotor", motorType)
+
+    def run(self, fd=None):
+        """Read keys until an action returns False or the input closes. Every joint that is moving is stopped on exit"""
+        fd = sys.stdin.fileno() if fd == None else fd
+        selector = selectors.DefaultSelector()
+        selector.register(fd, selectors.EVENT_READ)
+        try:
+            with RawTerminal(fd):
+                while True:
+                    deadline = self.tracker.nextDeadline()
+                    timeout = None if deadline == None else max(0.0, deadline - time.monotonic())
+                    if selector.select(timeout):
+                        data = os.read(fd, 1024)
+                        if not data:
+                            return
+                        now = time.monotonic()
+                        for key in decodeKeys(data):
+                            if key in self.keyMap:
+                                self.tracker.feed(key, now)
+                            elif key in self.actions and self.actions[key]() == False:
+                                return
+                    self.tracker.expire(time.monotonic())
+        finally:
+            self.tracker.releaseAll()
+            selector.close()
+
+@lru_cache(maxsize=1024)
+def parseStreamLine(line):
+    """Turn one line of a command stream into a RobotArmControl method name and arguments, raising ValueError if it is invalid
+
+    Lines are "<joint> <direction>", "<joint> stop", "stop", "led <brightness>", "led off", "speed <value>" and
+    "wait <milliseconds>". Speeds and brightnesses must be between 0 and 1. Blank lines and lines starting with # are
+    returned as None. Streams repeat a few lines many times, so parsed lines are cached."""
+    words = line.split()
+    if not words or words[0].startswith("#"):
+        return None
+    if words == ["stop"]:
+        return ("stopMotors", ())
+    if len(words) != 2:
+        raise ValueError(f"Expected two words: {line!r}")
+    name, argument = words
+    if name == "led":
+        return ("stopLed", ()) if argument == "off" else ("setLedBrightness", (checkLevel(argument, "brightness"),))
+    if name == "speed":
+        return ("writeContinuousValue", ("speed", checkLevel(argument, "speed")))
+    if name == "wait":
+        milliseconds = float(argument)
+        if not milliseconds >= 0:
+            raise ValueError(f"wait must be at least 0 milliseconds: {argument}")
+        return ("wait", (milliseconds / 1000,))
+    if argument == "stop":
+        return ("stopMotor", (name,))
+    if argument not in directionsByName:
+        raise ValueError(f"Unknown direction: {argument!r}")
+    return ("driveMotor", (name, argument))
+
+def runCommandStream(robotArmControl, stream, logger):
+    """Run every line of a command stream, such as a pipe into stdin, as soon as it is read
+
+    Commands are called directly rather than queued, so a stream runs as fast as the GPIO writes allow. Bad lines are
+    logged and skipped. Returns the number of lines, commands and errors, and the commands run per second."""
+    startTime = time.perf_counter()
+    lines = commands = errors = 0
+    for line in stream:
+        lines += 1
+        try:
+            parsed = parseStreamLine(line.strip())
+            if parsed == None:
+                continue
+            commandName, args = parsed
+            if commandName == "wait":
+                time.sleep(args[0])
+            else:
+                if commandName in ("driveMotor", "stopMotor") and args[0] not in robotArmControl.joints.ids:
+                    raise ValueError(f"Unknown joint: {args[0]!r}")
+                with robotArmControl.traceSpan(commandName, "command", newTrace=True):
+                    getattr(robotArmControl, commandName)(*args)
+            commands += 1
+        except ValueError as error:
+            errors += 1
+            logger.error(f"Line {lines}: {error}")
+    elapsed = time.perf_counter() - startTime
+    return {"lines": lines, "commands": commands, "errors": errors, "seconds": elapsed, "rate": commands / elapsed if elapsed > 0 else 0.0}
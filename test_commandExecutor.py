@@ -0,0 +1,70 @@
+from commandExecutor import CommandExecutor
+import logging
+import pytest
+import threading
+
+@pytest.fixture
+def executor():
+    executor = CommandExecutor(logging.getLogger("test"))
+    executor.start()
+    yield executor
+    executor.stop()
+
+def test_commands_run_in_submission_order(executor):
+    ran = []
+    futures = [executor.submit(ran.append, i) for i in range(1000)]
+
+    futures[-1].result(timeout=5)
+
+    assert ran == list(range(1000))
+
+def test_commands_from_each_thread_keep_their_order(executor):
+    ran = []
+    def send(name):
+        for i in range(200):
+            executor.submit(ran.append, (name, i))
+    threads = [threading.Thread(target=send, args=(name,)) for name in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    executor.stop()
+
+    assert len(ran) == 800
+    for name in range(4):
+        assert [i for sender, i in ran if sender == name] == list(range(200))
+
+def test_commands_all_run_on_the_worker_thread(executor):
+    threads = [executor.submit(threading.current_thread).result(timeout=5) for i in range(10)]
+
+    assert set(threads) == {executor.thread}
+
+def test_stop_runs_the_commands_already_queued(executor):
+    started = threading.Event()
+    release = threading.Event()
+    ran = []
+    executor.submit(lambda: (started.set(), release.wait(5)))
+    started.wait(5)
+    futures = [executor.submit(ran.append, i) for i in range(5)]
+
+    release.set()
+    executor.stop()
+
+    assert ran == list(range(5))
+    assert all(future.done() for future in futures)
+
+def test_failures_reach_the_future_and_callback(executor):
+    called = threading.Event()
+    future = executor.submit(int, "not a number", callback=lambda future: called.set())
+
+    with pytest.raises(ValueError):
+        future.result(timeout=5)
+    assert called.wait(5)
+    assert executor.submit(int, "7").result(timeout=5) == 7
+
+def test_submitting_to_a_stopped_executor_fails(executor):
+    executor.stop()
+
+    with pytest.raises(RuntimeError):
+        executor.submit(int, "7").result(timeout=5)
@@ -0,0 +1,69 @@
+from controlClient import ControlClient, checkedReply
+from controlProtocol import DRIVE, ERROR, OK, REJECTED, encodeRequest
+from controlServer import ControlServer
+import asyncio
+import logging
+import pytest
+
+def serve(arm, session):
+    """Run session(client) against a server on a free localhost port"""
+    async def main():
+        server = await ControlServer(arm, logging.getLogger("test")).start("127.0.0.1", 0)
+        client = await ControlClient().connect(*server.addresses()[0])
+        try:
+            return await session(client)
+        finally:
+            await client.close()
+            await server.close()
+    return asyncio.run(main())
+
+def test_pipelined_commands_are_acknowledged_in_order(arm):
+    async def session(client):
+        futures = [client.drive("claw", "extend"), client.drive("elbow", "retract", 0.5), client.setLed(0.25), client.ping(), client.stop("claw")]
+        return await asyncio.gather(*futures)
+
+    replies = serve(arm, session)
+
+    assert [status for status, value in replies] == [OK] * 5
+    assert arm.motorObjects["claw"].value == 0.0
+    assert arm.motorObjects["elbow"].value == -0.5
+    assert arm.led.value == 0.25
+
+def test_batch_reports_skew_and_stop_all_stops_every_motor(arm):
+    async def session(client):
+        skew = await checkedReply(client.batch({"shoulder": ("extend", 0.5), "wrist": ("left", 0.75)}))
+        moving = (arm.motorObjects["shoulder"].value, arm.motorObjects["wrist"].value)
+        await checkedReply(client.stopAll())
+        return skew, moving
+
+    skew, moving = serve(arm, session)
+
+    assert skew >= 0.0
+    assert moving == (0.5, 0.75)
+    assert all(motor.value == 0.0 for motor in arm.motorObjects.values())
+
+def test_invalid_requests_are_rejected_without_reaching_the_arm(arm):
+    async def session(client):
+        return await asyncio.gather(
+            client.drive("led", "extend"),
+            client.send(encodeRequest(client.sequence, DRIVE, "claw", "", 0.0)),
+            client.drive("claw", "extend", 1.5),
+            client.batch({"claw": ("extend", 0.5), "led": ("extend", 0.5)}),
+            client.ping())
+
+    replies = serve(arm, session)
+
+    assert [status for status, value in replies] == [REJECTED, REJECTED, REJECTED, REJECTED, OK]
+    assert arm.motorObjects["claw"].value == 0.0
+    assert arm.led.value == 0.0
+
+def test_checked_reply_distinguishes_rejections_from_failures():
+    async def reply(status):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result((status, 0.0))
+        return await checkedReply(future)
+
+    with pytest.raises(ValueError):
+        asyncio.run(reply(REJECTED))
+    with pytest.raises(RuntimeError):
+        asyncio.run(reply(ERROR))
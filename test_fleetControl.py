@@ -0,0 +1,47 @@
+from fleetControl import FleetController
+from gpiozero.pins.mock import MockFactory, MockPWMPin
+from robotArmControl import Pins
+import logging
+import pytest
+
+@pytest.fixture
+def fleet():
+    fleet = FleetController(logging.getLogger("test"))
+    factories = {}
+    for name in ("left", "middle", "right"):
+        factories[name] = MockFactory(pin_class=MockPWMPin)
+        fleet.addArm(name, Pins.allEnabled(), pinFactory=factories[name])
+    fleet.createGPIODevices()
+    yield fleet, factories
+    fleet.close()
+
+def test_broadcast_reaches_every_arm(fleet):
+    fleet, factories = fleet
+
+    report = fleet.broadcast("driveMotor", "elbow", "extend")
+
+    assert set(report["results"]) == set(factories)
+    assert set(report["latency"]) == set(factories)
+    for name, arm in fleet.arms.items():
+        assert arm.motorObjects["elbow"].value == 1.0
+        assert arm.motorObjects["elbow"].pin_factory is factories[name]
+
+def test_each_arm_gets_its_own_command(fleet):
+    fleet, factories = fleet
+
+    report = fleet.send({"left": ("driveMotor", ("claw", "extend")), "right": ("driveMotor", ("nothing", "extend"))})
+
+    assert report["results"]["left"] == None
+    assert isinstance(report["results"]["right"], ValueError)
+    assert fleet.arms["left"].motorObjects["claw"].value == 1.0
+    assert fleet.arms["middle"].motorObjects["claw"].value == 0.0
+
+def test_stop_all_stops_every_arm(fleet):
+    fleet, factories = fleet
+    fleet.broadcast("driveMotors", {"rotate": "left", "wrist": "retract"})
+
+    fleet.stopAll()
+
+    for arm in fleet.arms.values():
+        assert arm.motorObjects["rotate"].value == 0.0
+        assert arm.motorObjects["wrist"].value == 0.0
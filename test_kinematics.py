@@ -0,0 +1,38 @@
+from kinematics import ArmKinematics, defaultJointLimits, workspaceIndex
+import numpy as np
+import pytest
+
+def test_solve_round_trips_through_forward_kinematics():
+    kinematics = ArmKinematics()
+    rng = np.random.default_rng(1)
+    limits = np.array([defaultJointLimits[joint] for joint in ("rotate", "shoulder", "elbow", "wrist")])
+    angles = rng.uniform(limits[:, 0] * 0.8, limits[:, 1] * 0.8, size=(200, 4))
+    targets = kinematics.forward(angles)
+
+    solved, errors = kinematics.solve(targets)
+
+    assert solved.shape == (200, 4)
+    assert errors.max() < 0.1
+    np.testing.assert_allclose(kinematics.forward(solved), targets, atol=0.1)
+    assert (solved >= limits[:, 0] - 1e-9).all() and (solved <= limits[:, 1] + 1e-9).all()
+
+def test_out_of_reach_target_reports_its_distance():
+    angles, errors = ArmKinematics().solve([1000.0, 0.0, 0.0])
+
+    assert errors[0] > 500
+
+def test_one_sided_elbow_limits_build_an_index():
+    # With the elbow only able to bend one way, one pose layer has no samples of its own and used to never fill
+    limits = dict(defaultJointLimits, elbow=(0.0, 150.0))
+    kinematics = ArmKinematics(jointLimits=limits)
+
+    angles, errors = kinematics.solve([150.0, 0.0, 100.0])
+
+    assert errors[0] < 0.1
+    assert 0.0 <= angles[0, 2] <= 150.0
+    samples, table, origin = kinematics.index()
+    assert (table >= 0).all()
+
+def test_limits_that_leave_nothing_to_sample_are_rejected():
+    with pytest.raises(ValueError):
+        workspaceIndex((70.0, 90.0, 110.0, 80.0), ((-90.0, 90.0), (10.0, 0.0), (-60.0, 60.0)), 5.0, 5.0)
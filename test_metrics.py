@@ -0,0 +1,21 @@
+from metrics import MetricsRegistry
+
+def test_prometheus_text_escapes_label_values():
+    metrics = MetricsRegistry()
+    metrics.describe("robotarm_connection_errors_total", "Failed connections")
+    metrics.counter("robotarm_connection_errors_total", host='a\\b"c\nd').inc()
+
+    text = metrics.prometheusText()
+
+    assert 'robotarm_connection_errors_total{host="a\\\\b\\"c\\nd"} 1' in text
+    assert all(line.startswith(("#", "robotarm_")) for line in text.splitlines() if line)
+
+def test_histogram_counts_observations():
+    metrics = MetricsRegistry()
+    histogram = metrics.histogram("robotarm_gpio_write_seconds", operation="drive")
+    for value in (0.0001, 0.002, 0.5):
+        histogram.observe(value)
+
+    text = metrics.prometheusText()
+
+    assert 'robotarm_gpio_write_seconds_count{operation="drive"} 3' in text
@@ -0,0 +1,18 @@
+from motionMacros import MacroError, compileMacros
+import pytest
+
+def test_move_speed_only_applies_to_the_move(arm):
+    program = compileMacros("macro m\n  elbow extend 0.25\n  wrist extend\nend\n")["m"]
+
+    report = arm.runMacro(program)
+
+    assert report["summary"]["steps"] == 2
+    assert arm.motorSpeed == 1.0
+    assert arm.joints.byName("elbow").written == 0.25
+    assert arm.joints.byName("wrist").written == 1.0
+
+def test_nested_repeats_past_the_step_limit_are_rejected():
+    source = "macro m\n  repeat 1000\n    repeat 1000\n      repeat 1000\n        led off\n      end\n    end\n  end\nend\n"
+
+    with pytest.raises(MacroError, match="more than the limit"):
+        compileMacros(source)
@@ -0,0 +1,44 @@
+from motionProfiles import profileFor
+import pytest
+import time
+
+@pytest.mark.parametrize("kind", ["trapezoid", "scurve"])
+def test_profiles_run_from_start_to_end_speed(kind):
+    table = profileFor(kind, 0.0, 1.0, 0.5, 100)
+
+    assert table[-1] == pytest.approx(1.0)
+    assert all(later >= earlier for earlier, later in zip(table, table[1:]))
+
+def test_ramp_reaches_its_target(arm):
+    arm.driveMotorRamped("shoulder", "extend", 0.05)
+    time.sleep(0.2)
+
+    assert arm.motorObjects["shoulder"].value == pytest.approx(1.0)
+
+def test_stop_cancels_a_ramp(arm):
+    arm.driveMotorRamped("shoulder", "extend", 0.1)
+    time.sleep(0.02)
+    arm.stopMotor("shoulder")
+    time.sleep(0.2)
+
+    assert arm.motorObjects["shoulder"].value == 0.0
+
+def test_batch_moves_cancel_ramps(arm):
+    arm.driveMotorRamped("shoulder", "extend", 0.1)
+    arm.driveMotorRamped("elbow", "extend", 0.1)
+    time.sleep(0.02)
+    arm.stopMotors()
+    arm.driveMotors({"elbow": ("retract", 0.5)})
+    time.sleep(0.2)
+
+    assert arm.motorObjects["shoulder"].value == 0.0
+    assert arm.motorObjects["elbow"].value == -0.5
+
+def test_closing_stops_the_scheduler(arm):
+    arm.driveMotorRamped("shoulder", "extend", 0.1)
+    scheduler = arm.profileScheduler
+
+    arm.closeAllGPIO()
+
+    assert arm.profileScheduler == None
+    assert not scheduler.thread.is_alive()
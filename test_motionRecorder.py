@@ -0,0 +1,48 @@
+from motionRecorder import DRIVE, LED, STOP, readRecords
+import pytest
+import time
+
+def test_recording_replays_the_same_commands(arm, tmp_path):
+    path = str(tmp_path / "session.timeline")
+    arm.startRecording(path)
+    arm.driveMotor("elbow", "extend")
+    time.sleep(0.02)
+    arm.ledBrightness = 0.5
+    arm.controlLedBrightness()
+    time.sleep(0.02)
+    arm.stopMotor("elbow")
+    arm.stopRecording()
+
+    records = readRecords(path)
+
+    assert [record[1:4] for record in records] == [(DRIVE, "elbow", "extend"), (LED, "led", ""), (STOP, "elbow", "")]
+    assert records[0][4] == 1.0 and records[1][4] == 0.5
+    assert 15e6 < records[1][0] - records[0][0] and 15e6 < records[2][0] - records[1][0]
+
+    arm.stopLed()
+    report = arm.replayRecording(path)
+
+    assert report["summary"]["events"] == 3
+    assert report["summary"]["max"] < 50
+    assert arm.led.value == 0.5
+    assert arm.motorObjects["elbow"].value == 0.0
+
+def test_replay_keeps_the_recorded_schedule(arm, tmp_path):
+    path = str(tmp_path / "session.timeline")
+    arm.startRecording(path)
+    arm.driveMotor("wrist", "retract")
+    time.sleep(0.1)
+    arm.stopMotor("wrist")
+    arm.stopRecording()
+
+    startTime = time.monotonic()
+    arm.replayRecording(path, speedFactor=2.0)
+
+    assert 0.04 < time.monotonic() - startTime < 0.2
+
+def test_files_that_are_not_timelines_are_rejected(arm, tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("not a timeline")
+
+    with pytest.raises(ValueError):
+        arm.replayRecording(str(path))
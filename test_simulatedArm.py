@@ -0,0 +1,60 @@
+from robotArmControl import RobotArmControl, Pins
+from simulatedArm import ArmSimulator, runScript
+import logging
+import pytest
+
+@pytest.fixture
+def simulated():
+    """An ArmSimulator and a RobotArmControl driving it, with every output enabled"""
+    logger = logging.getLogger("test")
+    simulator = ArmSimulator(logger)
+    arm = RobotArmControl(Pins.allEnabled(), 1.0, 1.0, logger, simulator=simulator)
+    arm.createGPIODevices()
+    yield arm, simulator
+    arm.closeAllGPIO()
+
+def test_joint_follows_its_travel_rate_and_stops_at_its_end_stop(simulated):
+    arm, simulator = simulated
+
+    runScript(arm, simulator, [(0.0, "driveMotor", ("shoulder", "extend")), (2.0, "stopMotor", ("shoulder",)), (3.0, "stopMotor", ("shoulder",))])
+    # 15 degrees a second for 2 seconds, with what the lag loses at the start made up as it slows down
+    assert simulator.jointPositions()["shoulder"] == pytest.approx(30.0, abs=0.05)
+
+    runScript(arm, simulator, [(0.0, "driveMotor", ("claw", "extend")), (5.0, "stopMotor", ("claw",))])
+    assert simulator.jointPositions()["claw"] == 20.0
+    assert simulator.stats()["stalled"]["claw"] > 2.5
+
+def test_blocked_steps_match_single_steps():
+    logger = logging.getLogger("test")
+    blocked, single = ArmSimulator(logger), ArmSimulator(logger)
+    for simulator in (blocked, single):
+        simulator.commands[:] = [1.0, -0.5, 0.25, -1.0, 1.0]
+    blocked.advance(3.0)
+    for _ in range(3000):
+        single.advance(single.stepTime)
+
+    assert blocked.jointPositions() == pytest.approx(single.jointPositions(), abs=1e-9)
+    assert blocked.stats()["stalled"] == pytest.approx(single.stats()["stalled"], abs=1e-9)
+
+def test_timed_moves_and_ramps_run_on_simulated_time(simulated):
+    arm, simulator = simulated
+
+    # The script runs far faster than real time, so stops on the wall clock would land long after the script had ended
+    result = runScript(arm, simulator, [(0.0, "driveMotorFor", ("elbow", "extend", 2.0)), (0.0, "driveMotorRamped", ("rotate", "left", 1.0, "trapezoid")), (5.0, "stopMotor", ("rotate",))])
+
+    assert result["simulated"] == pytest.approx(5.0)
+    assert arm.motorObjects["elbow"].value == 0.0
+    assert simulator.jointPositions()["elbow"] == pytest.approx(30.0, abs=0.05)
+    assert arm.timedStopStats()["max"] < simulator.stepTime * 1000 + 1e-6
+    assert arm.profileStats()["ticks"] == 100
+    # Half a second's travel is lost to the ramp, and a little more to the lag
+    assert simulator.jointPositions()["rotate"] == pytest.approx(20.0 * 4.5, abs=1.5)
+
+def test_soft_limit_stops_at_the_simulated_time_the_limit_is_reached(simulated):
+    arm, simulator = simulated
+    arm.enableJointState({"wrist": 20.0}, {"wrist": (-10.0, 10.0)})
+
+    runScript(arm, simulator, [(0.0, "driveMotor", ("wrist", "extend")), (5.0, "stopMotor", ("wrist",))])
+
+    assert arm.jointPosition("wrist") == pytest.approx(10.0, abs=0.05)
+    assert arm.metrics.counter("robotarm_soft_limit_stops_total", joint="wrist").value == 1
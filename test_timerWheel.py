@@ -0,0 +1,62 @@
+from timerWheel import TimerWheel
+import logging
+import pytest
+import threading
+import time
+
+@pytest.fixture
+def wheel():
+    wheel = TimerWheel(logging.getLogger("test"))
+    yield wheel
+    wheel.stop()
+
+def test_timers_fire_in_deadline_order(wheel):
+    fired = []
+    done = threading.Event()
+    # The last deadline is past the first wheel, so its timer is moved down a level before it fires
+    for delay in (0.3, 0.01, 0.05, 0.02):
+        wheel.scheduleAfter(delay, lambda delay=delay: fired.append(delay))
+    wheel.scheduleAfter(0.31, done.set)
+
+    assert done.wait(5)
+    assert fired == [0.01, 0.02, 0.05, 0.3]
+
+def test_cancelled_timers_do_not_fire(wheel):
+    fired = []
+    timer = wheel.scheduleAfter(0.02, lambda: fired.append("cancelled"))
+    wheel.scheduleAfter(0.01, lambda: fired.append("kept"))
+
+    timer.cancel()
+    time.sleep(0.1)
+
+    assert fired == ["kept"]
+
+def test_timed_move_stops_on_time(arm):
+    arm.driveMotorFor("elbow", "extend", 0.05)
+
+    assert arm.motorObjects["elbow"].value == 1.0
+    time.sleep(0.2)
+    assert arm.motorObjects["elbow"].value == 0.0
+    assert arm.timedStopStats()["max"] < 50
+
+def test_later_commands_cancel_a_timed_stop(arm):
+    arm.driveMotorFor("elbow", "extend", 0.05)
+    arm.driveMotorFor("wrist", "extend", 0.05)
+    arm.driveMotorFor("claw", "extend", 0.05)
+    arm.driveMotor("elbow", "retract")
+    arm.driveMotors({"wrist": ("retract", 0.5)})
+    arm.driveMotorRamped("claw", "retract", 0.01)
+    time.sleep(0.2)
+
+    assert arm.motorObjects["elbow"].value == -1.0
+    assert arm.motorObjects["wrist"].value == -0.5
+    assert arm.motorObjects["claw"].value == pytest.approx(-1.0)
+
+def test_closing_stops_the_timer_wheel(arm):
+    arm.driveMotorFor("elbow", "extend", 10)
+    wheel = arm.stopTimers.wheel
+
+    arm.closeAllGPIO()
+
+    assert arm.stopTimers.wheel == None
+    assert not wheel.thread.is_alive()
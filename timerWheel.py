@@ -0,0 +1,233 @@
+from collections import deque
+import threading
+import time
+
+class Timer():
+    """Class used as a handle for a scheduled callback"""
+    __slots__ = ("deadline", "tick", "callback", "cancelled", "wheel")
+
+    def __init__(self, deadline, tick, callback, wheel):
+        self.deadline = deadline
+        self.tick = tick
+        self.callback = callback
+        self.cancelled = False
+        # Wheel the timer is pending on, cleared once it has fired or been cancelled
+        self.wheel = wheel
+
+    def cancel(self):
+        """Stop the callback from running. Cancelled timers are dropped when their slot is reached"""
+        wheel = self.wheel
+        if wheel != None:
+            wheel.cancel(self)
+
+class TimerWheel():
+    """Class used to run many timed callbacks from a single thread, using a hierarchical timer wheel
+
+    The first wheel has one slot per tick. Each further wheel has slots as wide as the whole of the wheel below it, and
+    its timers are moved down a level when their slot comes round. Scheduling and cancelling are constant time, however
+    many timers are pending. Callbacks run on the wheel thread and should hand any slow work elsewhere.
+
+    A clock, such as a simulator's, can be passed in place of time.monotonic(). No thread is started then, and timers
+    fire as whatever owns the clock calls advanceTo(), which it can time with nextDeadline()."""
+    def __init__(self, logger, tickTime=0.001, wheelSizes=(256, 64, 64, 64), clock=None):
+        self.logger = logger
+        self.tickTime = tickTime
+        self.wheelSizes = wheelSizes
+        self.wheels = [[[] for _ in range(size)] for size in wheelSizes]
+
+        # Ticks covered by a single slot of each wheel, and by the whole of each wheel
+        self.slotSpans = []
+        span = 1
+        for size in wheelSizes:
+            self.slotSpans.append(span)
+            span *= size
+        self.maxSpan = span - 1
+
+        # When the wheel started, the tick it has reached and the number of timers that have neither fired nor been
+        # cancelled. Cancelled timers stay in their slots until they are reached
+        self.clock = time.monotonic if clock == None else clock
+        self.startTime = self.clock()
+        self.currentTick = 0
+        self.pending = 0
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = None
+        if clock == None:
+            self.thread = threading.Thread(target=self.run, name="TimerWheel", daemon=True)
+            self.thread.start()
+
+    def schedule(self, deadline, callback):
+        """Run callback() at a deadline on the wheel's clock, returning a Timer that can be cancelled"""
+        with self.condition:
+            if self.pending == 0:
+                # Nothing has been pending, so the wheel may be idle. Drop any cancelled timers and move it on to the
+                # present before placing the timer
+                self.wheels = [[[] for _ in range(size)] for size in self.wheelSizes]
+                self.currentTick = max(self.currentTick, self.tickAt(self.clock()))
+            tick = max(self.currentTick + 1, int((deadline - self.startTime) / self.tickTime + 0.999999))
+            timer = Timer(deadline, tick, callback, self)
+            self.insert(timer)
+            self.pending += 1
+            self.condition.notify()
+        return timer
+
+    def cancel(self, timer):
+        """Cancel a pending timer. Used by Timer.cancel()"""
+        with self.condition:
+            if timer.wheel is self:
+                timer.wheel = None
+                timer.cancelled = True
+                self.pending -= 1
+
+    def scheduleAfter(self, delay, callback):
+        """Run callback() after a delay in seconds"""
+        return self.schedule(self.clock() + delay, callback)
+
+    def tickAt(self, now):
+        """Return the tick a time on the wheel's clock falls in. A time on a tick boundary, even after rounding, is in it"""
+        return int((now - self.startTime) / self.tickTime + 1e-9)
+
+    def insert(self, timer):
+        """Place a timer in the slot of the lowest wheel that can hold it"""
+        delta = min(timer.tick - self.currentTick, self.maxSpan)
+        for level, size in enumerate(self.wheelSizes):
+            if delta < self.slotSpans[level] * size:
+                slot = ((self.currentTick + delta) // self.slotSpans[level]) % size
+                self.wheels[level][slot].append(timer)
+                return
+
+    def nextTick(self):
+        """Return the tick of the earliest pending timer. This scans every slot, so it is only used when the thread wakes"""
+        return min((timer.tick for wheel in self.wheels for slot in wheel for timer in slot if not timer.cancelled), default=self.currentTick + 1)
+
+    def run(self):
+        """Wheel loop, which sleeps until the earliest pending timer is due, then advances through the ticks up to it"""
+        while self.running:
+            with self.condition:
+                while self.running and self.pending == 0:
+                    self.condition.wait()
+                if not self.running:
+                    break
+                # A timer scheduled sooner wakes the wait early, and the next deadline is worked out again
+                delay = self.startTime + self.nextTick() * self.tickTime - self.clock()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+            self.advanceTo(self.clock())
+
+    def nextDeadline(self):
+        """Return the time on the wheel's clock that the earliest pending timer is due, or None if none are pending"""
+        with self.condition:
+            if self.pending == 0:
+                return None
+            return self.startTime + self.nextTick() * self.tickTime
+
+    def advanceTo(self, now):
+        """Catch up on every tick up to a time on the wheel's clock, firing timers in order. The wheel thread calls this,
+        or the owner of the clock when one was passed in"""
+        nowTick = self.tickAt(now)
+        while self.currentTick < nowTick and self.pending > 0:
+            for timer in self.advance():
+                try:
+                    timer.callback()
+                except Exception:
+                    self.logger.exception("Timer callback failed")
+
+    def advance(self):
+        """Move on by one tick, cascading timers down from the higher wheels, and return the timers that are due"""
+        with self.condition:
+            self.currentTick += 1
+            # Cascade from the highest wheel whose slot boundary has been reached downwards, so timers moved down from one
+            # wheel are picked up by the cascade of the wheel below it on the same tick
+            levels = 1
+            while levels < len(self.wheelSizes) and self.currentTick % self.slotSpans[levels] == 0:
+                levels += 1
+            for level in range(levels - 1, 0, -1):
+                slot = (self.currentTick // self.slotSpans[level]) % self.wheelSizes[level]
+                timers = self.wheels[level][slot]
+                self.wheels[level][slot] = []
+                for timer in timers:
+                    if not timer.cancelled:
+                        self.insert(timer)
+            slot = self.currentTick % self.wheelSizes[0]
+            timers = self.wheels[0][slot]
+            self.wheels[0][slot] = []
+            due = []
+            for timer in timers:
+                if timer.cancelled:
+                    continue
+                elif timer.tick <= self.currentTick:
+                    timer.wheel = None
+                    self.pending -= 1
+                    due.append(timer)
+                else:
+                    self.insert(timer)
+            return due
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread != None:
+            self.thread.join()
+
+class StopTimers():
+    """Class used to keep one pending stop per key, such as a motor's timed stop, on a TimerWheel shared by every key
+
+    Scheduling a stop for a key replaces the one it had. Each stop's callback is handed a token, and runs on the wheel
+    thread, so it should hand the stop on to be run in order with other commands, where claim() tells whether it is
+    still the key's pending stop, as a newer command may have replaced it meanwhile. The wheel is created on first use.
+    Against a simulator it runs on the simulator's clock, attached to it, so stops land at the right simulated times.
+    Callers serialize scheduling, cancelling and claiming, as RobotArmControl does with its output lock."""
+    def __init__(self, logger, simulator=None, latencySamples=1000):
+        self.logger = logger
+        self.simulator = simulator
+        self.wheel = None
+
+        # The token and Timer of the pending stop for each key, and how late recent stops landed, in seconds
+        self.timers = {}
+        self.lateness = deque(maxlen=latencySamples)
+
+    def startWheel(self):
+        """Return the timer wheel, creating it on first use"""
+        if self.wheel == None:
+            if self.simulator != None:
+                self.wheel = TimerWheel(self.logger, clock=self.simulator.clock)
+                self.simulator.attach(self.wheel)
+            else:
+                self.wheel = TimerWheel(self.logger)
+        return self.wheel
+
+    def schedule(self, key, deadline, callback):
+        """Run callback(token) at a deadline on the wheel's clock, replacing the key's pending stop"""
+        self.cancel(key)
+        token = object()
+        self.timers[key] = (token, self.startWheel().schedule(deadline, lambda: callback(token)))
+
+    def scheduleAfter(self, key, delay, callback):
+        """Run callback(token) after a delay in seconds, replacing the key's pending stop"""
+        self.schedule(key, self.startWheel().clock() + delay, callback)
+
+    def cancel(self, key):
+        """Cancel the pending stop for a key, if it has one"""
+        pending = self.timers.pop(key, None)
+        if pending != None:
+            pending[1].cancel()
+
+    def claim(self, key, token):
+        """Return True if token is the key's pending stop, which is then no longer pending, recording how late it landed"""
+        pending = self.timers.get(key)
+        if pending == None or pending[0] is not token:
+            return False
+        del self.timers[key]
+        self.lateness.append(self.wheel.clock() - pending[1].deadline)
+        return True
+
+    def stop(self):
+        """Cancel every pending stop and stop the wheel's thread. A new wheel is created by the next stop scheduled"""
+        self.timers.clear()
+        if self.wheel != None:
+            self.wheel.stop()
+            if self.simulator != None:
+                self.simulator.detach(self.wheel)
+            self.wheel = None
@@ -0,0 +1,200 @@
+from collections import deque
+import itertools
+import json
+import os
+import threading
+import time
+
+class Span():
+    """Context manager used to time a block of code as one span, optionally starting a new trace for it
+
+    start can be given to begin the span earlier than the block, such as when the input event that led to it arrived."""
+    __slots__ = ("tracer", "name", "category", "start", "newTrace", "previousTrace")
+
+    def __init__(self, tracer, name, category, start=None, newTrace=False):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.start = start
+        self.newTrace = newTrace
+        self.previousTrace = 0
+
+    def __enter__(self):
+        if self.newTrace:
+            self.previousTrace = self.tracer.currentTrace()
+            self.tracer.setTrace(self.tracer.newTrace())
+        if self.start == None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.category, self.start, time.perf_counter())
+        if self.newTrace:
+            self.tracer.setTrace(self.previousTrace)
+
+class Tracer():
+    """Class used to record timed spans into a fixed size in-memory buffer, for export as a Chrome trace
+
+    Each span belongs to a trace, which follows one command from the input event that caused it, through the queue and
+    RobotArmControl, down to the GPIO and pigpio writes it made. The current trace is held per thread and carried across
+    the executor by the wrapper from traced(). Spans are tuples appended to a deque, so recording one takes about a
+    microsecond and the oldest are dropped once the buffer is full. Times are time.perf_counter() seconds."""
+    def __init__(self, capacity=100000):
+        self.spans = deque(maxlen=capacity)
+        self.local = threading.local()
+        self.traceIds = itertools.count(1)
+        self.origin = time.perf_counter()
+
+        # Name of every thread that has recorded a span, noted on its first span as threads may be gone by export
+        self.threadNames = {}
+
+        # The function that removes the pigpio instrumentation added by instrument()
+        self.restorePigpio = None
+
+    def instrument(self):
+        """Record every pigpio socket command as a span as well, until close() is called, and return the tracer"""
+        if self.restorePigpio == None:
+            self.restorePigpio = instrumentPigpio(self)
+        return self
+
+    def close(self):
+        """Remove the pigpio instrumentation. The spans already recorded can still be exported"""
+        if self.restorePigpio != None:
+            self.restorePigpio()
+            self.restorePigpio = None
+
+    def newTrace(self):
+        return next(self.traceIds)
+
+    def currentTrace(self):
+        """Return the trace the calling thread is working on, or 0 if it is not in one"""
+        return getattr(self.local, "trace", 0)
+
+    def setTrace(self, traceId):
+        self.local.trace = traceId
+
+    def record(self, name, category, start, end, args=None):
+        """Record a span on the calling thread, in its current trace"""
+        threadId = threading.get_ident()
+        if threadId not in self.threadNames:
+            self.threadNames[threadId] = threading.current_thread().name
+        self.spans.append((name, category, start, end, threadId, getattr(self.local, "trace", 0), args))
+
+    def span(self, name, category, start=None, newTrace=False):
+        return Span(self, name, category, start, newTrace)
+
+    def traced(self, function, name):
+        """Wrap a command so that, wherever it runs, it is recorded in the caller's trace along with the time it was queued
+
+        A caller that is not in a trace starts a new one."""
+        traceId = self.currentTrace() or self.newTrace()
+        queuedTime = time.perf_counter()
+
+        def tracedCommand(*args, **kwargs):
+            previousTrace = self.currentTrace()
+            self.setTrace(traceId)
+            start = time.perf_counter()
+            self.record("queue", "queue", queuedTime, start)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, "command", start, time.perf_counter())
+                self.setTrace(previousTrace)
+        tracedCommand.__name__ = name
+        return tracedCommand
+
+    def clear(self):
+        self.spans.clear()
+
+    def chromeTrace(self):
+        """Return the spans as Chrome trace event JSON, which chrome://tracing and ui.perfetto.dev can open
+
+        Each span is a complete event on its thread, and the spans of a trace on different threads are joined by flow
+        arrows, so a button press can be followed to the writes it caused."""
+        pid = os.getpid()
+        events = []
+        spans = sorted(self.spans, key=lambda span: span[2])
+        firstSpans = {}
+        for name, category, start, end, threadId, traceId, args in spans:
+            timestamp = (start - self.origin) * 1e6
+            eventArgs = {"trace": traceId}
+            if args:
+                eventArgs.update(args)
+            events.append({"name": name, "cat": category, "ph": "X", "ts": timestamp, "dur": (end - start) * 1e6, "pid": pid, "tid": threadId, "args": eventArgs})
+            if traceId == 0:
+                continue
+            first = firstSpans.setdefault(traceId, (threadId, timestamp))
+            if first[1] == timestamp and first[0] == threadId:
+                events.append({"name": "command", "cat": "flow", "ph": "s", "id": traceId, "ts": timestamp, "pid": pid, "tid": threadId})
+            elif threadId != first[0]:
+                events.append({"name": "command", "cat": "flow", "ph": "f", "bp": "e", "id": traceId, "ts": timestamp, "pid": pid, "tid": threadId})
+        for threadId in {span[4] for span in spans}:
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": threadId, "args": {"name": self.threadNames.get(threadId, f"Thread {threadId}")}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def exportChromeTrace(self, path):
+        """Write the spans to a Chrome trace JSON file"""
+        with open(path, "w") as file:
+            json.dump(self.chromeTrace(), file)
+
+    def slowestCommands(self, count=10):
+        """Return the count slowest traces, with how their end-to-end time splits between the layers
+
+        Time is attributed by sweeping along each trace and charging every moment to the innermost span active then,
+        which is the one that started last. Time covered by no span is charged to "untraced". Times are in milliseconds."""
+        traces = {}
+        for span in self.spans:
+            if span[5] != 0:
+                traces.setdefault(span[5], []).append(span)
+        summaries = []
+        for traceId, spans in traces.items():
+            start = min(span[2] for span in spans)
+            end = max(span[3] for span in spans)
+            boundaries = sorted({moment for span in spans for moment in (span[2], span[3])})
+            breakdown = {}
+            for intervalStart, intervalEnd in zip(boundaries, boundaries[1:]):
+                active = [span for span in spans if span[2] <= intervalStart and span[3] >= intervalEnd]
+                category = max(active, key=lambda span: (span[2], -span[3]))[1] if active else "untraced"
+                breakdown[category] = breakdown.get(category, 0.0) + (intervalEnd - intervalStart) * 1000
+            first = min(spans, key=lambda span: span[2])
+            summaries.append({"trace": traceId, "name": first[0], "total": (end - start) * 1000, "breakdown": breakdown})
+        summaries.sort(key=lambda summary: summary["total"], reverse=True)
+        return summaries[:count]
+
+    def summaryText(self, count=10):
+        """Return slowestCommands() as a table, one trace per line"""
+        lines = [f"Slowest {count} commands (ms): total, then time in each layer"]
+        for summary in self.slowestCommands(count):
+            layers = "  ".join(f"{category} {milliseconds:.3f}" for category, milliseconds in sorted(summary["breakdown"].items(), key=lambda item: -item[1]))
+            lines.append(f"{summary['trace']:>6} {summary['name']:<24} {summary['total']:8.3f}  {layers}")
+        return "\n".join(lines)
+
+def instrumentPigpio(tracer):
+    """Record every pigpio socket command as a span, by wrapping pigpio's module level command functions
+
+    Returns a function that removes the wrappers, or None if pigpio is not installed."""
+    try:
+        import pigpio
+    except ImportError:
+        return None
+    command, commandExt = pigpio._pigpio_command, pigpio._pigpio_command_ext
+
+    def tracedCommand(sl, cmd, p1, p2):
+        start = time.perf_counter()
+        try:
+            return command(sl, cmd, p1, p2)
+        finally:
+            tracer.record("pigpio", "pigpio", start, time.perf_counter(), {"cmd": cmd})
+
+    def tracedCommandExt(sl, cmd, p1, p2, p3, extents):
+        start = time.perf_counter()
+        try:
+            return commandExt(sl, cmd, p1, p2, p3, extents)
+        finally:
+            tracer.record("pigpio", "pigpio", start, time.perf_counter(), {"cmd": cmd})
+
+    pigpio._pigpio_command, pigpio._pigpio_command_ext = tracedCommand, tracedCommandExt
+
+    def restore():
+        pigpio._pigpio_command, pigpio._pigpio_command_ext = command, commandExt
+    return restore